@@ -0,0 +1,166 @@
+from pathlib import Path
+import threading
+import hashlib
+import json
+import time
+import re
+
+from MemoryStorage import atomic_write_text
+
+CACHE_VERSION = 1
+
+
+def normalize_question(question: str) -> str:
+    """Регистр, ё/е, пробелы и кавычки-обрамления не меняют смысл вопроса"""
+    text = question.casefold().replace("ё", "е")
+    text = re.sub(r"[`«»\"']", "", text)
+    return re.sub(r"\s+", " ", text).strip(" ?.!")
+
+
+def data_version(
+    db_path: str | Path = "./memory/memories/analytics_db.json",
+    state_path: str | Path = "./memory/analytics_state.json",
+) -> str:
+    """sha256 содержимого analytics_db.json и манифеста транскриптов (file -> sha256) из состояния analytics_builder"""
+    digest = hashlib.sha256()
+    db_path, state_path = Path(db_path), Path(state_path)
+    digest.update(db_path.read_bytes() if db_path.exists() else b"")
+    digest.update(b"\0")
+    if state_path.exists():
+        manifest = json.loads(state_path.read_text(encoding="utf-8")).get("manifest", {})
+        # Только хэши файлов: touch без изменения содержимого не меняет версию
+        digest.update(json.dumps({file: entry["sha256"] for file, entry in sorted(manifest.items())}).encode())
+    return digest.hexdigest()
+
+
+def prompt_version(*parts: str) -> str:
+    """Версия промпта - хэш системного промпта, модели и прочих частей запроса, влияющих на ответ"""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class AnswerCache:
+    """
+    Персистентный кэш готовых ответов на вопросы.
+
+    Ключ - нормализованный вопрос, версия промпта и версия данных (data_version), поэтому
+    любое изменение транскриптов, analytics_db.json или промпта даёт промах без явной инвалидации.
+    Записи старше ttl удаляются при загрузке и чтении, при превышении max_entries/max_bytes
+    вытесняются давно не использованные. Файл пишется атомарно после каждого put();
+    статистика обращений get() (last_used, hits) копится в памяти и пишется при put() или save().
+    """
+
+    def __init__(
+        self,
+        path: str | Path = "./memory/answer_cache.json",
+        ttl: float | None = 7 * 24 * 3600,
+        max_entries: int = 500,
+        max_bytes: int = 32 * 1024 * 1024,
+    ):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        # Есть изменения, которых нет в файле (обращения get() и удалённые по ttl записи)
+        self._dirty = False
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+                if data.get("version") == CACHE_VERSION:
+                    self._entries = data["entries"]
+            except (json.JSONDecodeError, KeyError):
+                print(f"[WARN] AnswerCache: {self.path} is corrupted, starting empty")
+        with self._lock:
+            self._expire(time.time())
+
+    @staticmethod
+    def key(question: str, prompt: str, data: str) -> str:
+        return hashlib.sha256(f"{normalize_question(question)}\0{prompt}\0{data}".encode("utf-8")).hexdigest()
+
+    def _expire(self, now: float):
+        if self.ttl is None:
+            return
+        for key in [k for k, entry in self._entries.items() if now - entry["created"] > self.ttl]:
+            del self._entries[key]
+            self.expired += 1
+            self._dirty = True
+
+    def _evict(self):
+        size = sum(entry["nbytes"] for entry in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k]["last_used"]):
+            if len(self._entries) <= self.max_entries and size <= self.max_bytes:
+                break
+            size -= self._entries.pop(key)["nbytes"]
+            self.evictions += 1
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(self.path, json.dumps({"version": CACHE_VERSION, "entries": self._entries}, ensure_ascii=False))
+        self._dirty = False
+
+    def save(self):
+        """Записывает накопленную статистику обращений; вызывается обработчиками в конце прогона"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def get(self, question: str, prompt: str, data: str) -> dict | None:
+        """Запись {"question", "answer", "files", "elapsed", "created", ...} или None"""
+        key = self.key(question, prompt, data)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += entry["elapsed"]
+            entry["last_used"] = now
+            entry["hits"] += 1
+            # last_used сохраняется при put()/save(), чтобы вытеснение учитывало и прошлые запуски
+            self._dirty = True
+            return dict(entry)
+
+    def put(self, question: str, prompt: str, data: str, answer: str, files: dict[str, str], elapsed: float):
+        """
+        Сохраняет ответ: answer - текст модели, files - созданные файлы (например, demo2pilots_analysis_Q*.txt)
+        {имя: содержимое}, elapsed - сколько занял исходный запрос.
+        """
+        now = time.time()
+        entry = {
+            "question": question,
+            "answer": answer,
+            "files": files,
+            "elapsed": elapsed,
+            "created": now,
+            "last_used": now,
+            "hits": 0,
+            "nbytes": len(answer.encode("utf-8")) + sum(len(text.encode("utf-8")) for text in files.values()),
+        }
+        with self._lock:
+            self._entries[self.key(question, prompt, data)] = entry
+            self._evict()
+            self._save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "cached_bytes": sum(entry["nbytes"] for entry in self._entries.values()),
+                "saved_seconds": self.saved_seconds,
+            }
@@ -0,0 +1,319 @@
+"""
+Запись и воспроизведение ответов Anthropic API на уровне httpx-транспорта.
+
+В режиме record каждый ответ (JSON или поток SSE с таймингом каждого куска) дописывается в
+JSONL-кассету вместе с ключом запроса. В режиме replay сеть не используется: ответ находится
+по ключу и отдаётся с исходными задержками, умноженными на latency_scale (0 - без задержек).
+Инструменты по-прежнему выполняет tool_runner, поэтому правки MemoryTool в /memories происходят
+и при воспроизведении - профили, helper_file и обработчики вопросов работают офлайн.
+
+Ключ - sha256 метода, пути и тела запроса. Если тело отличается только результатами
+инструментов (например, изменился файл в /memories), ответ ищется по запасному ключу без содержимого
+tool_result. Одинаковые запросы получают записанные ответы по очереди, последний повторяется.
+
+    CLAUDE_CASSETTE=reports/cassettes/questions.jsonl CLAUDE_CASSETTE_MODE=record python query_handler_multithreaded.py
+    CLAUDE_CASSETTE=reports/cassettes/questions.jsonl CLAUDE_CASSETTE_MODE=replay CLAUDE_CASSETTE_LATENCY=0 python query_handler_multithreaded.py
+"""
+from pathlib import Path
+import threading
+import hashlib
+import asyncio
+import codecs
+import json
+import time
+import os
+
+import httpx
+
+from RateLimiter import RETRY_STATUSES
+from token_budget import TokenLog
+
+MODES = ("record", "replay")
+
+# Заголовки, которые описывают передачу исходного ответа и не сохраняются
+SKIPPED_HEADERS = {"content-length", "content-encoding", "transfer-encoding", "connection"}
+
+
+def _canonical(request: httpx.Request, strip_tool_results: bool) -> str:
+    body = request.content
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        return body.decode("utf-8", "replace")
+    if strip_tool_results and isinstance(data, dict):
+        for message in data.get("messages", []):
+            content = message.get("content")
+            if isinstance(content, list):
+                message["content"] = [
+                    {"type": "tool_result", "tool_use_id": block.get("tool_use_id")}
+                    if isinstance(block, dict) and block.get("type") == "tool_result" else block
+                    for block in content
+                ]
+    return json.dumps(data, ensure_ascii=False, sort_keys=True)
+
+
+def request_keys(request: httpx.Request) -> tuple[str, str]:
+    """(точный ключ, запасной ключ без содержимого tool_result)"""
+    prefix = f"{request.method} {request.url.raw_path.decode('ascii', 'replace')}\n"
+    return tuple(
+        hashlib.sha256((prefix + _canonical(request, strip)).encode("utf-8")).hexdigest()
+        for strip in (False, True)
+    )
+
+
+class Cassette:
+    """Кассета одного прогона: записи {key, loose_key, method, path, status, headers, latency, chunks}"""
+
+    def __init__(self, path: str | Path, mode: str = "replay", latency_scale: float = 1.0):
+        if mode not in MODES:
+            raise ValueError(f"Cassette mode must be one of {MODES}, got {mode!r}")
+        self.path = Path(path)
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.replayed = 0
+        self.loose_hits = 0
+        self.misses = 0
+
+        self._entries: dict[str, list[dict]] = {}
+        self._loose: dict[str, list[dict]] = {}
+        self._served: dict[int, int] = {}
+        if mode == "record":
+            # Запись начинает кассету заново: очередь одинаковых запросов не смешивается со старым прогоном
+            self.path.unlink(missing_ok=True)
+            self.log = TokenLog(str(self.path))
+        else:
+            if not self.path.exists():
+                raise FileNotFoundError(f"Cassette not found: {self.path}")
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], []).append(entry)
+                        self._loose.setdefault(entry["loose_key"], []).append(entry)
+
+    @classmethod
+    def from_env(cls) -> "Cassette | None":
+        """CLAUDE_CASSETTE (путь), CLAUDE_CASSETTE_MODE (record/replay), CLAUDE_CASSETTE_LATENCY (множитель)"""
+        path = os.getenv("CLAUDE_CASSETTE")
+        if not path:
+            return None
+        return cls(path, os.getenv("CLAUDE_CASSETTE_MODE", "replay"), float(os.getenv("CLAUDE_CASSETTE_LATENCY", 1.0)))
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def save(self, request: httpx.Request, response: httpx.Response, latency: float, chunks: list[tuple[float, str]]):
+        key, loose_key = request_keys(request)
+        self.log.write(
+            key=key,
+            loose_key=loose_key,
+            method=request.method,
+            path=request.url.path,
+            status=response.status_code,
+            headers=[(k, v) for k, v in response.headers.multi_items() if k.lower() not in SKIPPED_HEADERS],
+            latency=round(latency, 4),
+            chunks=[(round(offset, 4), text) for offset, text in chunks],
+        )
+        with self._lock:
+            self.recorded += 1
+
+    def find(self, request: httpx.Request) -> dict | None:
+        """Следующий записанный ответ на запрос или None"""
+        key, loose_key = request_keys(request)
+        with self._lock:
+            entries = self._entries.get(key)
+            if entries is None:
+                entries = self._loose.get(loose_key)
+                if entries is not None:
+                    self.loose_hits += 1
+            if entries is None:
+                self.misses += 1
+                return None
+            served = self._served.get(id(entries), 0)
+            self._served[id(entries)] = served + 1
+            self.replayed += 1
+            return entries[min(served, len(entries) - 1)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "loose_hits": self.loose_hits,
+                "misses": self.misses,
+            }
+
+
+def _miss_response(request: httpx.Request) -> httpx.Response:
+    """Ответ в формате ошибки API: SDK поднимет NotFoundError с понятным сообщением"""
+    return httpx.Response(404, request=request, json={
+        "type": "error",
+        "error": {"type": "not_found_error", "message": f"Cassette has no recorded response for {request.method} {request.url.path}"},
+    })
+
+
+def _offsets(entry: dict, scale: float) -> list[tuple[float, bytes]]:
+    """Паузы перед кусками ответа относительно заголовков, с учётом множителя задержки"""
+    previous, result = entry["latency"], []
+    for offset, text in entry["chunks"]:
+        result.append((max(0.0, offset - previous) * scale, text.encode("utf-8")))
+        previous = max(previous, offset)
+    return result
+
+
+class _ReplayStream(httpx.SyncByteStream):
+    def __init__(self, chunks: list[tuple[float, bytes]]):
+        self.chunks = chunks
+
+    def __iter__(self):
+        for delay, chunk in self.chunks:
+            if delay > 0:
+                time.sleep(delay)
+            yield chunk
+
+
+class _AsyncReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: list[tuple[float, bytes]]):
+        self.chunks = chunks
+
+    async def __aiter__(self):
+        for delay, chunk in self.chunks:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield chunk
+
+
+class _Recorder:
+    """Куски ответа с временем от отправки запроса; кассета пишется, когда ответ дочитан до конца"""
+
+    def __init__(self, cassette: Cassette, request: httpx.Request, response: httpx.Response, start: float):
+        self.cassette = cassette
+        self.request = request
+        self.response = response
+        self.start = start
+        self.latency = time.perf_counter() - start
+        self.chunks: list[tuple[float, str]] = []
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+    def add(self, chunk: bytes):
+        # Многобайтовый символ на границе кусков доклеивается к следующему куску
+        text = self.decoder.decode(chunk)
+        if text:
+            self.chunks.append((time.perf_counter() - self.start, text))
+
+    def finish(self):
+        tail = self.decoder.decode(b"", final=True)
+        if tail:
+            self.chunks.append((time.perf_counter() - self.start, tail))
+        self.cassette.save(self.request, self.response, self.latency, self.chunks)
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, stream, recorder: _Recorder):
+        self.stream = stream
+        self.recorder = recorder
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self.recorder.add(chunk)
+            yield chunk
+        self.recorder.finish()
+
+    def close(self):
+        self.stream.close()
+
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, recorder: _Recorder):
+        self.stream = stream
+        self.recorder = recorder
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.recorder.add(chunk)
+            yield chunk
+        self.recorder.finish()
+
+    async def aclose(self):
+        await self.stream.aclose()
+
+
+def _prepare(request: httpx.Request):
+    # Тело ответа записывается как текст, поэтому сжатие отключается
+    request.headers["accept-encoding"] = "identity"
+
+
+def _recorded(cassette: Cassette, request: httpx.Request, response: httpx.Response, start: float, stream_cls) -> httpx.Response:
+    """Ответ, который пишется в кассету по мере чтения; 429/5xx не пишутся - их повторяет RateLimiter"""
+    if response.status_code in RETRY_STATUSES:
+        return response
+    return httpx.Response(
+        response.status_code,
+        headers=response.headers,
+        stream=stream_cls(response.stream, _Recorder(cassette, request, response, start)),
+        extensions=response.extensions,
+        request=request,
+    )
+
+
+def _replayed(entry: dict, request: httpx.Request, stream: httpx.SyncByteStream | httpx.AsyncByteStream) -> httpx.Response:
+    return httpx.Response(entry["status"], headers=entry["headers"], stream=stream, request=request)
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """
+    record - запросы уходят в transport, ответы пишутся в кассету;
+    replay - ответы только из кассеты, transport не нужен
+    """
+
+    def __init__(self, cassette: Cassette, transport: httpx.BaseTransport | None = None):
+        self.cassette = cassette
+        self.transport = transport or (None if cassette.replaying else httpx.HTTPTransport())
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        if self.cassette.replaying:
+            entry = self.cassette.find(request)
+            if entry is None:
+                return _miss_response(request)
+            time.sleep(entry["latency"] * self.cassette.latency_scale)
+            return _replayed(entry, request, _ReplayStream(_offsets(entry, self.cassette.latency_scale)))
+
+        _prepare(request)
+        start = time.perf_counter()
+        response = self.transport.handle_request(request)
+        return _recorded(self.cassette, request, response, start, _RecordingStream)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    """То же для AsyncAnthropic"""
+
+    def __init__(self, cassette: Cassette, transport: httpx.AsyncBaseTransport | None = None):
+        self.cassette = cassette
+        self.transport = transport or (None if cassette.replaying else httpx.AsyncHTTPTransport())
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        if self.cassette.replaying:
+            entry = self.cassette.find(request)
+            if entry is None:
+                return _miss_response(request)
+            await asyncio.sleep(entry["latency"] * self.cassette.latency_scale)
+            return _replayed(entry, request, _AsyncReplayStream(_offsets(entry, self.cassette.latency_scale)))
+
+        _prepare(request)
+        start = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        return _recorded(self.cassette, request, response, start, _AsyncRecordingStream)
+
+    async def aclose(self):
+        if self.transport is not None:
+            await self.transport.aclose()
@@ -1,10 +1,63 @@
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 from dotenv import load_dotenv
+import httpx
 import os
 
+from RateLimiter import RateLimiter, RateLimitedTransport, AsyncRateLimitedTransport
+from Cassette import Cassette, CassetteTransport, AsyncCassetteTransport
+
 load_dotenv()
 
+# Один планировщик на процесс: все клиенты и потоки делят лимиты аккаунта
+LIMITER = RateLimiter(
+    requests_per_minute=float(os.getenv("CLAUDE_RPM", 50)),
+    input_tokens_per_minute=float(os.getenv("CLAUDE_ITPM", 30_000)),
+    output_tokens_per_minute=float(os.getenv("CLAUDE_OTPM", 8_000)),
+    max_concurrency=int(os.getenv("CLAUDE_MAX_CONCURRENCY", 10)),
+)
+
+# Запись/воспроизведение ответов API (см. Cassette.py); None - обычная работа с сетью
+CASSETTE = Cassette.from_env()
+
+
+def _transport(limiter: RateLimiter, cassette: Cassette | None):
+    if cassette is None:
+        return RateLimitedTransport(limiter)
+    # Воспроизведение идёт без сети и без лимитов; запись - под RateLimiter, чтобы не писать 429 и повторы
+    if cassette.replaying:
+        return CassetteTransport(cassette)
+    return RateLimitedTransport(limiter, CassetteTransport(cassette))
+
+
+def _async_transport(limiter: RateLimiter, cassette: Cassette | None):
+    if cassette is None:
+        return AsyncRateLimitedTransport(limiter)
+    if cassette.replaying:
+        return AsyncCassetteTransport(cassette)
+    return AsyncRateLimitedTransport(limiter, AsyncCassetteTransport(cassette))
+
+
 class Client:
-    def __init__(self):
+    def __init__(self, limiter: RateLimiter = LIMITER, cassette: Cassette | None = CASSETTE):
+        self.api = os.getenv("CLAUDE_API")
+        self.limiter = limiter
+        self.cassette = cassette
+        # Повторы и паузы делает RateLimitedTransport, встроенные повторы SDK отключены
+        self.client = Anthropic(
+            # Для воспроизведения ключ API не нужен
+            api_key=self.api or ("cassette-replay" if cassette is not None and cassette.replaying else None),
+            max_retries=0,
+            http_client=httpx.Client(transport=_transport(limiter, cassette), timeout=600),
+        )
+
+class AsyncClient:
+    """То же, что Client, для asyncio-обработчиков"""
+    def __init__(self, limiter: RateLimiter = LIMITER, cassette: Cassette | None = CASSETTE):
         self.api = os.getenv("CLAUDE_API")
-        self.client = Anthropic(api_key=self.api)
\ No newline at end of file
+        self.limiter = limiter
+        self.cassette = cassette
+        self.client = AsyncAnthropic(
+            api_key=self.api or ("cassette-replay" if cassette is not None and cassette.replaying else None),
+            max_retries=0,
+            http_client=httpx.AsyncClient(transport=_async_transport(limiter, cassette), timeout=600),
+        )
@@ -0,0 +1,208 @@
+from anthropic import beta_tool
+from itertools import combinations
+from pathlib import Path
+import json
+
+import numpy as np
+
+from MemoryStorage import atomic_write_text
+from meeting_records import SCORE_CRITERIA
+
+# Дополняет системный промпт, когда в tools передан cube.cube_tool()
+CUBE_TOOL_PROMPT = """
+
+### conversion_breakdown(dimensions, filters, criteria)
+Готовые срезы конверсии по 1-3 измерениям из всех встреч: встреч, успешных, конверсия и средние оценки критериев.
+✅ Используй для вопросов вида "конверсия по X И Y" (канал x месяц, тип задачи x индустрия, менеджеры x месяц)
+✅ filters сужает срез: "client_industry=Консалтинг; client_task_classification=with_task"
+❌ НЕ используй для цитат и деталей конкретных встреч
+
+**Пример:**
+conversion_breakdown(dimensions="acquisition_channel_type, month", criteria="solution_presentation_quality")"""
+
+# Измерения куба: имя -> ключ в row["index"] строки AnalyticsAccumulator (None - класс задачи)
+DIMENSIONS = {
+    "manager_group": "by_sales_manager",
+    "acquisition_channel_type": "by_acquisition_channel_type",
+    "acquisition_channel_name": "by_acquisition_channel_name",
+    "client_status": "by_client_status",
+    "client_industry": "by_industry",
+    "client_task_classification": None,
+    "month": "by_year_month",
+}
+
+TASK_LABELS = {1: "without_task", 2: "with_task", 3: "insufficient_data"}
+
+# Материализуются все срезы до этой размерности, более детальные считаются из базового среза
+MAX_MATERIALIZED = 3
+
+# Значение измерения, если поле у встречи пустое
+UNKNOWN = "(нет данных)"
+
+# Колонки вектора мер ячейки: встреч, успешных, затем суммы и число оценок по каждому критерию
+TOTAL, SUCCESSFUL = 0, 1
+SUMS = slice(2, 2 + len(SCORE_CRITERIA))
+COUNTS = slice(2 + len(SCORE_CRITERIA), 2 + 2 * len(SCORE_CRITERIA))
+
+CUBE_VERSION = 2
+
+
+class ConversionCube:
+    """
+    Материализованный OLAP-куб конверсии.
+
+    Базовый срез - группировка встреч по всем DIMENSIONS; срезы до MAX_MATERIALIZED измерений
+    получены из него сложением (меры аддитивны: встречи, успешные, суммы и число оценок критериев),
+    поэтому любой двух- или трёхмерный ответ - поиск в словаре.
+    """
+
+    def __init__(self, cuboids: dict[tuple[str, ...], dict[tuple[str, ...], np.ndarray]]):
+        self.cuboids = cuboids
+        self.lookups = 0
+
+    @classmethod
+    def from_rows(cls, rows) -> "ConversionCube":
+        """Сборка из компактных строк AnalyticsAccumulator (analytics_builder)"""
+        base = {}
+        width = 2 + 2 * len(SCORE_CRITERIA)
+        for row in rows:
+            key = tuple(
+                TASK_LABELS.get(row["task"], UNKNOWN) if index is None else (row["index"][index] or UNKNOWN)
+                for index in DIMENSIONS.values()
+            )
+            measures = base.setdefault(key, np.zeros(width, dtype=np.int64))
+            measures[TOTAL] += 1
+            measures[SUCCESSFUL] += row["is_success"]
+            for j, name in enumerate(SCORE_CRITERIA):
+                if name in row["scores"]:
+                    measures[SUMS.start + j] += row["scores"][name]
+                    measures[COUNTS.start + j] += 1
+
+        names = tuple(DIMENSIONS)
+        cuboids = {names: base}
+        for size in range(MAX_MATERIALIZED + 1):
+            for dims in combinations(names, size):
+                cuboids[dims] = _roll_up(base, names, dims)
+        return cls(cuboids)
+
+    def save(self, path: str | Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": CUBE_VERSION,
+            "dimensions": list(DIMENSIONS),
+            "criteria": SCORE_CRITERIA,
+            # Ключи - списки значений: в названиях каналов и клиентов встречаются любые разделители
+            "cuboids": [
+                [list(dims), [[list(key), measures.tolist()] for key, measures in cells.items()]]
+                for dims, cells in self.cuboids.items()
+            ],
+        }
+        atomic_write_text(path, json.dumps(data, ensure_ascii=False))
+
+    @classmethod
+    def load(cls, path: str | Path) -> "ConversionCube":
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        if data.get("version") != CUBE_VERSION or data.get("dimensions") != list(DIMENSIONS) \
+                or data.get("criteria") != SCORE_CRITERIA:
+            raise ValueError(f"Conversion cube at {path} has an incompatible layout, rebuild it")
+
+        return cls({
+            tuple(dims): {tuple(key): np.array(measures, dtype=np.int64) for key, measures in cells}
+            for dims, cells in data["cuboids"]
+        })
+
+    def cells(self, dimensions: list[str], filters: dict[str, str] | None = None) -> dict[tuple[str, ...], np.ndarray]:
+        """
+        Ячейки среза по dimensions с фильтрами {измерение: значение}.
+        Срез нужной размерности берётся готовым; если измерений больше MAX_MATERIALIZED -
+        сворачивается из базового.
+        """
+        filters = filters or {}
+        unknown = [d for d in [*dimensions, *filters] if d not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown dimension(s): {', '.join(unknown)}. Available: {', '.join(DIMENSIONS)}")
+
+        self.lookups += 1
+        # Измерения в каноническом порядке - ключ материализованного среза
+        dims = tuple(d for d in DIMENSIONS if d in dimensions or d in filters)
+        source = self.cuboids.get(dims)
+        if source is None:
+            names = tuple(DIMENSIONS)
+            source = _roll_up(self.cuboids[names], names, dims)
+
+        position = {d: i for i, d in enumerate(dims)}
+        result = {}
+        for key, measures in source.items():
+            if all(key[position[d]] == value for d, value in filters.items()):
+                result[tuple(key[position[d]] for d in dimensions)] = measures
+        return result
+
+    def breakdown(self, dimensions: list[str], filters: dict[str, str] | None = None,
+                  criteria: list[str] | None = None) -> list[dict]:
+        """Строки среза: значения измерений, total, successful, conversion и средние выбранных критериев"""
+        criteria = criteria or []
+        unknown = [c for c in criteria if c not in SCORE_CRITERIA]
+        if unknown:
+            raise ValueError(f"Unknown criterion: {', '.join(unknown)}")
+
+        rows = []
+        for key, measures in sorted(self.cells(dimensions, filters).items()):
+            total, successful = int(measures[TOTAL]), int(measures[SUCCESSFUL])
+            row = dict(zip(dimensions, key))
+            row.update(total=total, successful=successful, conversion=round(100.0 * successful / total, 2) if total else 0.0)
+            for name in criteria:
+                j = SCORE_CRITERIA.index(name)
+                count = measures[COUNTS.start + j]
+                row[name] = round(float(measures[SUMS.start + j] / count), 2) if count else None
+            rows.append(row)
+        return rows
+
+    def conversion_breakdown(self, dimensions: str, filters: str = "", criteria: str = "") -> str:
+        """Return meeting counts, conversion and mean criterion scores for every combination of the given dimensions.
+
+        Args:
+            dimensions: Comma-separated list of 1-3 dimensions: manager_group, acquisition_channel_type, acquisition_channel_name, client_status, client_industry, client_task_classification (without_task / with_task / insufficient_data), month (YYYY-MM).
+            filters: Optional "dimension=value" pairs separated by ";", e.g. "client_industry=Консалтинг; month=2025-04".
+            criteria: Optional comma-separated criteria whose mean score to include, e.g. "solution_fit, rapport_building".
+        """
+        dims = [d.strip() for d in dimensions.split(",") if d.strip()]
+        if not dims:
+            raise ValueError("At least one dimension is required")
+        conditions = {}
+        for part in filters.split(";"):
+            if part.strip():
+                if "=" not in part:
+                    raise ValueError(f"Invalid filter: {part.strip()}. Use dimension=value")
+                name, value = part.split("=", 1)
+                conditions[name.strip()] = value.strip()
+
+        rows = self.breakdown(dims, conditions, [c.strip() for c in criteria.split(",") if c.strip()])
+        if not rows:
+            return "No meetings match these filters"
+        columns = list(rows[0])
+        lines = [" | ".join(columns)]
+        lines.extend(" | ".join("" if row[c] is None else str(row[c]) for c in columns) for row in rows)
+        return "\n".join(lines + [f"({len(rows)} rows)"])
+
+    def cube_tool(self):
+        """conversion_breakdown как инструмент для tool_runner"""
+        return beta_tool(self.conversion_breakdown)
+
+
+def _roll_up(base: dict, names: tuple[str, ...], dims: tuple[str, ...]) -> dict[tuple[str, ...], np.ndarray]:
+    """Сворачивает базовый срез до измерений dims сложением мер"""
+    positions = [names.index(d) for d in dims]
+    cells = {}
+    for key, measures in base.items():
+        projected = tuple(key[i] for i in positions)
+        if projected in cells:
+            cells[projected] = cells[projected] + measures
+        else:
+            cells[projected] = measures.copy()
+    return cells
+
+
+if __name__ == "__main__":
+    cube = ConversionCube.load("./memory/conversion_cube.json")
+    print(cube.conversion_breakdown("acquisition_channel_type, month"))
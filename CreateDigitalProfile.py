@@ -1,8 +1,12 @@
-from MemoryTool import MemoryTool, MODEL, BETAS, SYSTEM_PROMPT
+from MemoryTool import MemoryTool, MODEL, BETAS, SYSTEM_PROMPT, FUNCTION_TOOLS_PROMPT
 import time
 from ClaudeClient import Client
+from prompt_cache import CacheUsage, cached_system, user_content
 from IdentifyParticipants import Identifier
 
+# Подставляется вместо {name}, чтобы текст инструкции не зависел от сотрудника
+EMPLOYEE = "[СОТРУДНИК]"
+
 CREATE_DIGITAL_PROFILE_PROMPT = """Ты - передовая лингвистическая модель, способная «перевоплощаться в заданного человека», предсказывая максимально точно его возможные ответы на конкретные вопросы или поведение в заданной ситуации.
 Для этого ты собираешь информацию о заданном человеке, анализируя транскрипт записей его встреч и формируешь полный профиль человека, который можно использовать в дальнейшем в промптах для предсказания его ответов и реакций строго по той модели компетенций, которая представлена в приложении 2. Никакие другие компетенции ты не добавляешь и не анализируешь.
 
@@ -31,7 +35,7 @@ CREATE_DIGITAL_PROFILE_PROMPT = """Ты - передовая лингвисти
 
 Твоя задача:
 1. Изучи транскрипты из директории /transcripts/
-2. Создай цифровой профиль сотрудника {name} в директории /memories/
+2. Создай цифровой профиль сотрудника {name} в файле профиля в директории /memories/ (путь - в конце сообщения)
 3. Профиль должен содержать детальный анализ по модели компетенций из инструкции
 
 Начни с просмотра списка ВСЕХ файлов в /transcripts/ и обработай каждый из них.
@@ -283,6 +287,14 @@ o	В случае сомнений, используй для анализа т
 •	5 - Стабильно всегда"""
 
 
+def profile_message(name: str) -> list[dict]:
+    """Инструкция без имени (кэшируется), после метки кэша - сотрудник и путь файла профиля"""
+    return user_content(
+        CREATE_DIGITAL_PROFILE_PROMPT.replace("{name}", EMPLOYEE),
+        f"{EMPLOYEE} = {name}\nФайл профиля: /memories/{name}_digital_profile.md",
+    )
+
+
 if __name__ == "__main__":
     client = Client()
     # participants_identifier = Identifier(client)
@@ -294,6 +306,7 @@ if __name__ == "__main__":
         names = f.readlines()
     
     times = []
+    usage = CacheUsage()
     start_time_overall = time.time()
     #for name in names:
     for i in range(len(names[0:1])):
@@ -307,28 +320,44 @@ if __name__ == "__main__":
             betas=BETAS,
             model=MODEL,
             max_tokens=20000, # max_tokens для цифровых профилей
-            system=SYSTEM_PROMPT,
-            tools=[memory],
+            system=cached_system(SYSTEM_PROMPT + FUNCTION_TOOLS_PROMPT),
+            tools=[memory, *memory.function_tools()],
             messages=[
                 {
                     "role":"user",
-                    "content":CREATE_DIGITAL_PROFILE_PROMPT.replace("{name}", f"{name}"),
+                    "content":profile_message(name),
                 }
             ]
         )
 
+        turns = 0
         for message in runner:
+            turns += 1
+            usage.record(message.usage)
             for block in message.content:
                 if block.type == "text":
                     print(block.text)
 
         time_elapsed = time.time() - start_time
+        print(f"\n[DEBUG] {name}: {turns} turns in {time_elapsed:.1f}s")
 
+        # Паузы между участниками не нужны: темп запросов задаёт client.limiter
         times.append(time_elapsed)
 
-        time.sleep(15)
-
     end_time_overall = time.time() - start_time_overall
+    memory.close()
+
+    for tool_name, entry in memory.call_stats.summary().items():
+        print(f"[DEBUG] {tool_name}: {entry['calls']} calls, {entry['total_ms']:.0f} ms, {entry['result_bytes'] / 1024:.1f} KB")
+
+    limiter_stats = client.limiter.stats()
+    print(f"[DEBUG] rate limiter: {limiter_stats['requests']} requests, {limiter_stats['throttled']} throttled, "
+          f"{limiter_stats['retries']} retries, concurrency {limiter_stats['concurrency']}")
+    if client.cassette is not None:
+        print(f"[DEBUG] cassette: {client.cassette.stats()}")
+    usage_stats = usage.summary()
+    print(f"[DEBUG] prompt cache: read {usage_stats['cache_read_input_tokens']}, written {usage_stats['cache_creation_input_tokens']}, "
+          f"uncached {usage_stats['input_tokens']} tokens (hit rate {usage_stats['cache_hit_rate']:.1%})")
 
     print(f"\n\n[DEBUG] OVERALL TIME FOR ALL PROFILES: {end_time_overall}\n")
     
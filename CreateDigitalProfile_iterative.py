@@ -1,8 +1,13 @@
-from MemoryTool import MemoryTool, MODEL, BETAS, SYSTEM_PROMPT
+from MemoryTool import MemoryTool, MODEL, BETAS, SYSTEM_PROMPT, FUNCTION_TOOLS_PROMPT
+from TranscriptSearch import TranscriptSearch, SEARCH_TOOL_PROMPT
 import time
 from ClaudeClient import Client
+from prompt_cache import CacheUsage, cached_system, user_content
 from IdentifyParticipants import Identifier
 
+# Подставляется вместо {name}, чтобы текст инструкции не зависел от сотрудника
+EMPLOYEE = "[СОТРУДНИК]"
+
 CREATE_DIGITAL_PROFILE_PROMPT = """Ты - передовая лингвистическая модель, способная «перевоплощаться в заданного человека», предсказывая максимально точно его возможные ответы на конкретные вопросы или поведение в заданной ситуации.
 Для этого ты собираешь информацию о заданном человеке, анализируя транскрипт записей его встреч и формируешь полный профиль человека, который можно использовать в дальнейшем в промптах для предсказания его ответов и реакций строго по той модели компетенций, которая представлена в приложении 2. Никакие другие компетенции ты не добавляешь и не анализируешь.
 
@@ -10,10 +15,10 @@ CREATE_DIGITAL_PROFILE_PROMPT = """Ты - передовая лингвисти
 
 ##ЗАДАЧА:
 1. Просмотри список файлов в /transcripts/
-2. Создай цифровой профиль сотрудника {name} в директории /memories/
+2. Создай цифровой профиль сотрудника {name} в файле профиля в директории /memories/ (путь - в конце сообщения)
 3. Профиль должен содержать детальный анализ по модели компетенций из инструкции
 4. Проанализируй следующие 5 файлов (которые ещё не обработаны)
-5. Если профиль /memories/{name}_digital_profile.md НЕ существует - создай его
+5. Если файл профиля НЕ существует - создай его
 6. Если профиль СУЩЕСТВУЕТ - обнови его, добавив новую информацию
 7. Сообщи: `Обработано X/15 файлов. Продолжаю...` или `Обработано 15/15 файлов. Завершено.`
 
@@ -273,9 +278,20 @@ o	В случае сомнений, используй для анализа т
 """
 
 
+def profile_message(name: str) -> list[dict]:
+    """Инструкция без имени (кэшируется), после метки кэша - сотрудник и путь файла профиля"""
+    return user_content(
+        CREATE_DIGITAL_PROFILE_PROMPT.replace("{name}", EMPLOYEE),
+        f"{EMPLOYEE} = {name}\nФайл профиля: /memories/{name}_digital_profile.md",
+    )
+
+
 def create_profile_with_iterations(client: Client, name: str):
     """Создает профиль итеративно"""
     memory = MemoryTool()
+    transcript_index = TranscriptSearch(memory)
+    transcript_index.sync()
+    tools = [memory, *memory.function_tools(), transcript_index.search_tool()]
     
     print(f"\n{'='*70}")
     print(f"🎯 Создание профиля: {name}")
@@ -284,12 +300,13 @@ def create_profile_with_iterations(client: Client, name: str):
     messages = [
         {
             "role": "user",
-            "content": CREATE_DIGITAL_PROFILE_PROMPT.replace("{name}", name),
+            "content": profile_message(name),
         }
     ]
     
     max_iterations = 6
     iteration = 0
+    usage = CacheUsage()
     
     start_time = time.time()
     while iteration < max_iterations:
@@ -303,13 +320,14 @@ def create_profile_with_iterations(client: Client, name: str):
                 betas=BETAS,
                 model=MODEL,
                 max_tokens=20000,
-                system=SYSTEM_PROMPT,
-                tools=[memory],
+                system=cached_system(SYSTEM_PROMPT + FUNCTION_TOOLS_PROMPT + SEARCH_TOOL_PROMPT),
+                tools=tools,
                 messages=messages
             )
             
             response_text = ""
             for message in runner:
+                usage.record(message.usage)
                 for block in message.content:
                     if block.type == "text":
                         print(block.text)
@@ -339,8 +357,12 @@ def create_profile_with_iterations(client: Client, name: str):
     else:
         print(f"\n⚠️ Достигнут лимит итераций для {name}")
     
+    memory.close()
     elapsed = time.time() - start_time
     print(f"\n⏱️ Время: {elapsed:.2f} сек ({elapsed/60:.2f} мин)")
+    usage_stats = usage.summary()
+    print(f"🧾 Кэш промпта: прочитано {usage_stats['cache_read_input_tokens']}, записано {usage_stats['cache_creation_input_tokens']}, "
+          f"без кэша {usage_stats['input_tokens']} токенов ({usage_stats['cache_hit_rate']:.1%})")
     
     return elapsed
 
@@ -372,12 +394,8 @@ if __name__ == "__main__":
         print(f"{'='*70}")
         
         elapsed = create_profile_with_iterations(client, name)
+        # Паузы между участниками не нужны: темп запросов задаёт client.limiter
         times.append((name, elapsed))
-        
-        # Пауза между участниками
-        if i < len(names):
-            print("\nПауза 20 сек...\n")
-            time.sleep(20)
     
     # Статистика
     end_time_overall = time.time() - start_time_overall
@@ -387,6 +405,13 @@ if __name__ == "__main__":
     print(f"{'='*70}")
     print(f"✅ Обработано: {len(times)}/{len(names)}")
     print(f"⏱️ Общее время: {end_time_overall:.2f} сек ({end_time_overall/60:.2f} мин)")
+    limiter_stats = client.limiter.stats()
+    print(f"🚦 Запросов: {limiter_stats['requests']}, ограничений 429/529: {limiter_stats['throttled']}, "
+          f"повторов: {limiter_stats['retries']}, параллельность: {limiter_stats['concurrency']}")
+    if client.cassette is not None:
+        cassette_stats = client.cassette.stats()
+        print(f"📼 Кассета ({cassette_stats['mode']}): записано {cassette_stats['recorded']}, воспроизведено "
+              f"{cassette_stats['replayed']}, промахов {cassette_stats['misses']}")
     
     # Сохранение отчета
     import os
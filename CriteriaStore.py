@@ -0,0 +1,136 @@
+from pathlib import Path
+import json
+import os
+
+import numpy as np
+
+from MemoryStorage import atomic_write_text
+from meeting_records import CRITERIA, SCORE_CRITERIA, TASK_CRITERION
+
+# Пропущенная оценка в матрице критериев
+MISSING = -1
+
+# Категориальные колонки: имя колонки -> индекс строки AnalyticsAccumulator (None - meeting_success)
+CATEGORY_COLUMNS = {
+    "status": None,
+    "manager": "by_sales_manager",
+    "channel": "by_acquisition_channel_type",
+    "month": "by_year_month",
+}
+
+NUMERIC_COLUMNS = {"meeting_id": np.int32, "total_score": np.float32, "average_score": np.float32}
+
+STORE_VERSION = 1
+
+
+def _encode(values: list) -> tuple[np.ndarray, list[str]]:
+    """Словарное кодирование: отсортированный словарь и int16-коды, None -> -1"""
+    vocab = sorted({v for v in values if v})
+    position = {v: i for i, v in enumerate(vocab)}
+    return np.array([position.get(v, -1) if v else -1 for v in values], dtype=np.int16), vocab
+
+
+class CriteriaStore:
+    """
+    Колоночный кэш оценок встреч для векторных расчётов.
+
+    criteria - матрица встречи x критерии (int8, порядок CRITERIA, пропуск = MISSING),
+    status/manager/channel/month - int16-коды со словарями в vocab.json,
+    meeting_id, total_score, average_score - по колонке на файл .npy.
+    load() открывает колонки через mmap, поэтому загрузка не зависит от размера базы.
+    """
+
+    def __init__(self, columns: dict[str, np.ndarray], vocab: dict[str, list[str]]):
+        self.columns = columns
+        self.vocab = vocab
+
+    def __len__(self):
+        return len(self.columns["meeting_id"])
+
+    @classmethod
+    def from_rows(cls, rows) -> "CriteriaStore":
+        """Сборка из компактных строк AnalyticsAccumulator (analytics_builder)"""
+        rows = sorted(rows, key=lambda row: row["meeting_id"])
+        criteria = np.full((len(rows), len(CRITERIA)), MISSING, dtype=np.int8)
+        for i, row in enumerate(rows):
+            values = {**row["scores"], TASK_CRITERION: row["task"]}
+            for j, name in enumerate(CRITERIA):
+                if isinstance(values.get(name), (int, float)):
+                    criteria[i, j] = values[name]
+
+        columns = {"criteria": criteria}
+        for name, dtype in NUMERIC_COLUMNS.items():
+            columns[name] = np.array([np.nan if row[name] is None else row[name] for row in rows], dtype=dtype)
+
+        vocab = {}
+        for name, index in CATEGORY_COLUMNS.items():
+            values = [row["meeting_success"] if index is None else row["index"][index] for row in rows]
+            columns[name], vocab[name] = _encode(values)
+        return cls(columns, vocab)
+
+    @staticmethod
+    def exists(path: str | Path) -> bool:
+        return (Path(path) / "vocab.json").exists()
+
+    def save(self, path: str | Path):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name, column in self.columns.items():
+            tmp = path / f".{name}.tmp.npy"
+            np.save(tmp, column)
+            os.replace(tmp, path / f"{name}.npy")
+        # vocab.json пишется последним и фиксирует согласованный набор колонок
+        atomic_write_text(path / "vocab.json", json.dumps(
+            {"version": STORE_VERSION, "rows": len(self), "criteria": CRITERIA, "vocab": self.vocab}, ensure_ascii=False
+        ))
+
+    @classmethod
+    def load(cls, path: str | Path, mmap: bool = True) -> "CriteriaStore":
+        path = Path(path)
+        meta = json.loads((path / "vocab.json").read_text(encoding="utf-8"))
+        if meta.get("version") != STORE_VERSION or meta.get("criteria") != CRITERIA:
+            raise ValueError(f"Criteria store at {path} has an incompatible layout, rebuild it")
+
+        names = ["criteria", *NUMERIC_COLUMNS, *CATEGORY_COLUMNS]
+        columns = {name: np.load(path / f"{name}.npy", mmap_mode="r" if mmap else None) for name in names}
+        if any(len(column) != meta["rows"] for column in columns.values()):
+            raise ValueError(f"Criteria store at {path} is incomplete, rebuild it")
+        return cls(columns, meta["vocab"])
+
+    def code(self, column: str, value: str) -> int:
+        """Код значения категориальной колонки, -2 если значения нет в словаре"""
+        vocab = self.vocab[column]
+        return vocab.index(value) if value in vocab else -2
+
+    @property
+    def success(self) -> np.ndarray:
+        """Булева маска meeting_success == "да" """
+        return np.asarray(self.columns["status"]) == self.code("status", "да")
+
+    def scores(self) -> np.ndarray:
+        """Оценки SCORE_CRITERIA как float-матрица, пропуски - NaN"""
+        scores = np.asarray(self.columns["criteria"][:, :len(SCORE_CRITERIA)], dtype=np.float64)
+        scores[scores == MISSING] = np.nan
+        return scores
+
+    def means_by_status(self) -> dict[str, dict[str, float | None]]:
+        """Средние оценки критериев для каждого значения meeting_success"""
+        scores = self.scores()
+        status = np.asarray(self.columns["status"])
+        result = {}
+        for code, value in enumerate(self.vocab["status"]):
+            group = scores[status == code]
+            valid = ~np.isnan(group)
+            counts = valid.sum(axis=0)
+            sums = np.where(valid, group, 0).sum(axis=0)
+            result[value] = {
+                name: round(float(s / c), 2) if c else None for name, s, c in zip(SCORE_CRITERIA, sums, counts)
+            }
+        return result
+
+
+if __name__ == "__main__":
+    store = CriteriaStore.load("./memory/criteria_store")
+    print(f"📊 CriteriaStore: {len(store)} встреч, {store.columns['criteria'].nbytes / 1024:.1f} KB оценок")
+    for status, means in store.means_by_status().items():
+        print(f"  {status}: " + ", ".join(f"{name}={'n/a' if value is None else value}" for name, value in means.items()))
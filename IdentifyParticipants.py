@@ -56,6 +56,9 @@ class Identifier:
 
         print("\n==================[DEBUG] PARTICIPANTS IDENTIFIED==================\n")
 
+        # participants.txt читается напрямую с диска - сбрасываем отложенные правки
+        self.memory.flush()
+
         try:
             with open("memory/memories/participants.txt", "r", encoding="utf-8", errors="replace") as f:
                 lines = f.readlines()
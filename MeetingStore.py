@@ -0,0 +1,264 @@
+from anthropic import beta_tool
+from pathlib import Path
+import threading
+import sqlite3
+import json
+import time
+
+from meeting_records import CRITERIA, meeting_record
+from transcript_stream import extract_sections
+
+# Дополняет системный промпт, когда в tools передан store.sql_tool()
+SQL_TOOL_PROMPT = """
+
+### sql_query(query)
+Read-only SQL (SQLite) по базе встреч, собранной из всех файлов /transcripts/ (одна строка на встречу).
+✅ Используй В ПЕРВУЮ ОЧЕРЕДЬ для подсчётов, конверсий, группировок по каналам/месяцам/менеджерам/индустриям и средних оценок критериев
+✅ Одним запросом с GROUP BY можно получить всю таблицу ответа
+❌ НЕ используй для цитат и деталей диалога - для этого view транскрипта (колонка file)
+- Схема таблиц - в описании инструмента
+- Конверсия: AVG(is_success) (is_success = 1 только при meeting_success = 'да')
+- Встречи менеджера: JOIN meeting_managers USING (meeting_id); группы менеджеров как в analytics_db.json - колонка manager_group
+
+**Пример:**
+sql_query(query="SELECT acquisition_channel_type, COUNT(*) AS total, SUM(is_success) AS successful, ROUND(100.0 * AVG(is_success), 1) AS conversion FROM meetings GROUP BY 1 ORDER BY conversion DESC")"""
+
+MEETING_COLUMNS = [
+    ("meeting_id", "INTEGER PRIMARY KEY"),
+    ("file", "TEXT NOT NULL"),
+    ("meeting_date", "TEXT"),
+    ("month", "TEXT"),
+    ("quarter", "TEXT"),
+    ("meeting_success", "TEXT"),
+    ("is_success", "INTEGER"),
+    ("client_name", "TEXT"),
+    ("client_industry", "TEXT"),
+    ("acquisition_channel_type", "TEXT"),
+    ("acquisition_channel_name", "TEXT"),
+    ("client_status", "TEXT"),
+    ("purchase_amount", "REAL"),
+    ("pilot_probability", "REAL"),
+    ("manager_comments", "TEXT"),
+    ("manager_group", "TEXT"),
+    ("total_score", "REAL"),
+    ("average_score", "REAL"),
+    ("conversion_probability", "TEXT"),
+] + [(name, "INTEGER") for name in CRITERIA]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS meetings (
+    {", ".join(f"{name} {kind}" for name, kind in MEETING_COLUMNS)}
+);
+CREATE TABLE IF NOT EXISTS meeting_managers (
+    meeting_id INTEGER NOT NULL REFERENCES meetings(meeting_id) ON DELETE CASCADE,
+    manager_name TEXT NOT NULL,
+    activity_percentage REAL,
+    PRIMARY KEY (meeting_id, manager_name)
+);
+CREATE TABLE IF NOT EXISTS source_files (
+    file TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    meeting_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_meetings_date ON meetings(meeting_date);
+CREATE INDEX IF NOT EXISTS idx_meetings_channel ON meetings(acquisition_channel_type, acquisition_channel_name);
+CREATE INDEX IF NOT EXISTS idx_meetings_industry ON meetings(client_industry);
+CREATE INDEX IF NOT EXISTS idx_meetings_group ON meetings(manager_group);
+CREATE INDEX IF NOT EXISTS idx_managers_name ON meeting_managers(manager_name);
+"""
+
+# Внутренняя таблица синхронизации не показывается модели
+HIDDEN_TABLES = {"source_files"}
+
+
+class MeetingStore:
+    """
+    SQLite-база встреч, собранная из JSON-транскриптов.
+
+    sync() инкрементально обновляет базу по (mtime, size) файлов, query() выполняет
+    read-only SQL с лимитом строк и таймаутом. Файл базы лежит рядом с /memories и /transcripts,
+    поэтому через MemoryTool он не виден.
+    """
+
+    def __init__(
+        self,
+        db_path: str = "./memory/meetings.sqlite3",
+        transcripts_dir: str = "./memory/transcripts",
+        row_limit: int = 200,
+        timeout: float = 5.0,
+    ):
+        self.db_path = Path(db_path)
+        self.transcripts_dir = Path(transcripts_dir)
+        self.row_limit = row_limit
+        self.timeout = timeout
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+
+        self.queries = 0
+        self.query_errors = 0
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def sync(self) -> dict:
+        """Добавляет новые и изменённые транскрипты, удаляет встречи исчезнувших и переставших разбираться файлов"""
+        with self._sync_lock, sqlite3.connect(self.db_path) as conn:
+            conn.execute("PRAGMA foreign_keys=ON")
+            known = {
+                file: (mtime_ns, size, meeting_id)
+                for file, mtime_ns, size, meeting_id in conn.execute("SELECT file, mtime_ns, size, meeting_id FROM source_files")
+            }
+            files = {path.name: path for path in sorted(self.transcripts_dir.glob("*.json"))}
+            added = updated = failed = 0
+            # meeting_id, строки которых могли остаться без файла; проверяются после всех изменений
+            orphans = set()
+
+            # Сначала исчезнувшие файлы: при переименовании встреча нового файла не должна удалиться
+            removed = [file for file in known if file not in files]
+            for file in removed:
+                orphans.add(known[file][2])
+                conn.execute("DELETE FROM source_files WHERE file = ?", (file,))
+
+            for file, path in files.items():
+                st = path.stat()
+                previous = known.get(file)
+                if previous and previous[:2] == (st.st_mtime_ns, st.st_size):
+                    continue
+
+                try:
+                    record = meeting_record(extract_sections(path)[0], file)
+                except (json.JSONDecodeError, UnicodeDecodeError, AttributeError) as e:
+                    print(f"[WARN] MeetingStore: skipping {file}: {e}")
+                    failed += 1
+                    # Прежняя версия встречи устарела; файл разбирается снова при следующей синхронизации
+                    if previous:
+                        orphans.add(previous[2])
+                        conn.execute("DELETE FROM source_files WHERE file = ?", (file,))
+                    continue
+
+                if previous:
+                    orphans.add(previous[2])
+                self._insert(conn, record)
+                conn.execute(
+                    "INSERT OR REPLACE INTO source_files (file, mtime_ns, size, meeting_id) VALUES (?, ?, ?, ?)",
+                    (file, st.st_mtime_ns, st.st_size, record["meeting_id"]),
+                )
+                if previous:
+                    updated += 1
+                else:
+                    added += 1
+
+            for meeting_id in orphans - {None}:
+                self._settle(conn, meeting_id, files)
+
+            total = conn.execute("SELECT COUNT(*) FROM meetings").fetchone()[0]
+
+        return {"added": added, "updated": updated, "removed": len(removed), "failed": failed, "total": total}
+
+    def _settle(self, conn: sqlite3.Connection, meeting_id: int, files: dict[str, Path]):
+        """
+        Строка встречи остаётся, только если её файл по-прежнему заявляет этот meeting_id;
+        если встречу заявляет другой файл (дубликат id), строка перечитывается из последнего по имени,
+        как при полной синхронизации
+        """
+        claims = [file for (file,) in conn.execute("SELECT file FROM source_files WHERE meeting_id = ? ORDER BY file DESC", (meeting_id,))]
+        row = conn.execute("SELECT file FROM meetings WHERE meeting_id = ?", (meeting_id,)).fetchone()
+        if row is not None and row[0] in claims:
+            return
+        conn.execute("DELETE FROM meetings WHERE meeting_id = ?", (meeting_id,))
+        for file in claims:
+            try:
+                self._insert(conn, meeting_record(extract_sections(files[file])[0], file))
+                return
+            except (KeyError, OSError, json.JSONDecodeError, UnicodeDecodeError, AttributeError) as e:
+                print(f"[WARN] MeetingStore: skipping {file}: {e}")
+                conn.execute("DELETE FROM source_files WHERE file = ?", (file,))
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, record: dict):
+        row = {**record, **record["criteria"]}
+        names = [name for name, _ in MEETING_COLUMNS]
+        conn.execute(
+            f"INSERT OR REPLACE INTO meetings ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+            [row.get(name) for name in names],
+        )
+        conn.execute("DELETE FROM meeting_managers WHERE meeting_id = ?", (record["meeting_id"],))
+        conn.executemany(
+            "INSERT OR REPLACE INTO meeting_managers (meeting_id, manager_name, activity_percentage) VALUES (?, ?, ?)",
+            [(record["meeting_id"], name, activity) for name, activity in record["managers"]],
+        )
+
+    def _reader(self) -> sqlite3.Connection:
+        """Отдельное read-only соединение на поток"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON")
+            conn.set_authorizer(self._authorize)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _authorize(action, arg1, arg2, db_name, trigger):
+        if action in (sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH) or (action == sqlite3.SQLITE_PRAGMA and arg2 is not None):
+            return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
+
+    def schema(self) -> str:
+        """Описание таблиц для модели"""
+        lines = []
+        with sqlite3.connect(self.db_path) as conn:
+            for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name"):
+                if table in HIDDEN_TABLES:
+                    continue
+                columns = conn.execute(f"PRAGMA table_info({table})").fetchall()
+                lines.append(f"{table}({', '.join(f'{c[1]} {c[2]}' for c in columns)})")
+        return "\n".join(lines)
+
+    def query(self, sql: str, row_limit: int | None = None) -> tuple[list[str], list[tuple], bool]:
+        """Выполняет один SELECT; возвращает (колонки, строки, обрезано ли по лимиту)"""
+        row_limit = row_limit or self.row_limit
+        conn = self._reader()
+        deadline = time.monotonic() + self.timeout
+        conn.set_progress_handler(lambda: int(time.monotonic() > deadline), 10_000)
+        self.queries += 1
+        try:
+            cursor = conn.execute(sql)
+            if cursor.description is None:
+                raise ValueError("Only SELECT queries are allowed")
+            rows = cursor.fetchmany(row_limit + 1)
+        except sqlite3.OperationalError as e:
+            self.query_errors += 1
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Query exceeded {self.timeout:.0f}s timeout") from e
+            raise ValueError(f"SQL error: {e}") from e
+        except (sqlite3.DatabaseError, sqlite3.Warning) as e:
+            self.query_errors += 1
+            raise ValueError(f"SQL error: {e}") from e
+        finally:
+            conn.set_progress_handler(None, 0)
+
+        columns = [d[0] for d in cursor.description]
+        return columns, rows[:row_limit], len(rows) > row_limit
+
+    def sql_query(self, query: str) -> str:
+        """Run a single read-only SQL (SQLite) query over the meeting store and return the rows as a table."""
+        columns, rows, truncated = self.query(query)
+        lines = [" | ".join(columns)]
+        lines.extend(" | ".join("" if value is None else str(value) for value in row) for row in rows)
+        footer = f"({len(rows)} rows"
+        footer += f", truncated to {self.row_limit} - add LIMIT/OFFSET or aggregate)" if truncated else ")"
+        return "\n".join(lines + [footer])
+
+    def sql_tool(self):
+        """sql_query как инструмент для tool_runner; схема таблиц - в описании"""
+        description = (
+            "Run a single read-only SQL (SQLite) query over the meeting store built from /transcripts "
+            f"(one row per meeting). At most {self.row_limit} rows are returned, "
+            f"queries time out after {self.timeout:.0f}s.\n\nTables:\n{self.schema()}"
+        )
+        return beta_tool(self.sql_query, description=description)
@@ -0,0 +1,383 @@
+from contextlib import ExitStack
+from bisect import bisect_right
+from typing import Callable
+import atexit
+import threading
+import weakref
+
+from MemoryStorage import MemoryStorage, number_lines
+
+
+class LineRope:
+    """
+    Редактируемый текст в виде "верёвки" из блоков строк.
+
+    Строки хранятся с переводами строк (как splitlines(keepends=True)) блоками по CHUNK штук,
+    для блоков ведутся префиксные суммы номеров строк и символов. Вставка затрагивает
+    только один-два блока, поэтому не пересобирает и не копирует весь файл. Склеенный текст
+    блока кэшируется до его правки - поиск (find) не собирает весь файл после каждой правки.
+    """
+
+    CHUNK = 512
+
+    def __init__(self, text: str = "", normalize: Callable[[str], str] | None = None):
+        self._normalize = normalize
+        self._chunks: list[list[str]] = []
+        self._chunk_texts: list[str | None] = []
+        self._chunk_chars: list[int] = []
+        self._line_starts: list[int] = []
+        self._char_starts: list[int] = []
+        self._total_lines = 0
+        self._total_chars = 0
+        self._text: str | None = text
+        self._numbered: str | None = None
+        self._set_lines(text.splitlines(keepends=True))
+
+    def _set_lines(self, lines: list[str]):
+        self._chunks = [lines[i:i + self.CHUNK] for i in range(0, len(lines), self.CHUNK)]
+        self._chunk_texts = [None] * len(self._chunks)
+        self._chunk_chars = [sum(map(len, chunk)) for chunk in self._chunks]
+        self._reindex()
+
+    def _reindex(self):
+        self._line_starts = []
+        self._char_starts = []
+        lines = chars = 0
+        for chunk, chunk_chars in zip(self._chunks, self._chunk_chars):
+            self._line_starts.append(lines)
+            self._char_starts.append(chars)
+            lines += len(chunk)
+            chars += chunk_chars
+        self._total_lines = lines
+        self._total_chars = chars
+
+    def _chunk_of_line(self, line: int) -> int:
+        return max(0, min(bisect_right(self._line_starts, line) - 1, len(self._chunks) - 1))
+
+    def _char_offset(self, line: int) -> int:
+        """Смещение (в символах) начала строки line"""
+        if line >= self._total_lines:
+            return self._total_chars
+        ci = self._chunk_of_line(line)
+        chunk = self._chunks[ci]
+        return self._char_starts[ci] + sum(map(len, chunk[:line - self._line_starts[ci]]))
+
+    def _line_of_char(self, offset: int) -> int:
+        """Номер строки, в которой находится символ с данным смещением"""
+        ci = max(0, bisect_right(self._char_starts, offset) - 1)
+        position = self._char_starts[ci]
+        for i, line in enumerate(self._chunks[ci]):
+            position += len(line)
+            if offset < position:
+                return self._line_starts[ci] + i
+        return self._total_lines - 1
+
+    def _splice(self, start: int, end: int, new_lines: list[str]):
+        """Заменяет строки [start, end) на new_lines, перестраивая только затронутые блоки"""
+        self._text = None
+        self._numbered = None
+
+        if not self._chunks:
+            self._set_lines(new_lines)
+            return
+
+        ci = self._chunk_of_line(start)
+        cj = self._chunk_of_line(end - 1) if end > start else ci
+        base = self._line_starts[ci]
+
+        region = [line for chunk in self._chunks[ci:cj + 1] for line in chunk]
+        region[start - base:end - base] = new_lines
+
+        # Переполненный блок делится поровну: иначе вставки по одной строке дробят файл на блоки из одной строки
+        size = -(-len(region) // -(-len(region) // self.CHUNK)) if region else self.CHUNK
+        new_chunks = [region[i:i + size] for i in range(0, len(region), size)]
+        self._chunks[ci:cj + 1] = new_chunks
+        self._chunk_texts[ci:cj + 1] = [None] * len(new_chunks)
+        self._chunk_chars[ci:cj + 1] = [sum(map(len, chunk)) for chunk in new_chunks]
+        self._reindex()
+
+    def _rewrite_region(self, lo: int, hi: int, local_edit: Callable[[str], str]):
+        # Регион расширен на строку с каждой стороны: его границы - настоящие переводы строк,
+        # поэтому splitlines() региона совпадает со splitlines() всего текста после правки
+        region = local_edit("".join(self.lines(lo, hi)))
+        if self._normalize:
+            region = self._normalize(region)
+        self._splice(lo, hi, region.splitlines(keepends=True))
+
+    def line_count(self) -> int:
+        return self._total_lines
+
+    def lines(self, start: int = 0, end: int | None = None) -> list[str]:
+        """Строки [start, end) с переводами строк"""
+        end = self._total_lines if end is None else min(end, self._total_lines)
+        if start >= end:
+            return []
+        result = []
+        ci = self._chunk_of_line(start)
+        while ci < len(self._chunks) and self._line_starts[ci] < end:
+            base = self._line_starts[ci]
+            result.extend(self._chunks[ci][max(0, start - base):end - base])
+            ci += 1
+        return result
+
+    def _chunk_text(self, ci: int) -> str:
+        text = self._chunk_texts[ci]
+        if text is None:
+            text = self._chunk_texts[ci] = "".join(self._chunks[ci])
+        return text
+
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join(self._chunk_text(ci) for ci in range(len(self._chunks)))
+        return self._text
+
+    def find(self, needle: str, limit: int | None = None) -> list[int]:
+        """Смещения непересекающихся вхождений needle слева направо (как считает str.count), не больше limit"""
+        positions: list[int] = []
+        if not needle:
+            return positions
+        if self._text is not None:
+            start = self._text.find(needle)
+            while start != -1 and (limit is None or len(positions) < limit):
+                positions.append(start)
+                start = self._text.find(needle, start + len(needle))
+            return positions
+
+        # Вхождение, пересекающее границу блоков, начинается в последних keep символах предыдущих блоков
+        keep = len(needle) - 1
+        carry, allowed = "", 0
+        for ci in range(len(self._chunks)):
+            text, offset = self._chunk_text(ci), self._char_starts[ci]
+            if carry:
+                window, base = carry + text[:keep], offset - len(carry)
+                start = window.find(needle, max(0, allowed - base))
+                while 0 <= start < len(carry):
+                    positions.append(base + start)
+                    allowed = base + start + len(needle)
+                    if limit is not None and len(positions) >= limit:
+                        return positions
+                    start = window.find(needle, start + len(needle))
+            start = text.find(needle, max(0, allowed - offset))
+            while start != -1:
+                positions.append(offset + start)
+                allowed = offset + start + len(needle)
+                if limit is not None and len(positions) >= limit:
+                    return positions
+                start = text.find(needle, start + len(needle))
+            if keep:
+                carry = text[-keep:] if len(text) >= keep else (carry + text)[-keep:]
+        return positions
+
+    def numbered(self) -> str:
+        if self._numbered is None:
+            self._numbered = number_lines(self.text().splitlines())
+        return self._numbered
+
+    def insert(self, line: int, text: str):
+        """Вставляет text так же, как lines.insert(line, text) над splitlines(keepends=True)"""
+        lo, hi = max(0, line - 1), min(self._total_lines, line + 1)
+        local = self._char_offset(line) - self._char_offset(lo)
+        self._rewrite_region(lo, hi, lambda region: region[:local] + text + region[local:])
+
+    def replace_at(self, position: int, length: int, new: str):
+        """Заменяет length символов начиная с position на new"""
+        first = self._line_of_char(position)
+        last = self._line_of_char(max(position, position + length - 1))
+        lo, hi = max(0, first - 1), min(self._total_lines, last + 2)
+        local = position - self._char_offset(lo)
+        self._rewrite_region(lo, hi, lambda region: region[:local] + new + region[local + length:])
+
+
+class _HotDocument:
+    __slots__ = ("rope", "lock", "dirty", "closed")
+
+    def __init__(self, text: str, normalize: Callable[[str], str]):
+        self.rope = LineRope(text, normalize)
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.closed = False
+
+
+# Сколько ключей с числом правок (ещё не горячих) помнит HotDocuments
+MAX_EDIT_COUNTS = 4096
+
+
+class HotDocuments:
+    """
+    Держит в памяти часто редактируемые файлы (например, {name}_digital_profile.md).
+
+    Файл становится "горячим" после hot_edit_threshold правок: дальше insert/str_replace
+    применяются к LineRope в памяти, а на диск (в хранилище) изменения сбрасываются
+    фоновым потоком раз в flush_interval секунд, при close() и при завершении процесса.
+    Предполагается, что этот MemoryTool - единственный писатель файла
+    (при process_lock=True горячие документы отключаются).
+    """
+
+    def __init__(self, storage: MemoryStorage, hot_edit_threshold: int = 3, flush_interval: float = 2.0):
+        self.storage = storage
+        self.hot_edit_threshold = hot_edit_threshold
+        self.flush_interval = flush_interval
+
+        self._docs: dict[str, _HotDocument] = {}
+        self._edit_counts: dict[str, int] = {}
+        # Правки одного ключа (обычные и в памяти) идут по очереди: иначе чтение файла при переводе
+        # в горячие может не увидеть параллельную запись обычной транзакцией, и она потеряется при сбросе
+        self._key_locks: dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self.promotions = 0
+        self.edits_in_memory = 0
+        self.flushes = 0
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="memory-write-behind", daemon=True)
+        self._flusher.start()
+        # weakref, чтобы atexit не удерживал MemoryTool в памяти
+        atexit.register(HotDocuments._flush_at_exit, weakref.ref(self))
+
+    @staticmethod
+    def _flush_at_exit(ref):
+        documents = ref()
+        if documents is not None:
+            documents.close()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            with self._lock:
+                keys = list(self._docs)
+            # Ошибка одного документа (например, директорию удалили в обход MemoryTool) не останавливает сброс остальных
+            for key in keys:
+                try:
+                    self.flush(key)
+                except Exception as e:
+                    print(f"[WARN] HotDocuments: flush of {key} failed, will retry: {e!r}")
+
+    def get(self, key: str) -> _HotDocument | None:
+        with self._lock:
+            return self._docs.get(key)
+
+    def edit(self, key: str, doc_edit: Callable[[LineRope], None], text_edit: Callable[[str], str]):
+        """
+        Применяет правку: к документу в памяти (doc_edit), если файл горячий,
+        иначе - обычной транзакцией хранилища (text_edit).
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            while True:
+                with self._lock:
+                    doc = self._docs.get(key)
+                    if doc is None:
+                        # Переставляется в конец: при переполнении забываются давно не правленные ключи
+                        count = self._edit_counts.pop(key, 0) + 1
+                        self._edit_counts[key] = count
+                        if len(self._edit_counts) > MAX_EDIT_COUNTS:
+                            del self._edit_counts[next(iter(self._edit_counts))]
+
+                if doc is None and count < self.hot_edit_threshold:
+                    self.storage.update(key, text_edit)
+                    return
+
+                if doc is None:
+                    doc = self._promote(key)
+
+                with doc.lock:
+                    # Документ успели выгрузить (delete/rename) - правка пойдёт по обычному пути
+                    if doc.closed:
+                        continue
+                    doc_edit(doc.rope)
+                    doc.dirty = True
+                with self._lock:
+                    self.edits_in_memory += 1
+                return
+
+    def _promote(self, key: str) -> _HotDocument:
+        """Читает файл в память; вызывается под блокировкой ключа, после всех предыдущих правок"""
+        text = self.storage.read_text(key)
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is None:
+                doc = self._docs[key] = _HotDocument(text, self.storage.normalize_newlines)
+                self._edit_counts.pop(key, None)
+                self.promotions += 1
+            return doc
+
+    def _write_locked(self, key: str, doc: _HotDocument):
+        """Записывает документ в хранилище; вызывается под doc.lock"""
+        if not doc.dirty or doc.closed:
+            return
+        text = doc.rope.text()
+        self.storage.update(key, lambda _: text)
+        doc.dirty = False
+        with self._lock:
+            self.flushes += 1
+
+    def _flush_doc(self, key: str, doc: _HotDocument):
+        with doc.lock:
+            self._write_locked(key, doc)
+
+    def flush(self, key: str | None = None):
+        """Сбрасывает в хранилище один документ или все изменённые"""
+        with self._lock:
+            if key is None:
+                targets = list(self._docs.items())
+            else:
+                targets = [(key, self._docs[key])] if key in self._docs else []
+        for doc_key, doc in targets:
+            self._flush_doc(doc_key, doc)
+
+    @staticmethod
+    def _under(doc_key: str, key: str) -> bool:
+        """doc_key - сам файл key или файл внутри директории key; корень ("") сюда не подходит"""
+        return doc_key == key or bool(key) and doc_key.startswith(key + "/")
+
+    def delete(self, key: str, remove: Callable[[], None]):
+        """
+        Удаляет файл или директорию key функцией remove(). Документы внутри выгружаются без сброса
+        только после успешного удаления: если remove() упал, несохранённые правки остаются в памяти.
+        """
+        with self._lock:
+            targets = sorted((k, doc) for k, doc in self._docs.items() if self._under(k, key))
+        # Блокировки документов держатся на время удаления: фоновый сброс не запишет файл обратно
+        with ExitStack() as stack:
+            for _, doc in targets:
+                stack.enter_context(doc.lock)
+            remove()
+            for doc_key, doc in targets:
+                doc.closed = True
+            with self._lock:
+                for doc_key, _ in targets:
+                    self._docs.pop(doc_key, None)
+                for doc_key in [k for k in self._edit_counts if self._under(k, key)]:
+                    del self._edit_counts[doc_key]
+
+    def release(self, key: str, flush: bool = True):
+        """Выгружает документ (и всё внутри директории key) перед rename"""
+        with self._lock:
+            keys = [k for k in self._docs if self._under(k, key)]
+        for doc_key in keys:
+            with self._lock:
+                doc = self._docs.get(doc_key)
+            if doc is None:
+                continue
+            with doc.lock:
+                if flush:
+                    self._write_locked(doc_key, doc)
+                doc.closed = True
+                with self._lock:
+                    self._docs.pop(doc_key, None)
+                    self._edit_counts.pop(doc_key, None)
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hot_documents": len(self._docs),
+                "dirty": sum(1 for doc in self._docs.values() if doc.dirty),
+                "promotions": self.promotions,
+                "edits_in_memory": self.edits_in_memory,
+                "flushes": self.flushes,
+            }
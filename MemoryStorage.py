@@ -0,0 +1,823 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager, ExitStack
+from pathlib import Path
+from array import array
+from typing import Callable
+import threading
+import tempfile
+import hashlib
+import sqlite3
+import struct
+import mmap
+import time
+import os
+import re
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def number_lines(lines: list[str], start_num: int = 1) -> str:
+    """Форматирует строки так, как их возвращает view: `   1: текст`"""
+    return "\n".join([f"{i + start_num:4d}: {line}" for i, line in enumerate(lines)])
+
+
+# Отпечаток версии содержимого: (метка изменения, размер в байтах, идентификатор версии)
+Stamp = tuple[int, int, int]
+
+
+class _CacheEntry:
+    __slots__ = ("stamp", "content", "numbered", "nbytes")
+
+    def __init__(self, stamp: Stamp, content: str):
+        self.stamp = stamp
+        self.content = content
+        self.numbered: str | None = None
+        self.nbytes = stamp[1]
+
+
+class ContentCache:
+    """
+    Общий для всех потоков LRU-кэш содержимого файлов.
+
+    Ключ выдаёт хранилище (для файлов - разрешённый путь), актуальность проверяется
+    по отпечатку (для файлов - mtime_ns, size, inode; для SQLite - updated_at, size, version).
+    Хранит как исходный текст, так и уже пронумерованное представление для view.
+    Вытеснение - по суммарному бюджету в байтах.
+    """
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.render_hits = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.bytes_read = 0
+        self.bytes_saved = 0
+
+    def _lookup(self, key: str, stamp: Stamp) -> _CacheEntry | None:
+        # Вызывается под self._lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.stamp != stamp:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _drop(self, key: str):
+        # Вызывается под self._lock
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    def _charge(self, entry: _CacheEntry, nbytes: int):
+        # Вызывается под self._lock
+        entry.nbytes += nbytes
+        self._bytes += nbytes
+        self._evict()
+
+    def _evict(self):
+        # Вызывается под self._lock
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def _load(self, key: str, stamp: Stamp, load: Callable[[], str]) -> _CacheEntry:
+        with self._lock:
+            entry = self._lookup(key, stamp)
+            if entry is not None:
+                self.hits += 1
+                self.bytes_saved += stamp[1]
+                return entry
+
+        # Чтение из хранилища - вне блокировки, чтобы не сериализовать потоки
+        content = load()
+        entry = _CacheEntry(stamp, content)
+
+        with self._lock:
+            self.misses += 1
+            self.bytes_read += stamp[1]
+            if stamp[1] > self.max_bytes:
+                return entry
+            self._drop(key)
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            self._evict()
+        return entry
+
+    def get_content(self, key: str, stamp: Stamp, load: Callable[[], str]) -> str:
+        return self._load(key, stamp, load).content
+
+    def get_numbered(self, key: str, stamp: Stamp, load: Callable[[], str]) -> str:
+        entry = self._load(key, stamp, load)
+        with self._lock:
+            if entry.numbered is not None:
+                self.render_hits += 1
+                return entry.numbered
+
+        numbered = number_lines(entry.content.splitlines())
+
+        with self._lock:
+            if entry.numbered is None:
+                entry.numbered = numbered
+                if self._entries.get(key) is entry:
+                    self._charge(entry, len(numbered.encode("utf-8")))
+        return numbered
+
+    def invalidate(self, key: str):
+        """Сбрасывает запись для файла и всех файлов внутри него (если это директория)"""
+        prefix = key.rstrip("/\\") + ("\\" if "\\" in key else "/")
+        with self._lock:
+            for cached_key in [k for k in self._entries if k == key or k.startswith(prefix)]:
+                self._drop(cached_key)
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "render_hits": self.render_hits,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "cached_bytes": self._bytes,
+                "bytes_read": self.bytes_read,
+                "bytes_saved": self.bytes_saved,
+            }
+
+
+# Разделители строк, которые str.splitlines() учитывает помимо "\n"
+_EXTRA_LINE_BREAKS = re.compile(rb"[\r\x0b\x0c\x1c\x1d\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]")
+
+
+class LineIndex:
+    """
+    Индекс смещений строк для файлов, которые просматриваются по диапазонам.
+
+    Для каждого файла хранится массив байтовых смещений начала строк (+ конец файла),
+    поэтому view с view_range читает через mmap только нужный кусок файла.
+    Индекс сохраняется на диск в index_dir и перестраивается при изменении mtime/size.
+    """
+
+    _MAGIC = b"LIDX0001"
+    _HEADER = struct.Struct("<8sqqq")
+
+    def __init__(self, index_dir: Path):
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self._loaded: dict[str, tuple[tuple[int, int, int], array]] = {}
+        self._lock = threading.Lock()
+
+        self.builds = 0
+        self.disk_loads = 0
+        self.ranged_reads = 0
+        self.bytes_mapped = 0
+
+    def _index_file(self, key: str) -> Path:
+        return self.index_dir / (hashlib.sha1(key.encode("utf-8")).hexdigest() + ".idx")
+
+    @staticmethod
+    def _build_offsets(data: bytes) -> array:
+        offsets = array("Q", [0])
+        if not data:
+            return offsets
+
+        if _EXTRA_LINE_BREAKS.search(data) is None:
+            # Быстрый путь: строки разделены только "\n"
+            pos = data.find(b"\n")
+            while pos != -1:
+                offsets.append(pos + 1)
+                pos = data.find(b"\n", pos + 1)
+            if offsets[-1] != len(data):
+                offsets.append(len(data))
+            return offsets
+
+        # Точный путь: повторяем семантику str.splitlines() (\r\n, \u2028 и т.д.)
+        position = 0
+        for line in data.decode("utf-8").splitlines(keepends=True):
+            position += len(line.encode("utf-8"))
+            offsets.append(position)
+        return offsets
+
+    def _load_persisted(self, index_file: Path, stamp: tuple[int, int]) -> array | None:
+        try:
+            raw = index_file.read_bytes()
+        except OSError:
+            return None
+        if len(raw) < self._HEADER.size:
+            return None
+
+        magic, mtime_ns, size, count = self._HEADER.unpack_from(raw)
+        if magic != self._MAGIC or (mtime_ns, size) != stamp:
+            return None
+
+        offsets = array("Q")
+        offsets.frombytes(raw[self._HEADER.size:])
+        if len(offsets) != count + 1:
+            return None
+        return offsets
+
+    def _persist(self, index_file: Path, stamp: tuple[int, int], offsets: array):
+        tmp_file = index_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_file, "wb") as f:
+                f.write(self._HEADER.pack(self._MAGIC, stamp[0], stamp[1], len(offsets) - 1))
+                f.write(offsets.tobytes())
+            os.replace(tmp_file, index_file)
+        except OSError:
+            tmp_file.unlink(missing_ok=True)
+
+    def get(self, path: Path) -> array:
+        """Возвращает смещения строк файла, при необходимости перестраивая индекс"""
+        key = str(path.resolve())
+        st = path.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            loaded = self._loaded.get(key)
+            if loaded is not None and loaded[0] == (*stamp, st.st_ino):
+                return loaded[1]
+
+        index_file = self._index_file(key)
+        offsets = self._load_persisted(index_file, stamp)
+        if offsets is not None:
+            with self._lock:
+                self.disk_loads += 1
+        else:
+            offsets = self._build_offsets(path.read_bytes())
+            self._persist(index_file, stamp, offsets)
+            with self._lock:
+                self.builds += 1
+
+        with self._lock:
+            self._loaded[key] = ((*stamp, st.st_ino), offsets)
+        return offsets
+
+    def read_lines(self, path: Path, start_line: int, end_line: int | None) -> tuple[list[str], int]:
+        """
+        Читает строки [start_line, end_line) (нумерация с 0) через mmap.
+        end_line=None - до конца файла. Возвращает строки и общее число строк в файле.
+        """
+        offsets = self.get(path)
+        total = len(offsets) - 1
+        end_line = total if end_line is None else min(end_line, total)
+        if start_line >= end_line:
+            return [], total
+
+        begin, end = offsets[start_line], offsets[end_line]
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            chunk = mapped[begin:end]
+
+        with self._lock:
+            self.ranged_reads += 1
+            self.bytes_mapped += end - begin
+        return chunk.decode("utf-8").splitlines(), total
+
+    def invalidate(self, path: Path):
+        key = str(path.resolve())
+        prefix = key.rstrip("/\\") + ("\\" if "\\" in key else "/")
+        with self._lock:
+            for loaded_key in [k for k in self._loaded if k == key or k.startswith(prefix)]:
+                del self._loaded[loaded_key]
+        self._index_file(key).unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "builds": self.builds,
+                "disk_loads": self.disk_loads,
+                "ranged_reads": self.ranged_reads,
+                "bytes_mapped": self.bytes_mapped,
+            }
+
+
+class ReadWriteLock:
+    """Блокировка читатели-писатель: параллельные чтения, эксклюзивная запись (писатели в приоритете)"""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+
+class InterProcessLock:
+    """Файловая блокировка между процессами (fcntl на POSIX, msvcrt на Windows)"""
+
+    def __init__(self, lock_path: Path):
+        self.lock_path = Path(lock_path)
+
+    @contextmanager
+    def hold(self, shared: bool = False):
+        with open(self.lock_path, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                # msvcrt не поддерживает разделяемые блокировки - всегда эксклюзивная
+                f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+                try:
+                    yield
+                finally:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class PathLocks:
+    """
+    Реестр блокировок по путям.
+
+    Внутри процесса - ReadWriteLock на каждый разрешённый путь.
+    При process_lock=True дополнительно берётся файловая блокировка в lock_dir,
+    чтобы несколько процессов могли работать с одной директорией памяти.
+    """
+
+    def __init__(self, lock_dir: Path, process_lock: bool = False):
+        self.lock_dir = Path(lock_dir)
+        self.process_lock = process_lock
+        if process_lock:
+            self.lock_dir.mkdir(parents=True, exist_ok=True)
+        self._locks: dict[str, ReadWriteLock] = {}
+        self._registry_lock = threading.Lock()
+
+    def _get(self, key: str) -> ReadWriteLock:
+        with self._registry_lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = ReadWriteLock()
+            return lock
+
+    def _process_lock(self, key: str) -> InterProcessLock:
+        return InterProcessLock(self.lock_dir / (hashlib.sha1(key.encode("utf-8")).hexdigest() + ".lock"))
+
+    @contextmanager
+    def read(self, path: Path):
+        key = str(path.resolve())
+        lock = self._get(key)
+        lock.acquire_read()
+        try:
+            if self.process_lock:
+                with self._process_lock(key).hold(shared=True):
+                    yield
+            else:
+                yield
+        finally:
+            lock.release_read()
+
+    @contextmanager
+    def write(self, *paths: Path):
+        # Сортировка ключей исключает взаимную блокировку при rename
+        keys = sorted({str(path.resolve()) for path in paths})
+        with ExitStack() as stack:
+            for key in keys:
+                lock = self._get(key)
+                lock.acquire_write()
+                stack.callback(lock.release_write)
+            if self.process_lock:
+                for key in keys:
+                    stack.enter_context(self._process_lock(key).hold())
+            yield
+
+
+# Права для новых файлов такие же, как у обычного open(): 0o666 с учётом umask
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def atomic_write_text(path: Path, text: str):
+    """Пишет текст во временный файл рядом с целевым и атомарно подменяет его через os.replace"""
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        try:
+            mode = path.stat().st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp_name, mode)
+        with open(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+class MemoryStorage(ABC):
+    """
+    Интерфейс хранилища под MemoryTool.
+
+    Ключи - относительные POSIX-пути внутри корня хранилища ("" - сам корень).
+    Проверку путей и правило read-only для /transcripts выполняет MemoryTool,
+    хранилище отвечает только за данные, блокировки и кэширование.
+    """
+
+    def __init__(self, cache: ContentCache, read_only: bool = False):
+        self.cache = cache
+        self.read_only = read_only
+
+    @abstractmethod
+    def kind(self, key: str) -> str | None:
+        """"file", "dir" или None, если пути нет"""
+
+    @abstractmethod
+    def list_dir(self, key: str) -> list[str]:
+        """Отсортированные имена в директории, поддиректории - с "/" в конце, скрытые - без"""
+
+    @abstractmethod
+    def read_text(self, key: str) -> str: ...
+
+    @abstractmethod
+    def read_numbered(self, key: str) -> str:
+        """Полное пронумерованное представление файла для view"""
+
+    @abstractmethod
+    def read_lines(self, key: str, start_line: int, end_line: int | None) -> list[str]:
+        """Строки [start_line, end_line) (нумерация с 0), end_line=None - до конца файла"""
+
+    @abstractmethod
+    def create(self, key: str, text: str):
+        """Создаёт файл; FileExistsError, если путь уже занят"""
+
+    @abstractmethod
+    def update(self, key: str, transform: Callable[[str], str]):
+        """Атомарно заменяет содержимое файла на transform(текущее); FileNotFoundError, если файла нет"""
+
+    @abstractmethod
+    def delete(self, key: str): ...
+
+    @abstractmethod
+    def rename(self, old_key: str, new_key: str): ...
+
+    def normalize_newlines(self, text: str) -> str:
+        """Текст в том виде, в каком он будет прочитан обратно после записи"""
+        return text
+
+    def stats(self) -> dict:
+        return {}
+
+
+class FileSystemStorage(MemoryStorage):
+    """Хранилище по умолчанию: обычные файлы в директории root"""
+
+    def __init__(self, root: Path, cache: ContentCache, line_index: LineIndex, locks: PathLocks, read_only: bool = False):
+        super().__init__(cache, read_only)
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.line_index = line_index
+        self.locks = locks
+
+    def _path(self, key: str) -> Path:
+        return self.root / key if key else self.root
+
+    @staticmethod
+    def _stamp(path: Path) -> Stamp:
+        # st_ino меняется при атомарной подмене файла другим процессом
+        st = path.stat()
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _cached(self, path: Path) -> tuple[str, Stamp, Callable[[], str]]:
+        return str(path.resolve()), self._stamp(path), lambda: path.read_text(encoding="utf-8")
+
+    def _invalidate(self, path: Path):
+        self.cache.invalidate(str(path.resolve()))
+        self.line_index.invalidate(path)
+
+    def normalize_newlines(self, text: str) -> str:
+        # read_text() открывает файл в режиме universal newlines
+        return text.replace("\r\n", "\n").replace("\r", "\n")
+
+    def kind(self, key: str) -> str | None:
+        path = self._path(key)
+        if path.is_dir():
+            return "dir"
+        if path.is_file():
+            return "file"
+        return None
+
+    def list_dir(self, key: str) -> list[str]:
+        items = []
+        for item in sorted(self._path(key).iterdir()):
+            if item.name.startswith("."):
+                continue
+            items.append(f"{item.name}/" if item.is_dir() else item.name)
+        return items
+
+    def read_text(self, key: str) -> str:
+        path = self._path(key)
+        with self.locks.read(path):
+            return self.cache.get_content(*self._cached(path))
+
+    def read_numbered(self, key: str) -> str:
+        path = self._path(key)
+        with self.locks.read(path):
+            return self.cache.get_numbered(*self._cached(path))
+
+    def read_lines(self, key: str, start_line: int, end_line: int | None) -> list[str]:
+        path = self._path(key)
+        with self.locks.read(path):
+            lines, _ = self.line_index.read_lines(path, start_line, end_line)
+            return lines
+
+    def create(self, key: str, text: str):
+        path = self._path(key)
+        with self.locks.write(path):
+            if path.exists():
+                raise FileExistsError(key)
+
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write_text(path, text)
+            self._invalidate(path)
+
+    def update(self, key: str, transform: Callable[[str], str]):
+        path = self._path(key)
+        with self.locks.write(path):
+            if not path.is_file():
+                raise FileNotFoundError(key)
+
+            content = self.cache.get_content(*self._cached(path))
+            atomic_write_text(path, transform(content))
+            self._invalidate(path)
+
+    def delete(self, key: str):
+        path = self._path(key)
+        with self.locks.write(path):
+            if not path.exists():
+                raise FileNotFoundError(key)
+
+            path.unlink()
+            self._invalidate(path)
+
+    def rename(self, old_key: str, new_key: str):
+        old_path, new_path = self._path(old_key), self._path(new_key)
+        with self.locks.write(old_path, new_path):
+            if not old_path.exists():
+                raise FileNotFoundError(old_key)
+
+            if new_path.exists():
+                raise FileExistsError(new_key)
+
+            new_path.parent.mkdir(parents=True, exist_ok=True)
+            old_path.rename(new_path)
+            self._invalidate(old_path)
+            self._invalidate(new_path)
+
+
+class SQLiteStorage(MemoryStorage):
+    """
+    Хранилище в SQLite (режим WAL): одна строка на файл или директорию.
+
+    Каждая строка хранит содержимое, номер версии и отметки времени создания/изменения.
+    Листинг директории - поиск по индексу (parent, name), запись - транзакция
+    BEGIN IMMEDIATE, поэтому read-modify-write атомарен и между процессами,
+    а читатели в WAL не блокируются писателями.
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS memories (
+        path TEXT PRIMARY KEY,
+        parent TEXT NOT NULL,
+        name TEXT NOT NULL,
+        is_dir INTEGER NOT NULL DEFAULT 0,
+        content TEXT,
+        size INTEGER NOT NULL DEFAULT 0,
+        version INTEGER NOT NULL DEFAULT 1,
+        created_at INTEGER NOT NULL,
+        updated_at INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS memories_by_parent ON memories (parent, name);
+    """
+
+    def __init__(self, db_path: Path, cache: ContentCache, read_only: bool = False, busy_timeout: float = 30.0):
+        super().__init__(cache, read_only)
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self._SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3.Connection нельзя разделять между потоками - по соединению на поток
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _split(key: str) -> tuple[str, str]:
+        parent, _, name = key.rpartition("/")
+        return parent, name
+
+    def _cache_key(self, key: str) -> str:
+        return f"sqlite:{self.db_path.resolve()}/{key}"
+
+    def _row_kind(self, conn: sqlite3.Connection, key: str) -> str | None:
+        if not key:
+            return "dir"
+        row = conn.execute("SELECT is_dir FROM memories WHERE path = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return "dir" if row[0] else "file"
+
+    def _cached(self, key: str) -> tuple[str, Stamp, Callable[[], str]]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT updated_at, size, version FROM memories WHERE path = ? AND is_dir = 0", (key,)
+        ).fetchone()
+        if row is None:
+            raise FileNotFoundError(key)
+
+        def load() -> str:
+            content = conn.execute("SELECT content FROM memories WHERE path = ?", (key,)).fetchone()
+            if content is None:
+                raise FileNotFoundError(key)
+            return content[0]
+
+        return self._cache_key(key), tuple(row), load
+
+    def _make_parents(self, conn: sqlite3.Connection, key: str, now: int):
+        parent, _ = self._split(key)
+        missing = []
+        while parent:
+            kind = self._row_kind(conn, parent)
+            if kind == "dir":
+                break
+            if kind == "file":
+                raise NotADirectoryError(parent)
+            missing.append(parent)
+            parent, _ = self._split(parent)
+
+        for directory in reversed(missing):
+            dir_parent, dir_name = self._split(directory)
+            conn.execute(
+                "INSERT INTO memories (path, parent, name, is_dir, created_at, updated_at) VALUES (?, ?, ?, 1, ?, ?)",
+                (directory, dir_parent, dir_name, now, now),
+            )
+
+    def kind(self, key: str) -> str | None:
+        return self._row_kind(self._conn(), key)
+
+    def list_dir(self, key: str) -> list[str]:
+        rows = self._conn().execute(
+            "SELECT name, is_dir FROM memories WHERE parent = ? ORDER BY name", (key,)
+        ).fetchall()
+        return [f"{name}/" if is_dir else name for name, is_dir in rows if not name.startswith(".")]
+
+    def read_text(self, key: str) -> str:
+        return self.cache.get_content(*self._cached(key))
+
+    def read_numbered(self, key: str) -> str:
+        return self.cache.get_numbered(*self._cached(key))
+
+    def read_lines(self, key: str, start_line: int, end_line: int | None) -> list[str]:
+        return self.read_text(key).splitlines()[start_line:end_line]
+
+    def create(self, key: str, text: str):
+        now = time.time_ns()
+        parent, name = self._split(key)
+        with self._write() as conn:
+            if self._row_kind(conn, key) is not None:
+                raise FileExistsError(key)
+
+            self._make_parents(conn, key, now)
+            conn.execute(
+                "INSERT INTO memories (path, parent, name, is_dir, content, size, created_at, updated_at) "
+                "VALUES (?, ?, ?, 0, ?, ?, ?, ?)",
+                (key, parent, name, text, len(text.encode("utf-8")), now, now),
+            )
+        self.cache.invalidate(self._cache_key(key))
+
+    def update(self, key: str, transform: Callable[[str], str]):
+        with self._write() as conn:
+            row = conn.execute("SELECT content FROM memories WHERE path = ? AND is_dir = 0", (key,)).fetchone()
+            if row is None:
+                raise FileNotFoundError(key)
+
+            new_content = transform(row[0])
+            conn.execute(
+                "UPDATE memories SET content = ?, size = ?, version = version + 1, updated_at = ? WHERE path = ?",
+                (new_content, len(new_content.encode("utf-8")), time.time_ns(), key),
+            )
+        self.cache.invalidate(self._cache_key(key))
+
+    def delete(self, key: str):
+        with self._write() as conn:
+            kind = self._row_kind(conn, key)
+            if kind is None:
+                raise FileNotFoundError(key)
+            if kind == "dir":
+                # Как и Path.unlink() в файловом хранилище - директории не удаляются
+                raise IsADirectoryError(key)
+
+            conn.execute("DELETE FROM memories WHERE path = ?", (key,))
+        self.cache.invalidate(self._cache_key(key))
+
+    def rename(self, old_key: str, new_key: str):
+        now = time.time_ns()
+        new_parent, new_name = self._split(new_key)
+        with self._write() as conn:
+            kind = self._row_kind(conn, old_key)
+            if kind is None or not old_key:
+                raise FileNotFoundError(old_key)
+
+            if self._row_kind(conn, new_key) is not None:
+                raise FileExistsError(new_key)
+
+            if kind == "dir" and new_key.startswith(old_key + "/"):
+                raise ValueError(f"Cannot move directory into itself: {old_key} -> {new_key}")
+
+            self._make_parents(conn, new_key, now)
+            conn.execute(
+                "UPDATE memories SET path = ?, parent = ?, name = ?, version = version + 1, updated_at = ? WHERE path = ?",
+                (new_key, new_parent, new_name, now, old_key),
+            )
+            if kind == "dir":
+                # Потомки: меняем префикс в path и parent одним запросом по диапазону ключей
+                old_prefix, new_prefix = old_key + "/", new_key + "/"
+                conn.execute(
+                    "UPDATE memories SET "
+                    "path = ? || substr(path, ?), "
+                    "parent = CASE WHEN parent = ? THEN ? ELSE ? || substr(parent, ?) END, "
+                    "version = version + 1, updated_at = ? "
+                    "WHERE path >= ? AND path < ?",
+                    (
+                        new_prefix, len(old_prefix) + 1,
+                        old_key, new_key, new_prefix, len(old_prefix) + 1,
+                        now, old_prefix, old_key + "0",
+                    ),
+                )
+        self.cache.invalidate(self._cache_key(old_key))
+        self.cache.invalidate(self._cache_key(new_key))
+
+    def stats(self) -> dict:
+        files, dirs, total_bytes = self._conn().execute(
+            "SELECT COALESCE(SUM(is_dir = 0), 0), COALESCE(SUM(is_dir), 0), COALESCE(SUM(size), 0) FROM memories"
+        ).fetchone()
+        return {"files": files, "dirs": dirs, "bytes": total_bytes}
@@ -11,8 +11,29 @@ from anthropic.types.beta import (
     BetaMemoryTool20250818RenameCommand,
     BetaMemoryTool20250818StrReplaceCommand,
 )
+from anthropic import beta_tool
 from typing_extensions import override
+from collections import defaultdict
 from pathlib import Path
+from fnmatch import fnmatchcase
+import functools
+import threading
+import time
+import json
+import re
+
+from MemoryStorage import (
+    ContentCache,
+    LineIndex,
+    PathLocks,
+    MemoryStorage,
+    FileSystemStorage,
+    SQLiteStorage,
+    number_lines,
+)
+from MemoryDocuments import HotDocuments
+from json_projection import ParsedJsonCache, project
+from token_budget import TokenLog, estimate_tokens
 
 MODEL = "claude-sonnet-4-5-20250929"
 
@@ -30,6 +51,7 @@ SYSTEM_PROMPT = """Правила работы с memory tool:
 - Поддерживай актуальность данных - удаляй устаревшую информацию, добавляй новые детали
 - Конечный ответ всегда должен быть записан в файле
 - Если требуется анализ большого объема данных - не делай выборочный анализ, а пройдись по всем данным без исключения. КАТЕГОРИЧЕСКИ запрещено пропускать какие-либо файлы для анализа
+- Большие файлы view отдаёт страницами: если результат заканчивается на [PAGE: ...], дочитай файл, вызвав view с указанным view_range
 
 ## 📝 ПРАВИЛА ИСПОЛЬЗОВАНИЯ КОМАНД:
 
@@ -99,16 +121,355 @@ print("Готово")
 
 **ЕСЛИ ВЫВЕДЕШЬ ХОТЬ ОДНУ ЗАПРЕЩЁННУЮ ФРАЗУ — ЭТО ОШИБКА!**"""
 
+# Дополняет SYSTEM_PROMPT, когда в tools передан memory.function_tools()
+FUNCTION_TOOLS_PROMPT = """
+
+## 🔎 ДОПОЛНИТЕЛЬНЫЕ ИНСТРУМЕНТЫ ЧТЕНИЯ
+
+### json_view(path, fields)
+Возвращает только нужные поля из JSON-файлов, без чтения всего файла.
+- path: файл или glob, например "/transcripts/*.json" или "/transcripts/meeting_101_*.json"
+- fields: пути через точку, `*` - любой ключ или элемент списка
+✅ Используй: когда нужны метаданные или оценки критериев (meeting_success, meeting_date, criteria.*, ...)
+❌ НЕ используй: когда нужен сам диалог встречи - для этого view
+
+**Пример:**
+json_view(path="/transcripts/*.json", fields=["metadata.meeting_success", "metadata.sales_managers.*.name", "criteria.*"])
+
+### view_many(paths, view_range, cursor)
+Показывает несколько файлов за ОДИН вызов (вместо отдельного view на каждый файл).
+- paths: список файлов и/или glob, например ["/transcripts/*.json"]; у элемента можно указать строки: "/transcripts/meeting_101_X.json:1-200"
+- Если результат не поместился, в конце будет cursor - вызови view_many с теми же paths и этим cursor, чтобы получить продолжение
+✅ Используй: когда нужно прочитать подряд много транскриптов или файлов
+❌ НЕ используй: для одного файла - для этого view
+
+**Пример:**
+view_many(paths=["/transcripts/meeting_10*.json"])"""
+
+VIEW_MANY_RANGE_RE = re.compile(r"^(?P<path>.+):(?P<start>\d+)-(?P<end>-?\d+)$")
+CURSOR_RE = re.compile(r"^(?P<file>\d+):(?P<line>\d+)$")
+
+
+class ToolCallStats:
+    """Счётчики вызовов инструментов: количество, ошибки, время, объём и оценка токенов результатов"""
+
+    def __init__(self, token_log: TokenLog | None = None):
+        self.token_log = token_log
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"calls": 0, "errors": 0, "total_ms": 0.0, "result_bytes": 0, "est_tokens": 0})
+
+    @staticmethod
+    def _target(args, kwargs):
+        """Путь или запрос вызова - для лога"""
+        for key in ("path", "paths", "query"):
+            if key in kwargs:
+                return kwargs[key]
+        if args:
+            return getattr(args[0], "path", None) or getattr(args[0], "old_path", None)
+        return None
+
+    def timed(self, name: str, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result, failed = None, True
+        try:
+            result = fn(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            text = result if isinstance(result, str) else ""
+            nbytes, tokens = len(text.encode("utf-8")), estimate_tokens(text)
+            with self._lock:
+                entry = self._stats[name]
+                entry["calls"] += 1
+                entry["errors"] += failed
+                entry["total_ms"] += elapsed
+                entry["result_bytes"] += nbytes
+                entry["est_tokens"] += tokens
+            if self.token_log:
+                self.token_log.write(
+                    tool=name, target=self._target(args, kwargs), est_tokens=tokens,
+                    bytes=nbytes, ms=round(elapsed, 2), error=failed,
+                )
+
+    def wrap(self, name: str, fn):
+        """Обёртка для функции-инструмента с сохранением сигнатуры (нужна beta_tool)"""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return self.timed(name, fn, *args, **kwargs)
+        return wrapper
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {name: dict(entry) for name, entry in sorted(self._stats.items())}
+
+
 class MemoryTool(BetaAbstractMemoryTool):
-    def __init__(self, base_path:str = "./memory"):
+    def __init__(
+        self,
+        base_path:str = "./memory",
+        cache_max_bytes: int = 128 * 1024 * 1024,
+        process_lock: bool = False,
+        backend: str = "filesystem",
+        sqlite_path: str | None = None,
+        hot_edit_threshold: int | None = 3,
+        flush_interval: float = 2.0,
+        view_many_max_bytes: int = 500_000,
+        view_many_max_tokens: int = 150_000,
+        page_tokens: int | None = 60_000,
+        token_log_path: str | None = None,
+    ):
         super().__init__()
         self.base_path = Path(base_path)
         self.memories_dir = self.base_path / "memories"
         self.transcripts_dir = self.base_path / "transcripts"
-        
+
         self.memories_dir.mkdir(parents=True, exist_ok=True)
         self.transcripts_dir.mkdir(parents=True, exist_ok=True)
-        
+
+        self.cache = ContentCache(max_bytes=cache_max_bytes)
+        self.line_index = LineIndex(self.base_path / ".line_index")
+        self.locks = PathLocks(self.base_path / ".locks", process_lock=process_lock)
+
+        # /transcripts всегда читаются с диска, хранилище /memories выбирается через backend
+        self.transcripts_storage = FileSystemStorage(
+            self.transcripts_dir, self.cache, self.line_index, self.locks, read_only=True
+        )
+        if backend == "filesystem":
+            self.memories_storage: MemoryStorage = FileSystemStorage(
+                self.memories_dir, self.cache, self.line_index, self.locks
+            )
+        elif backend == "sqlite":
+            db_path = Path(sqlite_path) if sqlite_path else self.base_path / "memories.sqlite3"
+            self.memories_storage = SQLiteStorage(db_path, self.cache)
+        else:
+            raise ValueError(f"Unknown memory backend: {backend}")
+
+        # Часто редактируемые файлы правятся в памяти и сбрасываются с задержкой (write-behind).
+        # С process_lock=True файл могут менять другие процессы, поэтому правки идут сразу в хранилище
+        self.documents = None
+        if hot_edit_threshold and not process_lock:
+            self.documents = HotDocuments(self.memories_storage, hot_edit_threshold, flush_interval)
+
+        self.json_cache = ParsedJsonCache()
+        self.view_many_max_bytes = view_many_max_bytes
+        self.view_many_max_tokens = view_many_max_tokens
+        # Результат view больше page_tokens (оценка) отдаётся страницами; None - без ограничения
+        self.page_tokens = page_tokens
+        self.call_stats = ToolCallStats(TokenLog(token_log_path) if token_log_path else None)
+
+    def function_tools(self) -> list:
+        """Инструменты поверх хранилища, которые передаются в tools вместе с самим MemoryTool"""
+        return [
+            beta_tool(self.call_stats.wrap("json_view", self.json_view)),
+            beta_tool(self.call_stats.wrap("view_many", self.view_many)),
+        ]
+
+    @override
+    def execute(self, command: BetaMemoryTool20250818Command):
+        return self.call_stats.timed(command.command, super().execute, command)
+
+    def flush(self):
+        """Сбрасывает в хранилище все правки горячих файлов"""
+        if self.documents:
+            self.documents.flush()
+
+    def close(self):
+        """Завершение сессии: сбрасывает правки и останавливает фоновый сброс"""
+        if self.documents:
+            self.documents.close()
+
+    def cache_stats(self) -> dict:
+        stats = {**self.cache.stats(), "line_index": self.line_index.stats()}
+        if self.documents:
+            stats["hot_documents"] = self.documents.stats()
+        return stats
+
+    def _hot_document(self, storage: MemoryStorage, key: str):
+        if self.documents and storage is self.memories_storage:
+            return self.documents.get(key)
+        return None
+
+    def _read_text(self, storage: MemoryStorage, key: str) -> str:
+        """Текущее содержимое файла с учётом ещё не сброшенных правок"""
+        doc = self._hot_document(storage, key)
+        if doc is not None:
+            with doc.lock:
+                return doc.rope.text()
+        return storage.read_text(key)
+
+    def _read_lines(self, storage: MemoryStorage, key: str, start_line: int, end_line: int | None) -> list[str]:
+        """Строки [start_line, end_line) с учётом ещё не сброшенных правок"""
+        doc = self._hot_document(storage, key)
+        if doc is not None:
+            with doc.lock:
+                return [line.splitlines()[0] for line in doc.rope.lines(start_line, end_line)]
+        return storage.read_lines(key, start_line, end_line)
+
+    def _paginate(self, lines: list[str], start_line: int, open_ended: bool) -> str:
+        """
+        Первая страница строк в пределах page_tokens. Курсор продолжения - view_range
+        следующей страницы, т.к. схема команды view фиксирована.
+        """
+        used = shown = 0
+        for i, line in enumerate(lines):
+            line_tokens = estimate_tokens(line) + 3  # + номер строки и перевод строки
+            if used + line_tokens > self.page_tokens and shown:
+                break
+            used += line_tokens
+            shown += 1
+
+        page = number_lines(lines[:shown], start_line + 1)
+        if shown == len(lines):
+            return page
+
+        first, last = start_line + 1, start_line + len(lines)
+        next_range = [first + shown, -1 if open_ended else last]
+        return (
+            f"{page}\n\n[PAGE: lines {first}-{first + shown - 1} of {first}-{last}, ~{used} tokens "
+            f"(page budget {self.page_tokens}). To continue call view with view_range={next_range}]"
+        )
+
+    def _glob(self, path: str) -> list[tuple[str, MemoryStorage, str]]:
+        """Раскрывает glob (`*`, `?`, `[...]` в любых компонентах пути) в список (путь, хранилище, ключ) файлов"""
+        storage, key, _ = self._resolve(path)
+        root = path.split("/")[1]
+
+        if not any(ch in key for ch in "*?["):
+            return [(path, storage, key)] if storage.kind(key) == "file" else []
+
+        candidates = [""]
+        for part in key.split("/"):
+            next_candidates = []
+            for prefix in candidates:
+                if not any(ch in part for ch in "*?["):
+                    next_candidates.append(f"{prefix}/{part}".lstrip("/"))
+                    continue
+                if storage.kind(prefix) != "dir":
+                    continue
+                for item in storage.list_dir(prefix):
+                    name = item.rstrip("/")
+                    if fnmatchcase(name, part):
+                        next_candidates.append(f"{prefix}/{name}".lstrip("/"))
+            candidates = next_candidates
+
+        return [(f"/{root}/{k}", storage, k) for k in candidates if storage.kind(k) == "file"]
+
+    def json_view(self, path: str, fields: list[str]) -> str:
+        """Return selected fields of JSON files in memory, one compact JSON line per file.
+
+        Args:
+            path: A file such as /transcripts/meeting_101_Client.json or a glob such as /transcripts/*.json
+            fields: Dot-separated field paths; * matches any key or list item, e.g. metadata.meeting_success, metadata.sales_managers.*.name, criteria.*
+        """
+        if not fields:
+            raise ValueError("fields must contain at least one field path")
+
+        files = self._glob(path)
+        if not files:
+            raise FileNotFoundError(f"No files match: {path}")
+
+        lines = []
+        for file_path, storage, key in files:
+            try:
+                document = self.json_cache.get(file_path, self._read_text(storage, key))
+            except json.JSONDecodeError as e:
+                lines.append(f"{key}: ERROR invalid JSON ({e})")
+                continue
+            lines.append(f"{key}: {json.dumps(project(document, fields), ensure_ascii=False)}")
+
+        return f"{len(files)} file(s) matched {path}\n" + "\n".join(lines)
+
+    def _expand_many(self, paths: list[str], view_range: list[int] | None) -> tuple[list[tuple], list[str]]:
+        """Раскрывает paths в упорядоченный список (путь, хранилище, ключ, диапазон) без повторов"""
+        files, missing, seen = [], [], set()
+        for item in paths:
+            match = VIEW_MANY_RANGE_RE.match(item)
+            if match:
+                path, item_range = match["path"], [int(match["start"]), int(match["end"])]
+            else:
+                path, item_range = item, view_range
+
+            matched = self._glob(path)
+            if not matched:
+                missing.append(path)
+            for file_path, storage, key in matched:
+                if (file_path, tuple(item_range or ())) not in seen:
+                    seen.add((file_path, tuple(item_range or ())))
+                    files.append((file_path, storage, key, item_range))
+        return files, missing
+
+    def view_many(self, paths: list[str], view_range: list[int] | None = None, cursor: str | None = None) -> str:
+        """View several files in one call, with line numbers like view. Large results are cut at a size budget and end with a cursor for the next call.
+
+        Args:
+            paths: Files and/or globs, e.g. ["/transcripts/*.json"]; an item may end with :START-END to show only those lines, e.g. /transcripts/meeting_101_Client.json:1-200
+            view_range: Optional [start, end] line range for items without their own range (end -1 means to the end of the file)
+            cursor: Cursor from a previous truncated view_many result; pass the same paths again
+        """
+        files, missing = self._expand_many(paths, view_range)
+        if not files:
+            raise FileNotFoundError(f"No files match: {', '.join(paths)}")
+
+        first_file, first_line = 0, None
+        if cursor:
+            match = CURSOR_RE.match(cursor.strip())
+            if not match or int(match["file"]) >= len(files):
+                raise ValueError(f"Invalid cursor: {cursor!r}. Pass the cursor exactly as returned, with the same paths")
+            first_file, first_line = int(match["file"]), int(match["line"])
+
+        budget, token_budget = self.view_many_max_bytes, self.view_many_max_tokens
+        parts = [f"view_many: {len(files)} file(s)" + (f", continuing from file {first_file + 1}" if cursor else "")]
+        parts.extend(f"==== {path}: not found ====" for path in missing if not cursor)
+        used = sum(len(part.encode("utf-8")) + 1 for part in parts)
+        tokens = sum(estimate_tokens(part) for part in parts)
+        next_cursor = None
+        any_shown = False
+
+        for index in range(first_file, len(files)):
+            file_path, storage, key, item_range = files[index]
+            start = max(1, item_range[0]) if item_range else 1
+            end = None if not item_range or item_range[1] == -1 else item_range[1]
+            if index == first_file and first_line:
+                start = max(start, first_line)
+
+            try:
+                lines = self._read_lines(storage, key, start - 1, end)
+            except Exception as e:
+                parts.append(f"==== {file_path}: cannot read ({e}) ====")
+                continue
+
+            used += len(file_path.encode("utf-8")) + 32
+            tokens += estimate_tokens(file_path) + 8
+            shown = 0
+            for line in lines:
+                size, line_tokens = len(line.encode("utf-8")) + 8, estimate_tokens(line) + 3
+                # Хотя бы одна строка за вызов, чтобы продолжение всегда продвигалось
+                if (used + size > budget or tokens + line_tokens > token_budget) and (shown or any_shown):
+                    break
+                used += size
+                tokens += line_tokens
+                shown += 1
+
+            if shown == 0 and lines:
+                next_cursor = f"{index}:{start}"
+                break
+            parts.append(f"==== {file_path} ({f'lines {start}-{start + shown - 1}' if lines else 'no lines'}) ====")
+            if lines:
+                parts.append(number_lines(lines[:shown], start))
+            any_shown = True
+            if shown < len(lines):
+                next_cursor = f"{index}:{start + shown}"
+                break
+
+        if next_cursor:
+            parts.append(
+                f"\n[TRUNCATED at ~{used} bytes / ~{tokens} tokens. To continue call view_many with the same paths and cursor=\"{next_cursor}\"]"
+            )
+        else:
+            parts.append(f"\n[END of {len(files)} file(s)]")
+        return "\n".join(parts)
+
     def _validate_path(self, path: str) -> tuple[Path, bool]:
         if path.startswith("/memories"):
             relative_path = path[len("/memories"):].lstrip("/")
@@ -130,18 +491,23 @@ class MemoryTool(BetaAbstractMemoryTool):
             raise ValueError(f"Path {path} would escape allowed directory") from e
         
         return full_path, read_only
+
+    def _resolve(self, path: str) -> tuple[MemoryStorage, str, bool]:
+        """Проверяет путь и возвращает (хранилище, ключ внутри него, read_only)"""
+        full_path, read_only = self._validate_path(path)
+        root = self.transcripts_dir if read_only else self.memories_dir
+        key = full_path.resolve().relative_to(root.resolve()).as_posix()
+        storage = self.transcripts_storage if read_only else self.memories_storage
+        return storage, "" if key == "." else key, read_only
     
     @override
     def view(self, command: BetaMemoryTool20250818ViewCommand) -> str:
-        full_path, _ = self._validate_path(command.path)
+        storage, key, _ = self._resolve(command.path)
+        kind = storage.kind(key)
 
-        if full_path.is_dir():
-            items = []
+        if kind == "dir":
             try:
-                for item in sorted(full_path.iterdir()):
-                    if item.name.startswith("."):
-                        continue
-                    items.append(f"{item.name}/" if item.is_dir() else item.name)
+                items = storage.list_dir(key)
                 
                 if not items:
                     return f"Directory: {command.path}\n(пустая директория)"
@@ -150,22 +516,27 @@ class MemoryTool(BetaAbstractMemoryTool):
             except Exception as e:
                 raise RuntimeError(f"Cannot read directory {command.path}: {e}") from e
                 
-        elif full_path.is_file():
+        elif kind == "file":
             try:
-                content = full_path.read_text(encoding="utf-8")
-                lines = content.splitlines()
                 view_range = command.view_range
-                
-                if view_range:
-                    start_line = max(1, view_range[0]) - 1
-                    end_line = len(lines) if view_range[1] == -1 else view_range[1]
-                    lines = lines[start_line:end_line]
-                    start_num = start_line + 1
-                else:
-                    start_num = 1
-
-                numbered_lines = [f"{i + start_num:4d}: {line}" for i, line in enumerate(lines)]
-                return "\n".join(numbered_lines)
+
+                if not view_range:
+                    doc = self._hot_document(storage, key)
+                    if doc is not None:
+                        with doc.lock:
+                            numbered = doc.rope.numbered()
+                    else:
+                        numbered = storage.read_numbered(key)
+                    if self.page_tokens is None or estimate_tokens(numbered) <= self.page_tokens:
+                        return numbered
+                    return self._paginate(self._read_lines(storage, key, 0, None), 0, open_ended=True)
+
+                start_line = max(1, view_range[0]) - 1
+                end_line = None if view_range[1] == -1 else view_range[1]
+                lines = self._read_lines(storage, key, start_line, end_line)
+                if self.page_tokens is None:
+                    return number_lines(lines, start_line + 1)
+                return self._paginate(lines, start_line, open_ended=end_line is None)
             except Exception as e:
                 raise RuntimeError(f"Cannot read file {command.path}: {e}") from e
         else:
@@ -173,7 +544,7 @@ class MemoryTool(BetaAbstractMemoryTool):
         
     @override
     def create(self, command: BetaMemoryTool20250818CreateCommand) -> str:
-        full_path, read_only = self._validate_path(command.path)
+        storage, key, read_only = self._resolve(command.path)
         
         if read_only:
             raise PermissionError(f"Cannot create files in /transcripts directory: {command.path}")
@@ -181,84 +552,99 @@ class MemoryTool(BetaAbstractMemoryTool):
         if command.file_text is None:
             #raise ValueError(f"file_text cannot be None when creating file: {command.path}")
             command.file_text = "[PLACEHOLDER FOR command.file_text AS TEXT WAS NONE]"
-        
-        if full_path.exists():
-            raise FileExistsError(f"File already exists: {command.path}")
-            
-        full_path.parent.mkdir(parents=True, exist_ok=True)
 
         if not isinstance(command.file_text, str):
             raise TypeError(f"file_text must be str, got {type(command.file_text).__name__}")
 
-        full_path.write_text(command.file_text, encoding="utf-8")
+        try:
+            storage.create(key, command.file_text)
+        except FileExistsError as e:
+            raise FileExistsError(f"File already exists: {command.path}") from e
         return f"File created successfully at {command.path}"
     
     @override
     def delete(self, command: BetaMemoryTool20250818DeleteCommand) -> str:
-        full_path, read_only = self._validate_path(command.path)
+        storage, key, read_only = self._resolve(command.path)
         
         if read_only:
             raise PermissionError(f"Cannot delete files in /transcripts directory: {command.path}")
-        
-        if not full_path.exists():
-            raise FileNotFoundError(f"File not found: {command.path}")
-            
-        full_path.unlink()
+
+        try:
+            if self.documents and storage is self.memories_storage:
+                self.documents.delete(key, lambda: storage.delete(key))
+            else:
+                storage.delete(key)
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"File not found: {command.path}") from e
         return f"File deleted successfully: {command.path}"
 
     @override
     def insert(self, command: BetaMemoryTool20250818InsertCommand) -> str:
-        full_path, read_only = self._validate_path(command.path)
+        storage, key, read_only = self._resolve(command.path)
         
         if read_only:
             raise PermissionError(f"Cannot modify files in /transcripts directory: {command.path}")
         
-        if not full_path.is_file():
-            raise FileNotFoundError(f"File not found: {command.path}")
-        
         if command.insert_text is None:
             #raise ValueError(f"insert_text cannot be None for insert operation in {command.path}")
             command.insert_text = "[PLACEHOLDER FOR command.insert_text AS TEXT WAS NONE]"
-            
-        content = full_path.read_text(encoding="utf-8")
-        lines = content.splitlines(keepends=True)
-        
+
         insert_line = command.insert_line
-        if insert_line < 0 or insert_line > len(lines):
-            raise ValueError(f"Invalid insert_line: {insert_line}")
-            
-        lines.insert(insert_line, command.insert_text + "\n")
-        full_path.write_text("".join(lines), encoding="utf-8")
+
+        def apply_insert(content: str) -> str:
+            lines = content.splitlines(keepends=True)
+
+            if insert_line < 0 or insert_line > len(lines):
+                raise ValueError(f"Invalid insert_line: {insert_line}")
+
+            lines.insert(insert_line, command.insert_text + "\n")
+            return "".join(lines)
+
+        def apply_insert_in_place(rope):
+            if insert_line < 0 or insert_line > rope.line_count():
+                raise ValueError(f"Invalid insert_line: {insert_line}")
+
+            rope.insert(insert_line, command.insert_text + "\n")
+
+        try:
+            if self.documents:
+                self.documents.edit(key, apply_insert_in_place, apply_insert)
+            else:
+                storage.update(key, apply_insert)
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"File not found: {command.path}") from e
         return f"Content inserted at line {insert_line} in {command.path}"
 
     @override
     def rename(self, command: BetaMemoryTool20250818RenameCommand) -> str:
-        old_path, read_only = self._validate_path(command.old_path)
+        storage, old_key, read_only = self._resolve(command.old_path)
         
         if read_only:
             raise PermissionError(f"Cannot rename files in /transcripts directory: {command.old_path}")
-        
-        if not old_path.exists():
-            raise FileNotFoundError(f"File not found: {command.old_path}")
-            
-        new_path, _ = self._validate_path(command.new_path)
-        
-        if new_path.exists():
-            raise FileExistsError(f"Target path already exists: {command.new_path}")
-            
-        old_path.rename(new_path)
+
+        _, new_key, new_read_only = self._resolve(command.new_path)
+
+        if new_read_only:
+            raise PermissionError(f"Cannot move files into /transcripts directory: {command.new_path}")
+
+        if self.documents:
+            self.documents.release(old_key)
+
+        try:
+            storage.rename(old_key, new_key)
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"File not found: {command.old_path}") from e
+        except FileExistsError as e:
+            raise FileExistsError(f"Target path already exists: {command.new_path}") from e
         return f"File renamed from {command.old_path} to {command.new_path}"
 
     @override
     def str_replace(self, command: BetaMemoryTool20250818StrReplaceCommand) -> str:
-        full_path, read_only = self._validate_path(command.path)
+        storage, key, read_only = self._resolve(command.path)
         
         if read_only:
             raise PermissionError(f"Cannot modify files in /transcripts directory: {command.path}")
 
-        if not full_path.is_file():
-            raise FileNotFoundError(f"File not found: {command.path}")
-        
         if command.old_str is None or command.new_str is None:
             if command.old_str is None:
                 raise ValueError(f"old_str cannot be None for str_replace in {command.path}")
@@ -267,16 +653,32 @@ class MemoryTool(BetaAbstractMemoryTool):
 
         if command.old_str == "":
             raise ValueError(f"old_str cannot be an empty string! Use insert() instead to add content.")
-        
-        content = full_path.read_text(encoding="utf-8")
-        count = content.count(command.old_str)
-        
-        if count == 0:
-            raise ValueError(f"Text not found in {command.path}. old_str: {repr(command.old_str[:50])}")
-        elif count > 1:
-            raise ValueError(f"Text appears {count} times in {command.path}. old_str must be unique. Found: {repr(command.old_str[:50])}")
 
-        new_content = content.replace(command.old_str, command.new_str)
-        full_path.write_text(new_content, encoding="utf-8")
+        def check_unique(content: str):
+            count = content.count(command.old_str)
+
+            if count == 0:
+                raise ValueError(f"Text not found in {command.path}. old_str: {repr(command.old_str[:50])}")
+            elif count > 1:
+                raise ValueError(f"Text appears {count} times in {command.path}. old_str must be unique. Found: {repr(command.old_str[:50])}")
+
+        def apply_replace(content: str) -> str:
+            check_unique(content)
+            return content.replace(command.old_str, command.new_str)
+
+        def apply_replace_in_place(rope):
+            # Поиск по блокам документа: весь текст собирается только для сообщения об ошибке
+            positions = rope.find(command.old_str, limit=2)
+            if len(positions) != 1:
+                check_unique(rope.text())
+            rope.replace_at(positions[0], len(command.old_str), command.new_str)
+
+        try:
+            if self.documents:
+                self.documents.edit(key, apply_replace_in_place, apply_replace)
+            else:
+                storage.update(key, apply_replace)
+        except FileNotFoundError as e:
+            raise FileNotFoundError(f"File not found: {command.path}") from e
         
         return f"File {command.path} has been edited"
\ No newline at end of file
@@ -0,0 +1,386 @@
+from typing import Any
+import threading
+import asyncio
+import random
+import json
+import time
+
+import httpx
+
+from token_budget import estimate_tokens
+
+# Ответы, после которых запрос повторяется: лимит (429) и перегрузка API (529)
+THROTTLE_STATUSES = (429, 529)
+RETRY_STATUSES = THROTTLE_STATUSES + (500, 502, 503, 504)
+
+# Заголовки остатка лимитов в ответах API -> корзина RateLimiter
+RATELIMIT_HEADERS = {
+    "anthropic-ratelimit-requests-remaining": "requests",
+    "anthropic-ratelimit-input-tokens-remaining": "input_tokens",
+    "anthropic-ratelimit-output-tokens-remaining": "output_tokens",
+}
+
+# Пауза между проверками, когда все слоты параллельности заняты
+SLOT_POLL = 0.05
+
+
+class TokenBucket:
+    """Корзина на per_minute единиц, пополняется равномерно; баланс может уйти в минус (долг за фактический расход)"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Секунды до появления amount единиц (запрос больше ёмкости ждёт полную корзину)"""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= amount
+
+    def limit_to(self, remaining: float, now: float):
+        """Сверка с остатком, который сообщил сервер"""
+        self._refill(now)
+        self.tokens = min(self.tokens, remaining)
+
+
+class RateLimiter:
+    """
+    Общий планировщик запросов к API для всех потоков и event loop'ов процесса.
+
+    Перед запросом ждёт места в корзинах запросов и входных токенов (оценка по телу запроса)
+    и свободного слота параллельности. После ответа списывает фактические токены из usage
+    и сверяется с заголовками anthropic-ratelimit-*-remaining. Параллельность подбирается AIMD:
+    +1/limit за успешный ответ, вдвое меньше после 429/529. Повторы - по retry-after или
+    экспоненциальной паузе с джиттером.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 50,
+        input_tokens_per_minute: float = 30_000,
+        output_tokens_per_minute: float = 8_000,
+        max_concurrency: int = 10,
+        min_concurrency: int = 1,
+        max_retries: int = 8,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.buckets = {
+            "requests": TokenBucket(requests_per_minute),
+            "input_tokens": TokenBucket(input_tokens_per_minute),
+            "output_tokens": TokenBucket(output_tokens_per_minute),
+        }
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._lock = threading.Lock()
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        # Пока идёт пауза retry-after, новые запросы тоже не отправляются
+        self.paused_until = 0.0
+
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.waited = 0.0
+
+    @staticmethod
+    def estimate(request: httpx.Request) -> int:
+        """Оценка входных токенов запроса по телу (system, tools, messages)"""
+        try:
+            content = request.content
+        except httpx.RequestNotRead:
+            return 0
+        return estimate_tokens(content.decode("utf-8", "replace")) if content else 0
+
+    def _try_acquire(self, input_tokens: int) -> float:
+        """0 - слот и токены взяты, иначе сколько ждать до следующей попытки"""
+        now = time.monotonic()
+        with self._lock:
+            wait = max(
+                self.paused_until - now,
+                self.buckets["requests"].wait_time(1, now),
+                self.buckets["input_tokens"].wait_time(input_tokens, now),
+                self.buckets["output_tokens"].wait_time(1, now),
+            )
+            if wait <= 0 and self.in_flight >= int(self.concurrency):
+                wait = SLOT_POLL
+            if wait > 0:
+                self.waited += wait
+                return wait
+            self.in_flight += 1
+            self.requests += 1
+            self.buckets["requests"].take(1, now)
+            self.buckets["input_tokens"].take(input_tokens, now)
+            return 0.0
+
+    def acquire(self, input_tokens: int):
+        while (wait := self._try_acquire(input_tokens)) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, input_tokens: int):
+        while (wait := self._try_acquire(input_tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def release(self, estimated_input: int, response: httpx.Response | None, usage: dict | None = None) -> float | None:
+        """
+        Освобождает слот и учитывает ответ. Возвращает паузу перед повтором, если ответ -
+        ограничение (429/529), иначе None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            if usage:
+                actual_input = sum(usage.get(k) or 0 for k in ("input_tokens", "cache_creation_input_tokens"))
+                self.buckets["input_tokens"].take(actual_input - estimated_input, now)
+                self.buckets["output_tokens"].take(usage.get("output_tokens") or 0, now)
+            if response is not None:
+                for header, bucket in RATELIMIT_HEADERS.items():
+                    if header in response.headers:
+                        try:
+                            self.buckets[bucket].limit_to(float(response.headers[header]), now)
+                        except ValueError:
+                            pass
+
+            if response is not None and response.status_code in THROTTLE_STATUSES:
+                self.throttled += 1
+                self.concurrency = max(float(self.min_concurrency), self.concurrency / 2)
+                retry_after = _retry_after(response)
+                if retry_after is not None:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                    return retry_after
+                return None
+            if response is not None and response.status_code < 400:
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1 / self.concurrency)
+            return None
+
+    def backoff(self, attempt: int, retry_after: float | None = None) -> float:
+        """retry-after сервера или экспоненциальная пауза с полным джиттером"""
+        self.retries += 1
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "concurrency": round(self.concurrency, 2),
+                "waited_seconds": round(self.waited, 2),
+            }
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _usage(response: httpx.Response) -> dict | None:
+    """usage из JSON-ответа; usage потоковых ответов собирает _SSEUsage по мере чтения"""
+    if not response.headers.get("content-type", "").startswith("application/json"):
+        return None
+    try:
+        usage: Any = json.loads(response.content).get("usage")
+    except (ValueError, AttributeError):
+        return None
+    return usage if isinstance(usage, dict) else None
+
+
+class _SSEUsage:
+    """usage из событий SSE: message_start (входные токены), message_delta (итоговые выходные)"""
+
+    def __init__(self):
+        self.buffer = b""
+        self.usage: dict = {}
+
+    def feed(self, chunk: bytes):
+        self.buffer += chunk
+        *lines, self.buffer = self.buffer.split(b"\n")
+        for line in lines:
+            if not line.startswith(b"data:"):
+                continue
+            try:
+                event = json.loads(line[5:])
+            except ValueError:
+                continue
+            if not isinstance(event, dict):
+                continue
+            if event.get("type") == "message_start":
+                usage = (event.get("message") or {}).get("usage")
+            elif event.get("type") == "message_delta":
+                usage = event.get("usage")
+            else:
+                continue
+            if isinstance(usage, dict):
+                # В message_delta счётчики накопительные - последнее значение итоговое
+                self.usage.update({key: value for key, value in usage.items() if value is not None})
+
+
+class _SlotRelease:
+    """Однократное освобождение слота: по концу потока или по закрытию ответа, что случится раньше"""
+
+    def __init__(self, limiter: RateLimiter, estimated: int, response: httpx.Response):
+        self.limiter = limiter
+        self.estimated = estimated
+        self.response = response
+        self.usage = _SSEUsage()
+        self._lock = threading.Lock()
+        self._released = False
+
+    def __call__(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.limiter.release(self.estimated, self.response, self.usage.usage or None)
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    def __init__(self, stream, release: _SlotRelease):
+        self.stream = stream
+        self.release = release
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self.release.usage.feed(chunk)
+            yield chunk
+        self.release()
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release: _SlotRelease):
+        self.stream = stream
+        self.release = release
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.release.usage.feed(chunk)
+            yield chunk
+        self.release()
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self.release()
+
+
+def _holding_slot(limiter: RateLimiter, estimated: int, request: httpx.Request, response: httpx.Response,
+                  stream_cls) -> httpx.Response:
+    """Потоковый ответ занимает слот параллельности, пока его читают; фактический usage - из событий SSE"""
+    return httpx.Response(
+        response.status_code,
+        headers=response.headers,
+        stream=stream_cls(response.stream, _SlotRelease(limiter, estimated, response)),
+        extensions=response.extensions,
+        request=request,
+    )
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """httpx-транспорт синхронного клиента: каждый запрос проходит через RateLimiter, повторы - здесь же"""
+
+    def __init__(self, limiter: RateLimiter, transport: httpx.BaseTransport | None = None):
+        self.limiter = limiter
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        estimated = self.limiter.estimate(request)
+        for attempt in range(self.limiter.max_retries + 1):
+            self.limiter.acquire(estimated)
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                self.limiter.release(estimated, None)
+                if attempt == self.limiter.max_retries:
+                    raise
+                time.sleep(self.limiter.backoff(attempt))
+                continue
+            except BaseException:
+                self.limiter.release(estimated, None)
+                raise
+
+            if response.status_code in RETRY_STATUSES and attempt < self.limiter.max_retries:
+                response.read()
+                response.close()
+                retry_after = self.limiter.release(estimated, response)
+                time.sleep(self.limiter.backoff(attempt, retry_after))
+                continue
+
+            if not response.headers.get("content-type", "").startswith("application/json"):
+                return _holding_slot(self.limiter, estimated, request, response, _ReleasingStream)
+            response.read()
+            self.limiter.release(estimated, response, _usage(response))
+            return response
+        raise AssertionError("unreachable")
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """То же для AsyncAnthropic: ожидание лимитов не блокирует event loop"""
+
+    def __init__(self, limiter: RateLimiter, transport: httpx.AsyncBaseTransport | None = None):
+        self.limiter = limiter
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        estimated = self.limiter.estimate(request)
+        for attempt in range(self.limiter.max_retries + 1):
+            await self.limiter.acquire_async(estimated)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError:
+                self.limiter.release(estimated, None)
+                if attempt == self.limiter.max_retries:
+                    raise
+                await asyncio.sleep(self.limiter.backoff(attempt))
+                continue
+            except BaseException:
+                # Отмена задачи (дедлайн вопроса) - слот освобождается
+                self.limiter.release(estimated, None)
+                raise
+
+            if response.status_code in RETRY_STATUSES and attempt < self.limiter.max_retries:
+                await response.aread()
+                await response.aclose()
+                retry_after = self.limiter.release(estimated, response)
+                await asyncio.sleep(self.limiter.backoff(attempt, retry_after))
+                continue
+
+            if not response.headers.get("content-type", "").startswith("application/json"):
+                return _holding_slot(self.limiter, estimated, request, response, _AsyncReleasingStream)
+            await response.aread()
+            self.limiter.release(estimated, response, _usage(response))
+            return response
+        raise AssertionError("unreachable")
+
+    async def aclose(self):
+        await self.transport.aclose()
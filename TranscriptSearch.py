@@ -0,0 +1,337 @@
+from anthropic import beta_tool
+from collections import defaultdict, Counter
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from itertools import islice
+from pathlib import Path
+import unicodedata
+import threading
+import sqlite3
+import math
+import re
+
+from MemoryStorage import number_lines
+
+# Дополняет системный промпт, когда в tools передан index.search_tool()
+SEARCH_TOOL_PROMPT = """
+
+### search(query, file_glob, max_results)
+Полнотекстовый поиск по /transcripts/ с учётом словоформ (клиенту/клиентов/клиент находятся одним запросом).
+Возвращает лучшие фрагменты с номерами строк - их можно сразу дочитать через view с view_range.
+✅ Используй: чтобы найти, где упоминается участник, клиент или тема, вместо просмотра файлов целиком
+- file_glob сужает поиск, например "meeting_101_*.json"
+
+**Пример:**
+search(query="бюджет на пилот", file_glob="*.json", max_results=10)"""
+
+# Версия токенизации и стемминга: при её изменении индекс перестраивается с нуля
+INDEX_VERSION = "1"
+
+TOKEN_RE = re.compile(r"\w+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    lines INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    file_id INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, file_id, line)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_postings_file ON postings(file_id);
+"""
+
+
+# ----- Стеммер Портера (Snowball) для русского языка -----
+
+_VOWELS = frozenset("аеиоуыэюя")
+
+_PERFECTIVE_GERUND = (("в", "вши", "вшись"), ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись"))
+_ADJECTIVE = ("ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем", "им", "ым", "ом",
+              "его", "ого", "ему", "ому", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею")
+_PARTICIPLE = (("ем", "нн", "вш", "ющ", "щ"), ("ивш", "ывш", "ующ"))
+_REFLEXIVE = ("ся", "сь")
+_VERB = (("ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет", "ют", "ны", "ть", "ешь", "нно"),
+         ("ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил", "ыл", "им", "ым", "ен",
+          "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт", "ены", "ить", "ыть", "ишь", "ую", "ю"))
+_NOUN = ("а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии", "и", "ией", "ей", "ой", "ий", "й",
+         "иям", "ям", "ием", "ем", "ам", "ом", "о", "у", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю", "ия", "ья", "я")
+_SUPERLATIVE = ("ейше", "ейш")
+_DERIVATIONAL = ("ость", "ост")
+
+
+def _strip_suffix(word: str, groups: tuple) -> str | None:
+    """
+    Ищет самое длинное окончание среди групп; окончания первой группы (если групп две)
+    должны идти после "а" или "я". Возвращает слово без окончания или None.
+    """
+    if isinstance(groups[0], str):
+        groups = ((), groups)
+    best, needs_a = "", False
+    for needs, endings in zip((True, False), groups):
+        for ending in endings:
+            if len(ending) > len(best) and word.endswith(ending):
+                best, needs_a = ending, needs
+    if not best:
+        return None
+    if needs_a and (len(word) == len(best) or word[-len(best) - 1] not in "ая"):
+        return None
+    return word[:-len(best)]
+
+
+def _r2_start(word: str) -> int:
+    """Начало области R2 (нумерация внутри word)"""
+    r1 = next((i + 1 for i in range(1, len(word)) if word[i] not in _VOWELS and word[i - 1] in _VOWELS), len(word))
+    return next((i + 1 for i in range(r1 + 1, len(word)) if word[i] not in _VOWELS and word[i - 1] in _VOWELS), len(word))
+
+
+@lru_cache(maxsize=200_000)
+def stem(word: str) -> str:
+    """Основа русского слова по алгоритму Snowball; прочие слова возвращаются без изменений"""
+    rv_start = next((i + 1 for i, ch in enumerate(word) if ch in _VOWELS), len(word))
+    prefix, rv = word[:rv_start], word[rv_start:]
+    if not rv:
+        return word
+    r2 = max(0, _r2_start(word) - rv_start)
+
+    # Шаг 1
+    result = _strip_suffix(rv, _PERFECTIVE_GERUND)
+    if result is None:
+        if rv.endswith(_REFLEXIVE):
+            rv = rv[:-2]
+        result = _strip_suffix(rv, _ADJECTIVE)
+        if result is not None:
+            # ADJECTIVAL: перед окончанием прилагательного может стоять суффикс причастия
+            participle = _strip_suffix(result, _PARTICIPLE)
+            result = result if participle is None else participle
+        else:
+            result = _strip_suffix(rv, _VERB)
+            if result is None:
+                result = _strip_suffix(rv, _NOUN)
+    rv = rv if result is None else result
+
+    # Шаг 2
+    if rv.endswith("и"):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательное окончание только внутри R2
+    for ending in _DERIVATIONAL:
+        if rv.endswith(ending) and len(rv) - len(ending) >= r2:
+            rv = rv[:-len(ending)]
+            break
+
+    # Шаг 4
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    else:
+        for ending in _SUPERLATIVE:
+            if rv.endswith(ending):
+                rv = rv[:-len(ending)]
+                if rv.endswith("нн"):
+                    rv = rv[:-1]
+                break
+        else:
+            if rv.endswith("ь"):
+                rv = rv[:-1]
+
+    return prefix + rv
+
+
+def normalize(text: str) -> str:
+    """NFKC + casefold + ё -> е"""
+    return unicodedata.normalize("NFKC", text).casefold().replace("ё", "е")
+
+
+def terms(text: str) -> list[str]:
+    """Термы индекса: нормализованные токены, приведённые к основе"""
+    return [stem(token) for token in TOKEN_RE.findall(normalize(text))]
+
+
+class TranscriptSearch:
+    """
+    Персистентный инвертированный индекс по строкам файлов /transcripts.
+
+    Постинги (терм, файл, строка, tf) хранятся в SQLite; sync() переиндексирует только
+    новые и изменённые файлы. Номера строк совпадают с нумерацией view, поэтому найденный
+    фрагмент можно сразу открыть через view_range.
+    """
+
+    def __init__(self, memory, db_path: str | None = None, context_lines: int = 1, snippet_chars: int = 300):
+        self.memory = memory
+        self.transcripts_dir = Path(memory.transcripts_dir)
+        self.db_path = Path(db_path) if db_path else Path(memory.base_path) / "transcripts_index.sqlite3"
+        self.context_lines = context_lines
+        self.snippet_chars = snippet_chars
+
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+        self.searches = 0
+
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if version is None or version[0] != INDEX_VERSION:
+                conn.execute("DELETE FROM postings")
+                conn.execute("DELETE FROM files")
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (INDEX_VERSION,))
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        return conn
+
+    def sync(self) -> dict:
+        """Индексирует новые и изменённые файлы, удаляет исчезнувшие"""
+        with self._sync_lock, sqlite3.connect(self.db_path) as conn:
+            known = {name: (file_id, mtime_ns, size) for file_id, name, mtime_ns, size in
+                     conn.execute("SELECT file_id, name, mtime_ns, size FROM files")}
+            seen = set()
+            indexed = postings = 0
+
+            for path in sorted(p for p in self.transcripts_dir.rglob("*") if p.is_file()):
+                name = path.relative_to(self.transcripts_dir).as_posix()
+                if any(part.startswith(".") for part in name.split("/")):
+                    continue
+                seen.add(name)
+                st = path.stat()
+                previous = known.get(name)
+                if previous and previous[1:] == (st.st_mtime_ns, st.st_size):
+                    continue
+
+                try:
+                    lines = path.read_text(encoding="utf-8").splitlines()
+                except UnicodeDecodeError as e:
+                    print(f"[WARN] TranscriptSearch: skipping {name}: {e}")
+                    continue
+
+                if previous:
+                    conn.execute("DELETE FROM postings WHERE file_id = ?", (previous[0],))
+                    conn.execute("DELETE FROM files WHERE file_id = ?", (previous[0],))
+                file_id = conn.execute(
+                    "INSERT INTO files (name, mtime_ns, size, lines) VALUES (?, ?, ?, ?)",
+                    (name, st.st_mtime_ns, st.st_size, len(lines)),
+                ).lastrowid
+
+                rows = [
+                    (term, file_id, line_no, tf)
+                    for line_no, line in enumerate(lines, start=1)
+                    for term, tf in Counter(terms(line)).items()
+                ]
+                conn.executemany("INSERT INTO postings (term, file_id, line, tf) VALUES (?, ?, ?, ?)", rows)
+                indexed += 1
+                postings += len(rows)
+
+            removed = [file_id for name, (file_id, _, _) in known.items() if name not in seen]
+            for file_id in removed:
+                conn.execute("DELETE FROM postings WHERE file_id = ?", (file_id,))
+                conn.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+
+            total = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+        return {"indexed": indexed, "postings": postings, "removed": len(removed), "files": total}
+
+    def _rank(self, query_terms: list[str], file_glob: str, names: set[str] | None = None) -> list[tuple[float, str, int, int, set]]:
+        """Фрагменты (score, файл, первая строка, последняя строка, найденные термы) по убыванию score"""
+        conn = self._conn()
+        files = {file_id: (name, lines) for file_id, name, lines in conn.execute("SELECT file_id, name, lines FROM files")
+                 if fnmatchcase(name, file_glob) and (names is None or name in names)}
+        total_lines = sum(lines for _, lines in files.values()) or 1
+
+        # BM25 без нормализации по длине: строки транскриптов близки по размеру
+        k1 = 1.2
+        hits: dict[tuple[int, int], tuple[float, set]] = defaultdict(lambda: (0.0, set()))
+        idf = {}
+        for term in set(query_terms):
+            postings = [row for row in conn.execute("SELECT file_id, line, tf FROM postings WHERE term = ?", (term,))
+                        if row[0] in files]
+            if not postings:
+                continue
+            idf[term] = math.log(1 + (total_lines - len(postings) + 0.5) / (len(postings) + 0.5))
+            for file_id, line, tf in postings:
+                score, matched = hits[(file_id, line)]
+                hits[(file_id, line)] = (score + idf[term] * tf * (k1 + 1) / (tf + k1), matched | {term})
+
+        # Соседние совпадения (через context_lines строк) объединяются в один фрагмент
+        by_file = defaultdict(list)
+        for (file_id, line), (score, matched) in hits.items():
+            by_file[file_id].append((line, score, matched))
+
+        fragments = []
+        gap = 2 * self.context_lines + 1
+        for file_id, lines in by_file.items():
+            name, line_count = files[file_id]
+            lines.sort()
+            window = [lines[0]]
+            for item in lines[1:] + [None]:
+                if item is not None and item[0] - window[-1][0] <= gap:
+                    window.append(item)
+                    continue
+                matched = set().union(*(m for _, _, m in window))
+                score = sum(s for _, s, _ in window) + sum(idf[t] for t in matched)
+                start = max(1, window[0][0] - self.context_lines)
+                end = min(line_count, window[-1][0] + self.context_lines)
+                fragments.append((score, name, start, end, matched))
+                window = [item]
+
+        fragments.sort(key=lambda f: (-f[0], f[1], f[2]))
+        return fragments
+
+    def search(self, query: str, file_glob: str = "*", max_results: int = 10) -> str:
+        """Full-text search over /transcripts that matches Russian word forms. Returns the best fragments with line numbers (use view with view_range to read more).
+
+        Args:
+            query: Words to look for, e.g. a participant, client or topic
+            file_glob: Limit the search to matching transcript files, e.g. meeting_101_*.json
+            max_results: Maximum number of fragments to return
+        """
+        query_terms = terms(query)
+        if not query_terms:
+            raise ValueError(f"Query has no searchable words: {query!r}")
+
+        self.searches += 1
+        fragments = self._rank(query_terms, file_glob)
+        if not fragments:
+            return f'No matches for "{query}"'
+
+        max_results = max(1, min(max_results, 50))
+        parts = [f'Found {len(fragments)} fragment(s) for "{query}", showing top {min(max_results, len(fragments))}']
+        parts.extend(self._format(fragments[:max_results], len(set(query_terms))))
+        return "\n".join(parts)
+
+    def excerpts(self, query_terms: list[str], names: set[str], max_results: int = 6, require: str | None = None) -> list[str]:
+        """
+        Лучшие фрагменты только из файлов names (для предзагрузки в запрос, без счётчика searches).
+        require - подстрока, которая должна быть хотя бы в одной строке фрагмента.
+        """
+        if not query_terms or not names:
+            return []
+        fragments = self._rank(query_terms, "*", names)
+        if require is not None:
+            storage = self.memory.transcripts_storage
+            fragments = (f for f in fragments if any(require in line for line in storage.read_lines(f[1], f[2] - 1, f[3])))
+        return self._format(list(islice(fragments, max_results)), len(set(query_terms)))
+
+    def _format(self, fragments: list[tuple[float, str, int, int, set]], term_count: int) -> list[str]:
+        parts = []
+        storage = self.memory.transcripts_storage
+        for rank, (score, name, start, end, matched) in enumerate(fragments, start=1):
+            lines = storage.read_lines(name, start - 1, end)
+            lines = [line if len(line) <= self.snippet_chars else line[:self.snippet_chars] + " …" for line in lines]
+            parts.append(
+                f"\n[{rank}] /transcripts/{name} lines {start}-{end} (score {score:.1f}, matched {len(matched)}/{term_count})\n"
+                + number_lines(lines, start)
+            )
+        return parts
+
+    def search_tool(self):
+        """search как инструмент для tool_runner"""
+        return beta_tool(self.search)
@@ -0,0 +1,594 @@
+"""
+Детерминированная сборка /memories/analytics_db.json из JSON-транскриптов.
+
+Все числа (счётчики, индексы, конверсии, корреляции, аномалии) считаются локально
+по схеме из CREATE_ANALYTICS_DATABASE_PROMPT. LLM заполняет только текстовые поля
+key_insights (см. NARRATIVE_FIELDS и merge_narrative).
+
+update_analytics_db() ведёт манифест транскриптов (sha256 содержимого) и вливает в
+сохранённые агрегаты только добавленные, изменённые и удалённые встречи, и держит рядом
+колоночный CriteriaStore для векторных расчётов по критериям и ConversionCube для срезов
+конверсии по нескольким измерениям.
+"""
+from pathlib import Path
+import hashlib
+import math
+import json
+import time
+
+from ConversionCube import ConversionCube
+from CriteriaStore import CriteriaStore
+from criteria_stats import criteria_significance
+from MemoryStorage import atomic_write_text
+from meeting_records import SCORE_CRITERIA, TASK_CRITERION, meeting_record
+from transcript_stream import extract_sections
+
+STATUS_GROUPS = {
+    "да": "successful_meetings",
+    "нет": "unsuccessful_meetings",
+    "непонятно": "neutral_meetings",
+}
+
+TASK_CLASSES = {
+    1: ("without_task", "Клиент БЕЗ задачи (пришел посмотреть)"),
+    2: ("with_task", "Клиент С ЧЕТКОЙ задачей"),
+    3: ("insufficient_data", "Недостаточно данных для определения"),
+}
+
+# Индекс в analytics_db.json -> поле записи о встрече
+INDEX_FIELDS = {
+    "by_sales_manager": "manager_group",
+    "by_acquisition_channel_type": "acquisition_channel_type",
+    "by_acquisition_channel_name": "acquisition_channel_name",
+    "by_client_status": "client_status",
+    "by_industry": "client_industry",
+    "by_year_month": "month",
+}
+
+# Индексы, по которым ведутся счётчики конверсии
+CONVERSION_INDEXES = ["by_sales_manager", "by_acquisition_channel_type", "by_year_month"]
+
+# Текстовые поля, которые пишет LLM: путь внутри key_insights -> пустое значение
+NARRATIVE_FIELDS = {
+    ("channel_performance", "note"): "",
+    ("seasonal_trends", "note"): "",
+    ("critical_success_factors",): [],
+    ("common_failure_patterns",): [],
+}
+
+TOP_CORRELATIONS = 3
+# Ресэмплы для доверительных интервалов и p-value в criteria_correlations
+SIGNIFICANCE_RESAMPLES = 2000
+MAX_ANOMALIES = 5
+MIN_PAIR_MEETINGS = 3
+
+STATE_VERSION = 1
+
+
+def _percent(part: int, total: int) -> float:
+    return round(100.0 * part / total, 2) if total else 0.0
+
+
+def pearson(xs: list[float], ys: list[float]) -> float | None:
+    """Коэффициент Пирсона; None, если данных меньше трёх или одна из выборок постоянна"""
+    n = len(xs)
+    return _pearson_from_sums(n, sum(xs), sum(x * x for x in xs), sum(ys), sum(y * y for y in ys),
+                              sum(x * y for x, y in zip(xs, ys)))
+
+
+def _pearson_from_sums(n, sx, sxx, sy, syy, sxy) -> float | None:
+    if n < 3:
+        return None
+    var_x = n * sxx - sx * sx
+    var_y = n * syy - sy * sy
+    if var_x <= 0 or var_y <= 0:
+        return None
+    return (n * sxy - sx * sy) / math.sqrt(var_x * var_y)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    low, high = math.floor(position), math.ceil(position)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def _scores(record: dict) -> tuple[float | None, float | None]:
+    """(total_score, average_score) из overall_summary, иначе - по критериям-оценкам"""
+    if record["total_score"] is not None and record["average_score"] is not None:
+        return record["total_score"], record["average_score"]
+    values = [record["criteria"][name] for name in SCORE_CRITERIA if isinstance(record["criteria"][name], (int, float))]
+    if not values:
+        return None, None
+    return sum(values), round(sum(values) / len(values), 2)
+
+
+def _compact(record: dict) -> dict:
+    """Минимальная JSON-совместимая строка о встрече: всё, что нужно для агрегатов и их вычитания"""
+    members = set((record["manager_group"] or "").split(" + "))
+    activity = [a for name, a in record["managers"] if name in members and isinstance(a, (int, float))]
+    total_score, average_score = _scores(record)
+    return {
+        "meeting_id": record["meeting_id"],
+        "file": record["file"],
+        "meeting_date": record["meeting_date"],
+        "meeting_success": record["meeting_success"],
+        "is_success": record["is_success"],
+        "client_name": record["client_name"],
+        # Активность группы на встрече - сумма активности её участников
+        "group_activity": sum(activity) if activity else None,
+        "index": {index: record[field] for index, field in INDEX_FIELDS.items()},
+        "task": record["criteria"][TASK_CRITERION],
+        "scores": {
+            name: record["criteria"][name] for name in SCORE_CRITERIA
+            if isinstance(record["criteria"][name], (int, float))
+        },
+        "total_score": total_score,
+        "average_score": average_score,
+    }
+
+
+class AnalyticsAccumulator:
+    """
+    Агрегаты analytics_db.json с поддержкой add()/remove() по одной встрече.
+
+    Счётчики статусов и индексов, конверсии по месяцам/менеджерам/каналам и суммы для
+    корреляций критериев (n, Σx, Σx², Σy, Σxy) обновляются за O(число критериев).
+    finalize() формирует JSON; date_range и аномалии (перцентили) считаются по компактным
+    строкам в памяти, без чтения файлов.
+    """
+
+    def __init__(self):
+        self.rows: dict[int, dict] = {}
+        self.status: dict[str, set[int]] = {group: set() for group in STATUS_GROUPS.values()}
+        self.tasks: dict[int, set[int]] = {value: set() for value in TASK_CLASSES}
+        self.indexes: dict[str, dict[str, set[int]]] = {index: {} for index in INDEX_FIELDS}
+        # index -> key -> [successful, activity_sum, activity_n]
+        self.conversion: dict[str, dict[str, list[float]]] = {index: {} for index in CONVERSION_INDEXES}
+        # criterion -> [n, Σx, Σx², Σy, Σxy]; y = is_success, поэтому Σy² = Σy
+        self.sums: dict[str, list[float]] = {name: [0, 0, 0, 0, 0] for name in SCORE_CRITERIA}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, record: dict):
+        row = _compact(record)
+        if row["meeting_id"] in self.rows:
+            self.remove(row["meeting_id"])
+        self.rows[row["meeting_id"]] = row
+        self._apply(row, 1)
+
+    def remove(self, meeting_id: int):
+        row = self.rows.pop(meeting_id, None)
+        if row is not None:
+            self._apply(row, -1)
+
+    def add_file(self, path: Path) -> dict:
+        record = meeting_record(extract_sections(path)[0], path.name)
+        self.add(record)
+        return record
+
+    def _apply(self, row: dict, sign: int):
+        meeting_id, success = row["meeting_id"], row["is_success"]
+        update = set.add if sign > 0 else set.discard
+
+        update(self.status[STATUS_GROUPS.get(row["meeting_success"], "neutral_meetings")], meeting_id)
+        if row["task"] in self.tasks:
+            update(self.tasks[row["task"]], meeting_id)
+
+        for index, key in row["index"].items():
+            if not key:
+                continue
+            ids = self.indexes[index].setdefault(key, set())
+            update(ids, meeting_id)
+            if not ids:
+                del self.indexes[index][key]
+
+            if index in self.conversion:
+                counters = self.conversion[index].setdefault(key, [0, 0, 0])
+                counters[0] += sign * success
+                if row["group_activity"] is not None:
+                    counters[1] += sign * row["group_activity"]
+                    counters[2] += sign
+                if key not in self.indexes[index]:
+                    del self.conversion[index][key]
+
+        for name, x in row["scores"].items():
+            sums = self.sums[name]
+            sums[0] += sign
+            sums[1] += sign * x
+            sums[2] += sign * x * x
+            sums[3] += sign * success
+            sums[4] += sign * x * success
+
+    def to_state(self) -> dict:
+        """Агрегаты и компактные строки в JSON-совместимом виде"""
+        sorted_ids = lambda ids: sorted(ids)
+        return {
+            "rows": [self.rows[i] for i in sorted(self.rows)],
+            "status": {group: sorted_ids(ids) for group, ids in self.status.items()},
+            "tasks": {str(value): sorted_ids(ids) for value, ids in self.tasks.items()},
+            "indexes": {index: {key: sorted_ids(ids) for key, ids in keys.items()} for index, keys in self.indexes.items()},
+            "conversion": self.conversion,
+            "sums": self.sums,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "AnalyticsAccumulator":
+        accumulator = cls()
+        accumulator.rows = {row["meeting_id"]: row for row in state["rows"]}
+        accumulator.status.update({group: set(ids) for group, ids in state["status"].items()})
+        accumulator.tasks.update({int(value): set(ids) for value, ids in state["tasks"].items()})
+        accumulator.indexes.update({
+            index: {key: set(ids) for key, ids in keys.items()} for index, keys in state["indexes"].items()
+        })
+        accumulator.conversion.update(state["conversion"])
+        accumulator.sums.update(state["sums"])
+        return accumulator
+
+    def finalize(self, store: CriteriaStore | None = None, significance_cache: str | Path | None = None) -> dict:
+        """
+        analytics_db.json; если передан CriteriaStore по тем же встречам, добавляются criteria_averages,
+        а корреляции - бутстрэп-интервалами и перестановочными p-value (seed фиксирован,
+        результат кэшируется в significance_cache, см. cached_significance)
+        """
+        total = len(self.rows)
+        successful = len(self.status["successful_meetings"])
+
+        dates = [row["meeting_date"] for row in self.rows.values() if row["meeting_date"]]
+        database_info = {
+            "total_meetings": total,
+            "date_range": {"start": min(dates, default=""), "end": max(dates, default="")},
+        }
+        for group, ids in self.status.items():
+            database_info[group] = {"count": len(ids), "meeting_ids": sorted(ids)}
+        database_info["conversion_rate"] = _percent(successful, total)
+        database_info["last_updated"] = time.strftime("%Y-%m-%d %H:%M:%S")
+
+        database_info["client_task_classification_statistics"] = {
+            key: {
+                "value": value,
+                "description": description,
+                "count": len(self.tasks[value]),
+                "meeting_ids": sorted(self.tasks[value]),
+                "percentage": _percent(len(self.tasks[value]), total),
+            }
+            for value, (key, description) in TASK_CLASSES.items()
+        }
+
+        db = {
+            "database_info": database_info,
+            "indexes": {
+                index: {key: sorted(ids) for key, ids in sorted(keys.items())} for index, keys in self.indexes.items()
+            },
+            "conversion_by_month": {
+                month: {
+                    "total": len(ids),
+                    "successful": self.conversion["by_year_month"][month][0],
+                    "conversion": self._conversion("by_year_month", month),
+                    "meeting_ids": sorted(ids),
+                }
+                for month, ids in sorted(self.indexes["by_year_month"].items())
+            },
+            "conversion_by_manager": {
+                group: {
+                    "total_meetings": len(ids),
+                    "successful": self.conversion["by_sales_manager"][group][0],
+                    "conversion": self._conversion("by_sales_manager", group),
+                    "average_activity": self._average_activity(group),
+                    "meeting_ids": sorted(ids),
+                }
+                for group, ids in sorted(self.indexes["by_sales_manager"].items())
+            },
+            "criteria_correlations": self._correlations(),
+        }
+        if store is not None:
+            significance = cached_significance(store, significance_cache)
+            correlations = db["criteria_correlations"]
+            for entry in correlations["highest_correlation_with_success"] + correlations["lowest_correlation_with_success"]:
+                stats = significance[entry["criterion"]]
+                entry.update(ci_95=[stats["ci_low"], stats["ci_high"]], p_value=stats["p_value"])
+            task = significance[TASK_CRITERION]
+            correlations["client_task_classification_association"] = {
+                "cramers_v": task["statistic"],
+                "ci_95": [task["ci_low"], task["ci_high"]],
+                "p_value": task["p_value"],
+                "conversion_by_class": task["conversion_by_class"],
+            }
+            db["criteria_averages"] = criteria_averages(store)
+        db["anomalies"] = self._anomalies()
+        db["key_insights"] = self._key_insights()
+        return db
+
+    def _conversion(self, index: str, key: str) -> float:
+        return _percent(self.conversion[index][key][0], len(self.indexes[index][key]))
+
+    def _average_activity(self, group: str) -> float | None:
+        _, activity_sum, activity_n = self.conversion["by_sales_manager"][group]
+        return round(activity_sum / activity_n, 2) if activity_n else None
+
+    def _correlations(self) -> dict:
+        """Точечно-бисериальная корреляция (Пирсон с бинарным успехом) для критериев-оценок"""
+        rows = []
+        for name, (n, sx, sxx, sy, sxy) in self.sums.items():
+            r = _pearson_from_sums(n, sx, sxx, sy, sy, sxy)
+            if r is None:
+                continue
+            note = f"n={n}"
+            if 0 < sy < n:
+                note += f", среднее у успешных {sxy / sy:.2f} vs {(sx - sxy) / (n - sy):.2f} у остальных"
+            rows.append({"criterion": name, "correlation": round(r, 4), "note": note})
+
+        rows.sort(key=lambda row: row["correlation"], reverse=True)
+        return {
+            "highest_correlation_with_success": rows[:TOP_CORRELATIONS],
+            "lowest_correlation_with_success": list(reversed(rows[-TOP_CORRELATIONS:])) if rows else [],
+        }
+
+    def _anomalies(self) -> dict:
+        """Провалы с оценкой не ниже 75-го перцентиля и успехи с оценкой не выше 25-го"""
+        scored = [row for row in self.rows.values() if row["average_score"] is not None]
+        if len(scored) < 4:
+            return {"high_scores_but_failed": [], "low_scores_but_succeeded": []}
+
+        averages = [row["average_score"] for row in scored]
+        high, low = _percentile(averages, 0.75), _percentile(averages, 0.25)
+
+        def entry(row, reason):
+            return {
+                "meeting_id": row["meeting_id"],
+                "client": row["client_name"],
+                "total_score": row["total_score"],
+                "average_score": row["average_score"],
+                "status": row["index"]["by_client_status"],
+                "reason": reason,
+            }
+
+        failed = sorted(
+            (r for r in scored if r["meeting_success"] == "нет" and r["average_score"] >= high),
+            key=lambda r: (-r["average_score"], r["meeting_id"]),
+        )
+        succeeded = sorted(
+            (r for r in scored if r["meeting_success"] == "да" and r["average_score"] <= low),
+            key=lambda r: (r["average_score"], r["meeting_id"]),
+        )
+        return {
+            "high_scores_but_failed": [
+                entry(r, f"average_score {r['average_score']} ≥ 75-го перцентиля ({high:.2f}), meeting_success = нет")
+                for r in failed[:MAX_ANOMALIES]
+            ],
+            "low_scores_but_succeeded": [
+                entry(r, f"average_score {r['average_score']} ≤ 25-го перцентиля ({low:.2f}), meeting_success = да")
+                for r in succeeded[:MAX_ANOMALIES]
+            ],
+        }
+
+    def _key_insights(self) -> dict:
+        def task_conversion(value):
+            ids = self.tasks[value]
+            return _percent(len(ids & self.status["successful_meetings"]), len(ids))
+
+        def ranked(index):
+            return [(key, self._conversion(index, key), len(ids)) for key, ids in sorted(self.indexes[index].items())]
+
+        pairs = [p for p in ranked("by_sales_manager") if " + " in p[0] and p[2] >= MIN_PAIR_MEETINGS]
+        best_pair = max(pairs, key=lambda p: (p[1], p[2]), default=("", 0.0, 0))
+        worst_pair = min(pairs, key=lambda p: (p[1], -p[2]), default=("", 0.0, 0))
+        best_channel = max(ranked("by_acquisition_channel_type"), key=lambda p: p[1], default=("", 0.0, 0))
+        best_month = max(ranked("by_year_month"), key=lambda p: p[1], default=("", 0.0, 0))
+
+        return {
+            "client_task_classification_impact": {
+                "without_task_conversion": task_conversion(1),
+                "with_task_conversion": task_conversion(2),
+            },
+            "manager_performance": {"best_pair": best_pair[0], "conversion": best_pair[1], "meetings": best_pair[2]},
+            "worst_pair": {"pair": worst_pair[0], "conversion": worst_pair[1], "meetings": worst_pair[2]},
+            "channel_performance": {"best": best_channel[0], "note": ""},
+            "seasonal_trends": {"best_month": best_month[0], "conversion": best_month[1], "note": ""},
+            "critical_success_factors": [],
+            "common_failure_patterns": [],
+        }
+
+
+def cached_significance(store: CriteriaStore, cache_path: str | Path | None = None) -> dict:
+    """
+    criteria_significance с кэшем в cache_path по хэшу оценок и исходов встреч: seed фиксирован,
+    поэтому при тех же данных результат тот же и ресэмплы не пересчитываются
+    """
+    key = hashlib.sha256(f"{SIGNIFICANCE_RESAMPLES}\n".encode())
+    key.update(store.columns["criteria"].tobytes())
+    key.update(store.success.tobytes())
+    key = key.hexdigest()
+    if cache_path is not None:
+        try:
+            cached = json.loads(Path(cache_path).read_text(encoding="utf-8"))
+            if cached.get("key") == key:
+                return cached["significance"]
+        except (OSError, json.JSONDecodeError, KeyError):
+            pass
+
+    significance = criteria_significance(store, n_boot=SIGNIFICANCE_RESAMPLES, n_perm=SIGNIFICANCE_RESAMPLES)
+    if cache_path is not None:
+        atomic_write_text(cache_path, json.dumps({"key": key, "significance": significance}, ensure_ascii=False))
+    return significance
+
+
+def criteria_averages(store: CriteriaStore) -> dict:
+    """Средние оценки критериев по группам встреч (client_task_classification - категория, см. database_info)"""
+    means = store.means_by_status()
+    return {group: means.get(status, {}) for status, group in
+            [("да", "successful_meetings"), ("нет", "unsuccessful_meetings"), ("непонятно", "neutral_meetings")]}
+
+
+def build_analytics_db(transcripts_dir: str = "./memory/transcripts") -> dict:
+    """Полная пересборка: читает из транскриптов только нужные разделы и собирает analytics_db"""
+    accumulator = AnalyticsAccumulator()
+    for path in sorted(Path(transcripts_dir).glob("*.json")):
+        try:
+            accumulator.add_file(path)
+        except (json.JSONDecodeError, UnicodeDecodeError, AttributeError) as e:
+            print(f"[WARN] analytics_builder: skipping {path.name}: {e}")
+    return accumulator.finalize(CriteriaStore.from_rows(accumulator.rows.values()))
+
+
+def load_state(state_path: str | Path = "./memory/analytics_state.json") -> tuple[dict, AnalyticsAccumulator]:
+    """(манифест, накопитель) из сохранённого состояния; пустые, если состояния нет или формат устарел"""
+    state_path = Path(state_path)
+    try:
+        state = json.loads(state_path.read_text(encoding="utf-8"))
+        if state.get("version") == STATE_VERSION:
+            return state["manifest"], AnalyticsAccumulator.from_state(state["accumulator"])
+    except (OSError, json.JSONDecodeError, KeyError) as e:
+        if state_path.exists():
+            print(f"[WARN] analytics_builder: rebuilding state from scratch: {e}")
+    return {}, AnalyticsAccumulator()
+
+
+def update_analytics_db(
+    transcripts_dir: str = "./memory/transcripts",
+    state_path: str | Path = "./memory/analytics_state.json",
+    store_dir: str | Path = "./memory/criteria_store",
+    cube_path: str | Path = "./memory/conversion_cube.json",
+) -> tuple[dict, dict]:
+    """
+    Инкрементальное обновление по манифесту {file: sha256, mtime_ns, size, meeting_id}.
+
+    Файлы с прежними (mtime_ns, size) не открываются, с прежним sha256 - не меняют агрегаты;
+    изменённые, удалённые и переставшие разбираться встречи вычитаются из агрегатов, новые - добавляются.
+    CriteriaStore в store_dir и ConversionCube в cube_path пересобираются из строк состояния
+    только при изменениях, значимость критериев кэшируется в store_dir/significance.json.
+    Возвращает (analytics_db, статистику обновления). Состояние и store лежат вне /memories,
+    поэтому через MemoryTool не видны.
+    """
+    state_path = Path(state_path)
+    manifest, accumulator = load_state(state_path)
+
+    # meeting_id, чьи строки убраны вместе с файлом; их может заявлять другой файл (дубликат id)
+    orphans = set()
+    added_ids = set()
+
+    def forget(file):
+        entry = manifest.pop(file)
+        row = accumulator.rows.get(entry["meeting_id"])
+        if row is not None and row["file"] == file:
+            accumulator.remove(entry["meeting_id"])
+            orphans.add(entry["meeting_id"])
+
+    stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "failed": 0}
+    seen = set()
+    for path in sorted(Path(transcripts_dir).glob("*.json")):
+        file = path.name
+        seen.add(file)
+        st = path.stat()
+        previous = manifest.get(file)
+        if previous and (previous["mtime_ns"], previous["size"]) == (st.st_mtime_ns, st.st_size):
+            stats["unchanged"] += 1
+            continue
+
+        # Один проход по файлу: хэш всего содержимого, разбор только нужных разделов
+        hasher = hashlib.sha256()
+        try:
+            record = meeting_record(extract_sections(path, hasher=hasher)[0], file)
+        except (json.JSONDecodeError, UnicodeDecodeError, AttributeError) as e:
+            print(f"[WARN] analytics_builder: skipping {file}: {e}")
+            stats["failed"] += 1
+            # Прежняя версия встречи устарела: она убирается из агрегатов, файл разбирается снова при следующем обновлении
+            if previous:
+                forget(file)
+                stats["removed"] += 1
+            continue
+
+        digest = hasher.hexdigest()
+        if previous and previous["sha256"] == digest:
+            previous.update(mtime_ns=st.st_mtime_ns, size=st.st_size)
+            stats["unchanged"] += 1
+            continue
+
+        if previous:
+            forget(file)
+        accumulator.add(record)
+        added_ids.add(record["meeting_id"])
+        manifest[file] = {"sha256": digest, "mtime_ns": st.st_mtime_ns, "size": st.st_size, "meeting_id": record["meeting_id"]}
+        stats["updated" if previous else "added"] += 1
+
+    for file in [file for file in manifest if file not in seen]:
+        forget(file)
+        stats["removed"] += 1
+
+    claims = {}
+    for file in sorted(manifest):
+        claims.setdefault(manifest[file]["meeting_id"], []).append(file)
+    for meeting_id in sorted(added_ids):
+        if len(claims.get(meeting_id, [])) > 1:
+            print(f"[WARN] analytics_builder: meeting_id {meeting_id} is used by {', '.join(claims[meeting_id])}, only one of them is counted")
+    # Как при полной пересборке, строку удалённого дубликата заменяет последний по имени файл с тем же id
+    for meeting_id in sorted(orphans - accumulator.rows.keys()):
+        for file in reversed(claims.get(meeting_id, [])):
+            try:
+                accumulator.add_file(Path(transcripts_dir) / file)
+                break
+            except (OSError, json.JSONDecodeError, UnicodeDecodeError, AttributeError) as e:
+                print(f"[WARN] analytics_builder: skipping {file}: {e}")
+                manifest.pop(file)
+
+    changed = stats["added"] or stats["updated"] or stats["removed"]
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(state_path, json.dumps(
+        {"version": STATE_VERSION, "manifest": manifest, "accumulator": accumulator.to_state()}, ensure_ascii=False
+    ))
+
+    store = None
+    if not changed and CriteriaStore.exists(store_dir):
+        try:
+            store = CriteriaStore.load(store_dir)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] analytics_builder: rebuilding criteria store: {e}")
+    if store is None or len(store) != len(accumulator):
+        store = CriteriaStore.from_rows(accumulator.rows.values())
+        store.save(store_dir)
+    rebuild_cube = changed or not Path(cube_path).exists()
+    if not rebuild_cube:
+        try:
+            ConversionCube.load(cube_path)
+        except (OSError, ValueError) as e:
+            print(f"[WARN] analytics_builder: rebuilding conversion cube: {e}")
+            rebuild_cube = True
+    if rebuild_cube:
+        ConversionCube.from_rows(accumulator.rows.values()).save(cube_path)
+
+    stats["total"] = len(accumulator)
+    return accumulator.finalize(store, Path(store_dir) / "significance.json"), stats
+
+
+def merge_narrative(built: dict, narrative: dict) -> dict:
+    """
+    Переносит в built только текстовые поля key_insights из narrative
+    (ответ LLM); все числа остаются посчитанными локально.
+    """
+    insights = narrative.get("key_insights", narrative)
+    for path, empty in NARRATIVE_FIELDS.items():
+        value = insights
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if isinstance(value, type(empty)) and value:
+            target = built["key_insights"]
+            for key in path[:-1]:
+                target = target[key]
+            target[path[-1]] = value
+    return built
+
+
+def write_analytics_db(db: dict, path: str | Path = "./memory/memories/analytics_db.json"):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_text(Path(path), json.dumps(db, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    db, stats = update_analytics_db()
+    write_analytics_db(db)
+    info = db["database_info"]
+    print(f"✅ analytics_db.json: {info['total_meetings']} встреч, конверсия {info['conversion_rate']}% "
+          f"({time.perf_counter() - start:.3f}s)")
+    print(f"   +{stats['added']} ~{stats['updated']} -{stats['removed']} ={stats['unchanged']}")
@@ -0,0 +1,239 @@
+"""
+Пакетный режим через Message Batches API для прогонов, которым не нужна интерактивная задержка:
+15 вопросов Demo2Pilots и цифровые профили участников.
+
+Все диалоги раунда уходят одним батчем. После завершения батча инструменты из ответов с
+stop_reason == "tool_use" выполняются локально, результаты дописываются в диалоги, и
+незавершённые диалоги отправляются следующим батчем (многораундовый tool loop).
+Выходные файлы те же, что у интерактивных обработчиков. Адрес API берётся из ANTHROPIC_BASE_URL,
+поэтому режим проверяется на локальном фейковом endpoint'е (fake_batch_server.py).
+
+    python batch_runner.py questions
+    python batch_runner.py profiles
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import time
+import sys
+
+from MemoryTool import MemoryTool, MODEL, BETAS, SYSTEM_PROMPT, FUNCTION_TOOLS_PROMPT
+from ClaudeClient import Client
+from query_engine import PHRASE_PROMPT
+from prompt_cache import CacheUsage, cached_system
+from query_handler_multithreaded import (
+    ANALYST_PROMPT, QUESTIONS, prepare_session, print_summary, question_message, read_memory_file, write_memory_file,
+    write_response,
+)
+
+# Секунды между проверками статуса батча
+POLL_INTERVAL = 30
+# Раундов tool loop на один диалог, после этого диалог останавливается
+MAX_ROUNDS = 40
+TOOL_WORKERS = 8
+
+
+def _run_tool(tools_by_name: dict, block) -> dict:
+    """tool_result для одного tool_use; ошибка инструмента возвращается модели, как в tool_runner"""
+    tool = tools_by_name.get(block.name)
+    try:
+        if tool is None:
+            raise ValueError(f"Unknown tool: {block.name}")
+        content = tool.call(block.input)
+        return {"type": "tool_result", "tool_use_id": block.id, "content": content}
+    except Exception as e:
+        return {"type": "tool_result", "tool_use_id": block.id, "content": repr(e), "is_error": True}
+
+
+def run_batches(
+    client: Client,
+    conversations: dict[str, dict],
+    tools: list,
+    poll_interval: float = POLL_INTERVAL,
+    max_rounds: int = MAX_ROUNDS,
+    usage: CacheUsage | None = None,
+    on_done=None,
+) -> dict[str, dict]:
+    """
+    Выполняет диалоги {custom_id: параметры messages.create без tools} раундами батчей.
+
+    Параметры с ключом "tools": True получают определения tools. on_done(custom_id, result)
+    вызывается, как только диалог завершён. Результат - {custom_id: {"text", "status", "rounds", "elapsed"}}.
+    """
+    start = time.time()
+    tool_params = [tool.to_dict() for tool in tools]
+    tools_by_name = {tool.name: tool for tool in tools}
+    pending = {custom_id: dict(params, messages=list(params["messages"])) for custom_id, params in conversations.items()}
+    results = {custom_id: {"text": [], "status": None, "rounds": 0, "elapsed": 0.0} for custom_id in conversations}
+
+    def finish(custom_id, status):
+        result = results[custom_id]
+        result["status"], result["elapsed"] = status, time.time() - start
+        pending.pop(custom_id)
+        if on_done is not None:
+            on_done(custom_id, result)
+
+    round_number = 0
+    with ThreadPoolExecutor(max_workers=TOOL_WORKERS) as executor:
+        while pending:
+            round_number += 1
+            requests = []
+            for custom_id, params in pending.items():
+                request = {key: value for key, value in params.items() if key != "tools"}
+                if params.get("tools"):
+                    request["tools"] = tool_params
+                requests.append({"custom_id": custom_id, "params": request})
+
+            batch = client.client.beta.messages.batches.create(betas=BETAS, requests=requests)
+            print(f"📦 Round {round_number}: batch {batch.id} with {len(requests)} requests")
+            while batch.processing_status != "ended":
+                time.sleep(poll_interval)
+                batch = client.client.beta.messages.batches.retrieve(batch.id, betas=BETAS)
+            counts = batch.request_counts
+            print(f"   ended: {counts.succeeded} succeeded, {counts.errored} errored, {counts.expired} expired")
+
+            tool_calls = []
+            for entry in client.client.beta.messages.batches.results(batch.id, betas=BETAS):
+                custom_id = entry.custom_id
+                if custom_id not in pending:
+                    continue
+                if entry.result.type != "succeeded":
+                    error = getattr(entry.result, "error", None)
+                    finish(custom_id, f"error: {entry.result.type}{f' {error}' if error else ''}")
+                    continue
+
+                message = entry.result.message
+                results[custom_id]["rounds"] += 1
+                if usage is not None:
+                    usage.record(message.usage)
+                results[custom_id]["text"].extend(block.text for block in message.content if block.type == "text")
+                if message.stop_reason != "tool_use":
+                    finish(custom_id, "success")
+                    continue
+                if results[custom_id]["rounds"] >= max_rounds:
+                    finish(custom_id, f"error: stopped after {max_rounds} rounds")
+                    continue
+                pending[custom_id]["messages"].append({"role": "assistant", "content": [b.to_dict() for b in message.content]})
+                tool_calls.append((custom_id, [b for b in message.content if b.type == "tool_use"]))
+
+            # Ответы, которых нет в результатах батча, считаются ошибкой, иначе цикл не закончится
+            continued = {custom_id for custom_id, _ in tool_calls}
+            for custom_id in [c for c in pending if c not in continued]:
+                finish(custom_id, "error: no result in batch")
+
+            # Инструменты всех диалогов раунда выполняются параллельно, порядок внутри диалога сохраняется
+            futures = [(custom_id, [executor.submit(_run_tool, tools_by_name, block) for block in blocks])
+                       for custom_id, blocks in tool_calls]
+            for custom_id, blocks in futures:
+                pending[custom_id]["messages"].append({"role": "user", "content": [f.result() for f in blocks]})
+    return results
+
+
+def run_questions(client: Client, memory: MemoryTool, poll_interval: float = POLL_INTERVAL):
+    """Вопросы QUESTIONS одним набором батчей; кэш ответов и QueryEngine - как в многопоточном обработчике"""
+    session = prepare_session(memory)
+    answer_cache, versions = session["answer_cache"], session["versions"]
+    total_start = time.time()
+    outcomes, conversations, local_answers = {}, {}, {}
+
+    for i, query in enumerate(QUESTIONS):
+        analysis_file = f"demo2pilots_analysis_Q{i + 1}.txt"
+        cached = answer_cache.get(query, *versions)
+        if cached is not None:
+            if "analysis" in cached["files"]:
+                write_memory_file(memory, analysis_file, cached["files"]["analysis"])
+            write_response(i, query, 0.0, cached["answer"], f"answer cache, originally {cached['elapsed']:.2f} seconds")
+            outcomes[i] = (i, 0.0, "cached")
+            continue
+
+        local = session["engine"].answer(query)
+        if local is not None:
+            local_answers[i] = local
+            conversations[f"Q{i + 1}"] = {
+                "model": MODEL,
+                "max_tokens": 2000,
+                "system": PHRASE_PROMPT,
+                "messages": [{"role": "user", "content": f"Вопрос: {query}\n\nДанные:\n{local['text']}"}],
+            }
+            continue
+
+        # С предзагруженными встречами диалог обычно завершается за один раунд батча
+        plan = session["planner"].plan(query)
+        conversations[f"Q{i + 1}"] = {
+            "model": MODEL,
+            "max_tokens": 7500,
+            "system": cached_system(ANALYST_PROMPT),
+            "messages": [{"role": "user", "content": question_message(i, query, plan)}],
+            "tools": True,
+        }
+
+    def on_done(custom_id, result):
+        i = int(custom_id[1:]) - 1
+        query, text = QUESTIONS[i], "\n".join(result["text"])
+        if result["status"] != "success":
+            print(f"[Q{i+1}] ❌ {result['status']}")
+            outcomes[i] = (i, 0, result["status"])
+            return
+        local = local_answers.get(i)
+        if local is not None:
+            text += "\n\n" + local["text"]
+            write_response(i, query, result["elapsed"], text, f"batch, local query engine: {local['intent']}")
+            files = {}
+        else:
+            write_response(i, query, result["elapsed"], text, f"batch, {result['rounds']} rounds")
+            analysis = read_memory_file(memory, f"demo2pilots_analysis_Q{i + 1}.txt")
+            files = {"analysis": analysis} if analysis is not None else {}
+        answer_cache.put(query, *versions, answer=text, files=files, elapsed=result["elapsed"])
+        print(f"[Q{i+1}] ✅ Completed in {result['elapsed']:.2f}s ({result['rounds']} rounds)")
+        outcomes[i] = (i, result["elapsed"], "success")
+
+    if conversations:
+        run_batches(client, conversations, session["tools"], poll_interval, usage=session["usage"], on_done=on_done)
+    memory.close()
+    session["answer_cache"].save()
+    print_summary(session, memory, list(outcomes.values()), time.time() - total_start, len(QUESTIONS))
+
+
+def run_profiles(client: Client, memory: MemoryTool, poll_interval: float = POLL_INTERVAL):
+    """Профили всех участников из participants.txt; модель сама пишет /memories/*_digital_profile.md через memory tool"""
+    # Модуль профилей тянет за собой IdentifyParticipants, нужен только в этом режиме
+    from CreateDigitalProfile import profile_message
+
+    names = [line.strip() for line in Path("memory/memories/participants.txt").read_text(encoding="utf-8", errors="replace").splitlines()
+             if line.strip()]
+    usage = CacheUsage()
+    conversations = {
+        f"P{k + 1}": {
+            "model": MODEL,
+            "max_tokens": 20000,
+            "system": cached_system(SYSTEM_PROMPT + FUNCTION_TOOLS_PROMPT),
+            "messages": [{
+                "role": "user",
+                "content": profile_message(name),
+            }],
+            "tools": True,
+        }
+        for k, name in enumerate(names)
+    }
+
+    def on_done(custom_id, result):
+        name = names[int(custom_id[1:]) - 1]
+        mark = "✅" if result["status"] == "success" else f"❌ {result['status']}"
+        print(f"[{name}] {mark}: {result['rounds']} rounds, {result['elapsed']:.1f}s")
+
+    run_batches(client, conversations, [memory, *memory.function_tools()], poll_interval, usage=usage, on_done=on_done)
+    memory.close()
+    usage_stats = usage.summary()
+    print(f"🧾 Prompt cache: read {usage_stats['cache_read_input_tokens']}, written {usage_stats['cache_creation_input_tokens']}, "
+          f"uncached {usage_stats['input_tokens']} tokens")
+
+
+if __name__ == "__main__":
+    mode = sys.argv[1] if len(sys.argv) > 1 else "questions"
+    if mode not in ("questions", "profiles"):
+        raise SystemExit("Usage: python batch_runner.py [questions|profiles]")
+    client = Client()
+    memory = MemoryTool(token_log_path="reports/memory_tool_tokens.jsonl")
+    if mode == "questions":
+        run_questions(client, memory)
+    else:
+        run_profiles(client, memory)
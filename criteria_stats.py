@@ -0,0 +1,175 @@
+"""
+Связь критериев с успехом встречи: корреляции, бутстрэп-интервалы и перестановочные p-value.
+
+Все критерии дискретны (1-10, client_task_classification - 1/2/3), поэтому любая статистика
+считается по таблицам "значение критерия -> (встреч, успешных)". Ресэмплы дают такие таблицы
+одним матричным умножением: бутстрэп - матрица кратностей W (ресэмплы x встречи) @ one-hot,
+перестановки - матрица перемешанных y @ one-hot.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from CriteriaStore import MISSING, CriteriaStore
+from meeting_records import CRITERIA, TASK_CRITERION
+
+METHODS = ("pointbiserial", "spearman")
+
+# Ресэмплов в одном блоке: у каждого блока свой seed, поэтому результат не зависит от числа процессов
+CHUNK_RESAMPLES = 500
+# Ограничение на размер матрицы ресэмплы x встречи в одном умножении
+MAX_MATRIX_CELLS = 4_000_000
+
+
+def _design(store: CriteriaStore) -> tuple[np.ndarray, np.ndarray, list[tuple[str, np.ndarray, slice]]]:
+    """One-hot значений всех критериев (встречи x значения), y и срезы колонок по критериям"""
+    criteria = np.asarray(store.columns["criteria"])
+    onehots, blocks, start = [], [], 0
+    for j, name in enumerate(CRITERIA):
+        column = criteria[:, j]
+        values = np.unique(column[column != MISSING])
+        onehots.append(column[:, None] == values[None, :])
+        blocks.append((name, values.astype(np.float64), slice(start, start + len(values))))
+        start += len(values)
+    onehot = np.concatenate(onehots, axis=1).astype(np.float64)
+    return onehot, store.success.astype(np.float64), blocks
+
+
+def _statistic(blocks, counts: np.ndarray, successes: np.ndarray, method: str) -> np.ndarray:
+    """
+    Статистика по таблицам (ресэмплы x значения): встречи c и успешные s для каждого значения.
+    Критерии-оценки - Пирсон по значениям или средним рангам, client_task_classification - V Крамера.
+    """
+    result = np.full((counts.shape[0], len(blocks)), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for k, (name, values, columns) in enumerate(blocks):
+            c, s = counts[:, columns], successes[:, columns]
+            n, total_success = c.sum(axis=1), s.sum(axis=1)
+
+            if name == TASK_CRITERION:
+                # chi^2 таблицы 2 x K: (s - E)^2 * (1/E_успех + 1/E_провал) по непустым классам
+                expected = c * (total_success / n)[:, None]
+                chi2 = np.where(c > 0, (s - expected) ** 2 * (1 / expected + 1 / (c - expected)), 0.0).sum(axis=1)
+                valid = (n > 0) & (total_success > 0) & (total_success < n) & ((c > 0).sum(axis=1) > 1)
+                result[:, k] = np.where(valid, np.sqrt(chi2 / n), np.nan)
+                continue
+
+            if method == "spearman":
+                # Средний ранг значения с учётом связок: ранги y при бинарном y аффинны, r(ранги x, y) = rho
+                position = np.cumsum(c, axis=1) - c + (c + 1) / 2
+            else:
+                position = np.broadcast_to(values, c.shape)
+            sx = (c * position).sum(axis=1)
+            sxx = (c * position ** 2).sum(axis=1)
+            sxy = (s * position).sum(axis=1)
+            var_x = n * sxx - sx ** 2
+            var_y = n * total_success - total_success ** 2
+            r = (n * sxy - sx * total_success) / np.sqrt(var_x * var_y)
+            result[:, k] = np.where((n >= 3) & (var_x > 1e-9) & (var_y > 0), r, np.nan)
+    return result
+
+
+def _resample_chunk(kind: str, onehot, y, blocks, method: str, seed, size: int) -> np.ndarray:
+    """size бутстрэп-ресэмплов или перестановок; верхнеуровневая функция, чтобы работать в пуле процессов"""
+    rng = np.random.default_rng(seed)
+    n, width = onehot.shape
+    # Счётчики - целые до n, float32 считает их точно (n < 2^24) и вдвое быстрее в BLAS
+    both = np.concatenate([onehot, onehot * y[:, None]], axis=1).astype(np.float32)
+    base_counts = onehot.sum(axis=0)
+    step = max(1, MAX_MATRIX_CELLS // max(n, 1))
+    parts = []
+    for offset in range(0, size, step):
+        b = min(step, size - offset)
+        if kind == "bootstrap":
+            draws = rng.integers(0, n, size=(b, n)) + np.arange(b)[:, None] * n
+            weights = np.bincount(draws.ravel(), minlength=b * n).reshape(b, n).astype(np.float32)
+            tables = (weights @ both).astype(np.float64)
+            counts, successes = tables[:, :width], tables[:, width:]
+        else:
+            shuffled = rng.permuted(np.broadcast_to(y.astype(np.float32), (b, n)), axis=1)
+            counts = np.broadcast_to(base_counts, (b, width))
+            successes = (shuffled @ both[:, :width]).astype(np.float64)
+        parts.append(_statistic(blocks, counts, successes, method))
+    return np.concatenate(parts) if parts else np.empty((0, len(blocks)))
+
+
+def _resample(kind: str, onehot, y, blocks, method: str, total: int, seed: np.random.SeedSequence,
+              workers: int | None) -> np.ndarray:
+    sizes = [min(CHUNK_RESAMPLES, total - start) for start in range(0, total, CHUNK_RESAMPLES)]
+    seeds = seed.spawn(len(sizes))
+    if not sizes:
+        return np.empty((0, len(blocks)))
+    if workers and workers > 1 and len(sizes) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_resample_chunk, kind, onehot, y, blocks, method, s, size) for s, size in zip(seeds, sizes)]
+            return np.concatenate([future.result() for future in futures])
+    return np.concatenate([_resample_chunk(kind, onehot, y, blocks, method, s, size) for s, size in zip(seeds, sizes)])
+
+
+def criteria_significance(
+    store: CriteriaStore,
+    method: str = "pointbiserial",
+    n_boot: int = 2000,
+    n_perm: int = 2000,
+    alpha: float = 0.05,
+    seed: int = 0,
+    workers: int | None = None,
+) -> dict[str, dict]:
+    """
+    Для каждого критерия: статистика связи с meeting_success == "да", percentile-бутстрэп интервал
+    уровня 1 - alpha и двусторонний перестановочный p-value.
+
+    Критерии-оценки - точечно-бисериальная корреляция (method="pointbiserial") или Спирмен,
+    client_task_classification - V Крамера по классам 1/2/3 (p-value односторонний, V >= 0).
+    workers > 1 распределяет блоки ресэмплов по процессам; при одном seed результат тот же.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method: {method}. Use one of {', '.join(METHODS)}")
+
+    onehot, y, blocks = _design(store)
+    observed = _statistic(blocks, onehot.sum(axis=0)[None], (onehot * y[:, None]).sum(axis=0)[None], method)[0]
+    boot_seed, perm_seed = np.random.SeedSequence(seed).spawn(2)
+    boot = _resample("bootstrap", onehot, y, blocks, method, n_boot, boot_seed, workers)
+    perm = _resample("permutation", onehot, y, blocks, method, n_perm, perm_seed, workers)
+
+    result = {}
+    for k, (name, values, columns) in enumerate(blocks):
+        statistic = observed[k]
+        entry = {
+            "method": "cramers_v" if name == TASK_CRITERION else method,
+            "statistic": None if np.isnan(statistic) else round(float(statistic), 4),
+            "n": int(onehot[:, columns].sum()),
+            "ci_low": None,
+            "ci_high": None,
+            "p_value": None,
+        }
+        samples = boot[:, k][~np.isnan(boot[:, k])]
+        if len(samples):
+            low, high = np.quantile(samples, [alpha / 2, 1 - alpha / 2])
+            entry["ci_low"], entry["ci_high"] = round(float(low), 4), round(float(high), 4)
+        if not np.isnan(statistic) and len(perm):
+            null = perm[:, k]
+            if name == TASK_CRITERION:
+                extreme = np.sum(null >= statistic - 1e-12)
+            else:
+                extreme = np.sum(np.abs(null) >= abs(statistic) - 1e-12)
+            entry["p_value"] = round(float((extreme + 1) / (len(null) + 1)), 4)
+        if name == TASK_CRITERION:
+            counts = onehot[:, columns].sum(axis=0)
+            successes = (onehot[:, columns] * y[:, None]).sum(axis=0)
+            entry["conversion_by_class"] = {
+                str(int(v)): round(float(100.0 * s / c), 2) for v, c, s in zip(values, counts, successes) if c
+            }
+        result[name] = entry
+    return result
+
+
+if __name__ == "__main__":
+    import time
+
+    store = CriteriaStore.load("./memory/criteria_store")
+    start = time.perf_counter()
+    stats = criteria_significance(store)
+    print(f"📊 {len(store)} встреч, {time.perf_counter() - start:.2f}s")
+    for name, entry in stats.items():
+        print(f"  {name}: {entry['method']} {entry['statistic']} "
+              f"[{entry['ci_low']}, {entry['ci_high']}] p={entry['p_value']}")
@@ -0,0 +1,158 @@
+"""
+Локальный фейковый endpoint Message Batches API для проверки batch_runner без сети.
+
+Поддерживает создание батча, опрос статуса и выдачу результатов (JSONL). Ответ на каждый
+запрос батча строит responder(params) -> (content, stop_reason); по умолчанию модель сразу
+отвечает текстом. Батч считается завершённым после polls проверок статуса.
+
+    python fake_batch_server.py 8765
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 CLAUDE_API=fake python batch_runner.py questions
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import json
+import re
+
+BATCH_PATH = re.compile(r"^/v1/messages/batches(?:/(?P<id>[\w-]+)(?P<results>/results)?)?$")
+
+
+def echo_responder(params: dict) -> tuple[list[dict], str]:
+    """Ответ без инструментов: текст с номером хода диалога"""
+    return [{"type": "text", "text": f"fake answer after {len(params['messages'])} messages"}], "end_turn"
+
+
+class FakeBatchServer:
+    """HTTP-сервер в фоновом потоке; base_url подставляется в ANTHROPIC_BASE_URL или Anthropic(base_url=...)"""
+
+    def __init__(self, responder=echo_responder, polls: int = 1, host: str = "127.0.0.1", port: int = 0):
+        self.responder = responder
+        self.polls = polls
+        self.batches: dict[str, dict] = {}
+        self.requests: list[dict] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeBatchServer":
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Запуск в текущем потоке (для командной строки)"""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _create(self, body: dict) -> dict:
+        with self._lock:
+            batch_id = f"msgbatch_fake_{len(self.batches) + 1}"
+            self.batches[batch_id] = {"requests": body["requests"], "polls": 0}
+            self.requests.extend(body["requests"])
+        return self._status(batch_id, poll=False)
+
+    def _status(self, batch_id: str, poll: bool = True) -> dict:
+        with self._lock:
+            batch = self.batches[batch_id]
+            if poll:
+                batch["polls"] += 1
+            ended = batch["polls"] >= self.polls
+            count = len(batch["requests"])
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {"processing": 0 if ended else count, "succeeded": count if ended else 0,
+                               "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": "2025-01-01T00:00:00Z",
+            "expires_at": "2025-01-02T00:00:00Z",
+            "ended_at": "2025-01-01T00:01:00Z" if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{self.base_url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def _results(self, batch_id: str) -> str:
+        with self._lock:
+            requests = list(self.batches[batch_id]["requests"])
+        lines = []
+        for number, request in enumerate(requests):
+            content, stop_reason = self.responder(request["params"])
+            message = {
+                "id": f"msg_{batch_id}_{number}",
+                "type": "message",
+                "role": "assistant",
+                "model": request["params"]["model"],
+                "content": content,
+                "stop_reason": stop_reason,
+                "stop_sequence": None,
+                "usage": {"input_tokens": 10, "output_tokens": 5},
+            }
+            lines.append(json.dumps({"custom_id": request["custom_id"], "result": {"type": "succeeded", "message": message}},
+                                    ensure_ascii=False))
+        return "\n".join(lines) + "\n"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: str, content_type: str = "application/json"):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _match(self, with_id: bool):
+                match = BATCH_PATH.match(self.path.split("?", 1)[0])
+                if match is None or (match["id"] is not None) != with_id or (with_id and match["id"] not in server.batches):
+                    self._send(404, json.dumps({"type": "error", "error": {"type": "not_found_error", "message": self.path}}))
+                    return None
+                return match
+
+            def do_POST(self):
+                if self._match(with_id=False) is None:
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))))
+                self._send(200, json.dumps(server._create(body), ensure_ascii=False))
+
+            def do_GET(self):
+                match = self._match(with_id=True)
+                if match is None:
+                    return
+                if match["results"]:
+                    self._send(200, server._results(match["id"]), "application/binary")
+                else:
+                    self._send(200, json.dumps(server._status(match["id"])))
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import sys
+
+    server = FakeBatchServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8765)
+    print(f"🧪 Fake Message Batches API: ANTHROPIC_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,5 +1,10 @@
-from MemoryTool import MemoryTool, SYSTEM_PROMPT, MODEL, BETAS
+from MemoryTool import MemoryTool, SYSTEM_PROMPT, FUNCTION_TOOLS_PROMPT, MODEL, BETAS
 from ClaudeClient import Client
+from analytics_builder import update_analytics_db, merge_narrative, write_analytics_db
+from pathlib import Path
+import json
+import time
+import sys
 
 CREATE_ANALYTICS_DATABASE_PROMPT = """Ты - аналитик данных, который создаёт промежуточную базу данных для ускорения аналитических запросов.
 
@@ -419,7 +424,7 @@ neutral_meetings.count = КОЛИЧЕСТВО ЭЛЕМЕНТОВ в neutral_meet
 #       "client_task_classification": <num>,
 #       "cognitive_overload_assessment": <num>
 #     },
-#     "failed_meetings": {
+#     "unsuccessful_meetings": {
 #       "rapport_building": <num>,
 #       "situation_discovery": <num>,
 #       "problem_existence_depth": <num>,
@@ -460,7 +465,43 @@ neutral_meetings.count = КОЛИЧЕСТВО ЭЛЕМЕНТОВ в neutral_meet
 #   }
 
 
+# Числа в analytics_db.json собирает analytics_builder; модель пишет только текстовые выводы
+KEY_INSIGHTS_PROMPT = """Ты - аналитик продаж. Файл /memories/analytics_db.json уже собран, все числа в нём посчитаны точно и НЕ меняются.
+
+## ЗАДАЧА:
+- Прочитай /memories/analytics_db.json (criteria_correlations, anomalies, key_insights, conversion_by_*)
+- При необходимости посмотри транскрипты встреч из anomalies в /transcripts/ (json_view по нужным полям)
+- Создай файл /memories/analytics_key_insights.json строго такого вида:
+
+```json
+{
+  "channel_performance": {"note": ""},
+  "seasonal_trends": {"note": ""},
+  "critical_success_factors": [],
+  "common_failure_patterns": []
+}
+```
+
+- note - 1-2 предложения, объясняющие числа из key_insights (лучший канал, лучший месяц)
+- critical_success_factors и common_failure_patterns - 3-5 коротких формулировок, опирающихся на корреляции и аномалии
+- НЕ редактируй /memories/analytics_db.json и не пересчитывай числа"""
+
+DB_PATH = Path("./memory/memories/analytics_db.json")
+INSIGHTS_PATH = Path("./memory/memories/analytics_key_insights.json")
+
+
 if __name__ == "__main__":
+    start = time.perf_counter()
+    db, changes = update_analytics_db()
+    write_analytics_db(db, DB_PATH)
+    info = db["database_info"]
+    print(f"✅ analytics_db.json собран локально: {info['total_meetings']} встреч, "
+          f"конверсия {info['conversion_rate']}% ({time.perf_counter() - start:.2f}s)")
+    print(f"   транскрипты: +{changes['added']} ~{changes['updated']} -{changes['removed']} ={changes['unchanged']}")
+
+    if "--no-llm" in sys.argv:
+        sys.exit(0)
+
     client = Client()
 
     memory = MemoryTool()
@@ -469,17 +510,35 @@ if __name__ == "__main__":
             betas=BETAS,
             model=MODEL,
             max_tokens=20000, # max_tokens для ответа
-            system=SYSTEM_PROMPT,
-            tools=[memory],
+            system=SYSTEM_PROMPT + FUNCTION_TOOLS_PROMPT,
+            tools=[memory, *memory.function_tools()],
             messages=[
                 {
                     "role":"user",
-                    "content": CREATE_ANALYTICS_DATABASE_PROMPT,
+                    "content": KEY_INSIGHTS_PROMPT,
                 }
             ]
     )
     
+    turns = 0
     for message in runner:
+        turns += 1
         for block in message.content:
             if block.type == "text":
                 print(block.text)
+
+    memory.close()
+
+    # Из ответа модели берутся только текстовые поля, числа остаются локальными
+    try:
+        narrative = json.loads(INSIGHTS_PATH.read_text(encoding="utf-8"))
+        write_analytics_db(merge_narrative(db, narrative), DB_PATH)
+        print("✅ key_insights дополнены выводами модели")
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"[WARN] key_insights не дополнены: {e}")
+
+    print(f"\n🔁 Turns: {turns}")
+    if client.cassette is not None:
+        print(f"📼 Cassette: {client.cassette.stats()}")
+    for name, entry in memory.call_stats.summary().items():
+        print(f"  {name}: {entry['calls']} calls, {entry['total_ms']:.0f} ms, {entry['result_bytes'] / 1024:.1f} KB")
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+from typing import Any
+import threading
+import json
+
+WILDCARD = "*"
+
+
+def parse_field_path(field: str) -> list[str]:
+    """`metadata.sales_managers.*.name` -> ["metadata", "sales_managers", "*", "name"]"""
+    parts = [part.strip() for part in field.strip().split(".")]
+    if not field.strip() or any(not part for part in parts):
+        raise ValueError(f"Invalid field path: {field!r}")
+    return parts
+
+
+def _children(node: Any) -> list[tuple[str, Any]]:
+    if isinstance(node, dict):
+        return [(str(key), value) for key, value in node.items()]
+    if isinstance(node, list):
+        return [(str(i), value) for i, value in enumerate(node)]
+    return []
+
+
+def _child(node: Any, part: str) -> tuple[bool, Any]:
+    if isinstance(node, dict):
+        return (True, node[part]) if part in node else (False, None)
+    if isinstance(node, list) and part.lstrip("-").isdigit():
+        index = int(part)
+        return (True, node[index]) if -len(node) <= index < len(node) else (False, None)
+    return False, None
+
+
+def select(document: Any, field: str) -> dict[str, Any]:
+    """
+    Возвращает {конкретный путь: значение} для поля с возможными `*`.
+    Для пути без `*`, которого нет в документе, значение - None.
+    """
+    parts = parse_field_path(field)
+    matches: list[tuple[list[str], Any]] = [([], document)]
+
+    for part in parts:
+        next_matches = []
+        for prefix, node in matches:
+            if part == WILDCARD:
+                next_matches.extend((prefix + [key], value) for key, value in _children(node))
+            else:
+                found, value = _child(node, part)
+                if found:
+                    next_matches.append((prefix + [part], value))
+        matches = next_matches
+
+    if not matches and WILDCARD not in parts:
+        return {field: None}
+    return {".".join(path): value for path, value in matches}
+
+
+def project(document: Any, fields: list[str]) -> dict[str, Any]:
+    """Плоский словарь значений по всем запрошенным полям (в порядке запроса)"""
+    result = {}
+    for field in fields:
+        result.update(select(document, field))
+    return result
+
+
+class ParsedJsonCache:
+    """
+    LRU разобранных JSON-документов. Ключ действителен, пока хранилище отдаёт
+    тот же объект строки (ContentCache возвращает один и тот же str, пока файл не менялся).
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, text: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is text:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        document = json.loads(text)
+
+        with self._lock:
+            self._entries[key] = (text, document)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return document
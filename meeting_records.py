@@ -0,0 +1,109 @@
+from typing import Any
+import re
+
+# Критерии по шкале 1-10 (порядок как в CREATE_ANALYTICS_DATABASE_PROMPT)
+SCORE_CRITERIA = [
+    "rapport_building",
+    "situation_discovery",
+    "problem_existence_depth",
+    "problem_implications",
+    "need_payoff_clarity",
+    "sales_questioning_quality",
+    "solution_fit",
+    "client_engagement",
+    "engagement_dynamics",
+    "solution_presentation_quality",
+    "understanding_validation",
+    "objection_handling",
+    "clear_next_steps",
+    "stakeholder_mapping",
+    "budget_timeline_qualification",
+    "cognitive_overload_assessment",
+]
+
+# Категориальный критерий: 1 - без задачи, 2 - с задачей, 3 - недостаточно данных
+TASK_CRITERION = "client_task_classification"
+
+CRITERIA = SCORE_CRITERIA + [TASK_CRITERION]
+
+# Порядок имён внутри группы менеджеров, как в индексе by_sales_manager
+MANAGER_ORDER = ["Алексей Воронин", "Артем Садыков", "Александр Швецов", "Максим Гулькин"]
+ANCHOR_PAIR = ("Алексей Воронин", "Артем Садыков")
+
+
+def manager_group(names: list[str]) -> str:
+    """
+    Группа менеджеров для индекса by_sales_manager:
+    один менеджер - его имя; Воронин и Садыков вместе - их пара независимо от остальных;
+    иначе - все участники через " + " в порядке MANAGER_ORDER.
+    """
+    unique = sorted(set(names), key=lambda name: (
+        MANAGER_ORDER.index(name) if name in MANAGER_ORDER else len(MANAGER_ORDER), name
+    ))
+    if set(ANCHOR_PAIR) <= set(unique):
+        return " + ".join(ANCHOR_PAIR)
+    return " + ".join(unique)
+
+
+def parse_amount(value: Any) -> float | None:
+    """"400,000.00 ₽" -> 400000.0, пустое значение -> None"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    digits = re.sub(r"[^\d.]", "", str(value or "").replace(",", ""))
+    try:
+        return float(digits) if digits else None
+    except ValueError:
+        return None
+
+
+def parse_percent(value: Any) -> float | None:
+    """"75%" -> 75.0"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"\d+(?:[.,]\d+)?", str(value or ""))
+    return float(match.group().replace(",", ".")) if match else None
+
+
+def quarter_of(date: str) -> str | None:
+    """"2025-04-18" -> "2025-Q2" """
+    if not date or len(date) < 7:
+        return None
+    return f"{date[:4]}-Q{(int(date[5:7]) - 1) // 3 + 1}"
+
+
+def meeting_record(document: dict, file: str) -> dict:
+    """Плоская запись о встрече из JSON-транскрипта: метаданные, производные поля и критерии"""
+    metadata = document.get("metadata", {})
+    criteria = document.get("criteria", {})
+    summary = document.get("overall_summary", {})
+    managers = [
+        (m.get("name", ""), m.get("activity_percentage"))
+        for m in metadata.get("sales_managers", []) if m.get("name")
+    ]
+    date = metadata.get("meeting_date") or ""
+    success = metadata.get("meeting_success", "")
+
+    return {
+        "meeting_id": metadata.get("meeting_id"),
+        "file": file,
+        "meeting_date": date or None,
+        "month": date[:7] or None,
+        "quarter": quarter_of(date),
+        "meeting_success": success,
+        # Конверсия = успешные / все встречи, "непонятно" в числителе не учитывается
+        "is_success": int(success == "да"),
+        "client_name": metadata.get("client_name"),
+        "client_industry": metadata.get("client_industry"),
+        "acquisition_channel_type": metadata.get("acquisition_channel_type"),
+        "acquisition_channel_name": metadata.get("acquisition_channel_name"),
+        "client_status": metadata.get("client_status"),
+        "purchase_amount": parse_amount(metadata.get("purchase_amount")),
+        "pilot_probability": parse_percent(metadata.get("pilot_probability_assessment")),
+        "manager_comments": metadata.get("manager_comments"),
+        "manager_group": manager_group([name for name, _ in managers]) if managers else None,
+        "managers": managers,
+        "total_score": summary.get("total_score"),
+        "average_score": summary.get("average_score"),
+        "conversion_probability": summary.get("conversion_probability"),
+        "criteria": {name: criteria.get(name) for name in CRITERIA},
+    }
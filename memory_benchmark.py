@@ -0,0 +1,407 @@
+import hashlib
+import json
+import random
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pathlib import Path
+
+from anthropic.types.beta import (
+    BetaMemoryTool20250818ViewCommand,
+    BetaMemoryTool20250818CreateCommand,
+    BetaMemoryTool20250818InsertCommand,
+    BetaMemoryTool20250818StrReplaceCommand,
+)
+
+import httpx
+from anthropic import Anthropic
+
+from Cassette import Cassette, CassetteTransport
+from MemoryTool import MemoryTool, SYSTEM_PROMPT, FUNCTION_TOOLS_PROMPT, MODEL, BETAS
+from prompt_cache import CacheUsage, cached_system
+from token_budget import estimate_tokens
+
+WORDS = "клиент менеджер задача пилот внедрение оценка сотрудников платформа встреча бюджет решение компании процесс".split()
+
+
+def make_synthetic_file(path: Path, target_bytes: int, seed: int = 42) -> int:
+    """Создает файл из JSON-подобных строк примерно заданного размера, возвращает число строк"""
+    rng = random.Random(seed)
+    lines = []
+    size = 0
+    while size < target_bytes:
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 25)))
+        line = f'    {{"speaker": "Участник {rng.randint(1, 5)}", "text": "{text}"}},'
+        lines.append(line)
+        size += len(line.encode("utf-8")) + 1
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return len(lines)
+
+
+def _timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def bench_ranged_views(sizes=(300 * 1024, 5 * 1024 * 1024, 50 * 1024 * 1024), page: int = 100, repeat: int = 20):
+    """Сравнивает полный view, старый ranged view (чтение всего файла) и ranged view через индекс + mmap"""
+    tmp_dir = Path(tempfile.mkdtemp(prefix="memory_bench_"))
+    try:
+        memory = MemoryTool(base_path=str(tmp_dir), page_tokens=None)
+
+        print(f"\n{'='*78}")
+        print(f"📏 view: полный файл vs диапазон из {page} строк (среднее по {repeat} вызовам, мс)")
+        print(f"{'='*78}")
+        print(f"{'Размер':>10} {'Строк':>9} {'Полный':>10} {'Диапазон (старый)':>18} {'Диапазон (индекс)':>18}")
+
+        for size in sizes:
+            name = f"synthetic_{size // 1024}kb.txt"
+            total_lines = make_synthetic_file(memory.transcripts_dir / name, size)
+            path = f"/transcripts/{name}"
+            full_path = memory.transcripts_dir / name
+            start = max(1, total_lines // 2)
+            view_range = [start, start + page - 1]
+
+            def full_view():
+                memory.cache.invalidate(str(full_path.resolve()))
+                memory.view(BetaMemoryTool20250818ViewCommand(command="view", path=path))
+
+            def legacy_ranged_view():
+                lines = full_path.read_text(encoding="utf-8").splitlines()
+                numbered = [f"{i + 1:4d}: {line}" for i, line in enumerate(lines)]
+                return "\n".join(numbered[view_range[0] - 1:view_range[1]])
+
+            def indexed_ranged_view():
+                memory.view(BetaMemoryTool20250818ViewCommand(command="view", path=path, view_range=view_range))
+
+            indexed_ranged_view()  # построение индекса не входит в замер
+            full_ms = _timed(full_view, repeat)
+            legacy_ms = _timed(legacy_ranged_view, repeat)
+            indexed_ms = _timed(indexed_ranged_view, repeat)
+
+            print(f"{size // 1024:>8}KB {total_lines:>9} {full_ms:>10.2f} {legacy_ms:>18.2f} {indexed_ms:>18.3f}")
+
+        print(f"\nСтатистика индекса: {memory.line_index.stats()}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_hot_document_edits(size: int = 1024 * 1024, edits: int = 3000, seed: int = 7):
+    """
+    Тысячи правок файла ~1MB: запись каждой правки в хранилище (hot_edit_threshold=None)
+    против горячего документа в памяти с отложенным сбросом на диск.
+    """
+    tmp_dir = Path(tempfile.mkdtemp(prefix="memory_bench_edits_"))
+    try:
+        print(f"\n{'='*78}")
+        print(f"✏️  {edits} правок (insert / str_replace) файла {size // 1024}KB")
+        print(f"{'='*78}")
+
+        results = {}
+        for label, threshold in (("Запись каждой правки", None), ("Горячий документ", 3)):
+            base_path = tmp_dir / label.replace(" ", "_")
+            memory = MemoryTool(base_path=str(base_path), hot_edit_threshold=threshold)
+            total_lines = make_synthetic_file(memory.memories_dir / "profile.md", size)
+            path = "/memories/profile.md"
+            rng = random.Random(seed)
+
+            start = time.perf_counter()
+            for n in range(edits):
+                if n % 2 == 0:
+                    memory.insert(BetaMemoryTool20250818InsertCommand(
+                        command="insert", path=path, insert_line=rng.randint(0, total_lines), insert_text=f"marker-{n}",
+                    ))
+                    total_lines += 1
+                else:
+                    memory.str_replace(BetaMemoryTool20250818StrReplaceCommand(
+                        command="str_replace", path=path, old_str=f"marker-{n - 1}\n", new_str=f"marker-{n - 1} (обновлено)\n",
+                    ))
+            edit_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            memory.close()
+            close_s = time.perf_counter() - start
+
+            results[label] = (memory.memories_dir / "profile.md").read_text(encoding="utf-8")
+            print(f"{label:<22} правки: {edit_s:7.2f}s ({edit_s / edits * 1000:6.2f} мс/правка), сброс при close: {close_s * 1000:6.1f} мс")
+            if memory.documents:
+                print(f"{'':<22} {memory.documents.stats()}")
+
+        same = len(set(results.values())) == 1
+        print(f"Итоговые файлы совпадают: {'✅' if same else '❌'}")
+        return same
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_view_many(base_path: str = "./memory", pattern: str = "/transcripts/*.json", budget: int = 500_000):
+    """
+    Чтение всех транскриптов: отдельный view на каждый файл против view_many с курсором.
+    Число вызовов инструмента = минимальное число ходов модели в tool loop.
+    """
+    # Без постраничной выдачи: каждый view возвращает файл целиком
+    memory = MemoryTool(base_path=base_path, view_many_max_bytes=budget, view_many_max_tokens=budget, page_tokens=None)
+    files = memory._glob(pattern)
+    if not files:
+        print(f"\n⚠️ Нет файлов для {pattern} в {base_path}, пропускаю bench_view_many")
+        return
+
+    print(f"\n{'='*78}")
+    print(f"📚 {len(files)} файлов: view по одному vs view_many (бюджет {budget // 1000}KB на вызов)")
+    print(f"{'='*78}")
+
+    start = time.perf_counter()
+    for path, _, _ in files:
+        memory.execute(BetaMemoryTool20250818ViewCommand(command="view", path=path))
+    single_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cursor = None
+    while True:
+        result = memory.call_stats.wrap("view_many", memory.view_many)([pattern], cursor=cursor)
+        match = re.search(r'cursor="([^"]+)"', result)
+        if not match:
+            break
+        cursor = match.group(1)
+    many_s = time.perf_counter() - start
+
+    stats = memory.call_stats.summary()
+    for name, seconds in (("view", single_s), ("view_many", many_s)):
+        entry = stats[name]
+        print(f"{name:<10} вызовов (ходов): {entry['calls']:>4}  время: {seconds * 1000:8.1f} мс  результат: {entry['result_bytes'] / 1024:9.1f} KB")
+
+
+def _stub_cache_transport() -> httpx.MockTransport:
+    """
+    Заглушка Messages API с поведением prompt caching: префикс до каждой метки cache_control
+    (tools -> system -> messages) записывается в кэш, при повторе - читается; токены - оценка estimate_tokens.
+    """
+    seen = set()
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        system = body.get("system", [])
+        blocks = [(json.dumps(tool, ensure_ascii=False), False) for tool in body.get("tools", [])]
+        blocks += [(system, False)] if isinstance(system, str) else [(b["text"], "cache_control" in b) for b in system]
+        for message in body["messages"]:
+            content = message["content"]
+            blocks += [(content, False)] if isinstance(content, str) else [(b.get("text", ""), "cache_control" in b) for b in content]
+
+        tokens = [estimate_tokens(text) for text, _ in blocks]
+        digest, prefixes = hashlib.sha256(), []
+        for k, (text, marked) in enumerate(blocks):
+            digest.update(text.encode("utf-8"))
+            if marked:
+                prefixes.append((digest.copy().hexdigest(), sum(tokens[:k + 1])))
+        read = max((n for key, n in prefixes if key in seen), default=0)
+        written = max((n for key, n in prefixes), default=0) - read
+        seen.update(key for key, _ in prefixes)
+        usage = {
+            "input_tokens": sum(tokens) - read - written,
+            "cache_creation_input_tokens": written,
+            "cache_read_input_tokens": read,
+            "output_tokens": 1,
+        }
+        return httpx.Response(200, json={
+            "id": "msg_stub", "type": "message", "role": "assistant", "model": body["model"],
+            "content": [{"type": "text", "text": "ok"}], "stop_reason": "end_turn", "stop_sequence": None, "usage": usage,
+        })
+
+    return httpx.MockTransport(handle)
+
+
+def bench_prompt_cache(questions: int = 15, threads: int = 10):
+    """
+    Запросы, как в query_handler_multithreaded, к заглушке API: system строкой с номером вопроса
+    против кэшируемого system без номера (номер - в сообщении пользователя).
+    """
+    memory = MemoryTool()
+    tools = [tool.to_dict() for tool in memory.function_tools()]
+    system = SYSTEM_PROMPT + FUNCTION_TOOLS_PROMPT + "\n[PLACEHOLDER2]"
+
+    print(f"\n{'='*78}")
+    print(f"🧾 Prompt caching на заглушке API: {questions} вопросов, {threads} потоков")
+    print(f"{'='*78}")
+    for label, cached in (("system с номером", False), ("общий префикс", True)):
+        client = Anthropic(api_key="stub", http_client=httpx.Client(transport=_stub_cache_transport()))
+        usage = CacheUsage()
+
+        def ask(i: int):
+            file_name = f"demo2pilots_analysis_Q{i + 1}.txt"
+            if cached:
+                params = {"system": cached_system(system.replace("[PLACEHOLDER2]", "Имя файла ответа - в сообщении")),
+                          "messages": [{"role": "user", "content": f"Вопрос {i + 1}\n\nСохрани ответ в {file_name}"}]}
+            else:
+                params = {"system": system.replace("[PLACEHOLDER2]", f"Сохрани ответ в {file_name}"),
+                          "messages": [{"role": "user", "content": f"Вопрос {i + 1}"}]}
+            response = client.beta.messages.create(betas=BETAS, model=MODEL, max_tokens=100, tools=tools, **params)
+            usage.record(response.usage)
+
+        # Первый запрос создаёт кэш, остальные идут параллельно - как при прогреве в обработчике
+        ask(0)
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(ask, range(1, questions)))
+        stats = usage.summary()
+        print(f"{label:<17} обычные: {stats['input_tokens']:>7}  записано: {stats['cache_creation_input_tokens']:>6}  "
+              f"прочитано: {stats['cache_read_input_tokens']:>7}  ({stats['cache_hit_rate']:.1%})")
+    memory.close()
+
+
+def _stub_tool_loop_transport(latency: float) -> httpx.MockTransport:
+    """
+    Заглушка API для tool loop: первый ход создаёт файл через memory tool, второй - финальный текст.
+    Каждый ответ приходит через latency секунд.
+    """
+    def handle(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        time.sleep(latency)
+        if len(body["messages"]) == 1:
+            content = [{"type": "tool_use", "id": "toolu_stub", "name": "memory", "input": {
+                "command": "create", "path": "/memories/cassette_check.txt", "file_text": "записано моделью"}}]
+            stop = "tool_use"
+        else:
+            content = [{"type": "text", "text": "готово"}]
+            stop = "end_turn"
+        return httpx.Response(200, json={
+            "id": "msg_stub", "type": "message", "role": "assistant", "model": body["model"], "content": content,
+            "stop_reason": stop, "stop_sequence": None, "usage": {"input_tokens": 10, "output_tokens": 5},
+        })
+
+    return httpx.MockTransport(handle)
+
+
+def bench_cassette_replay(latency: float = 0.2):
+    """
+    Запись tool loop с заглушкой API в кассету и воспроизведение без сети: с исходной задержкой
+    и без неё. Файл, который создаёт memory tool, должен появляться и при воспроизведении.
+    """
+    tmp_dir = Path(tempfile.mkdtemp(prefix="cassette_"))
+    path = tmp_dir / "cassette.jsonl"
+    try:
+        print(f"\n{'='*78}")
+        print(f"📼 Кассета: tool loop из 2 ходов, задержка заглушки {latency}s на ответ")
+        print(f"{'='*78}")
+        for label, mode, scale in (("запись", "record", 1.0), ("воспроизведение x1", "replay", 1.0),
+                                   ("воспроизведение x0", "replay", 0.0)):
+            memory = MemoryTool(base_path=str(tmp_dir / "memory"))
+            (memory.memories_dir / "cassette_check.txt").unlink(missing_ok=True)
+            cassette = Cassette(path, mode, scale)
+            inner = _stub_tool_loop_transport(latency) if mode == "record" else None
+            client = Anthropic(api_key="stub", http_client=httpx.Client(transport=CassetteTransport(cassette, inner)))
+
+            start = time.perf_counter()
+            runner = client.beta.messages.tool_runner(
+                betas=BETAS, model=MODEL, max_tokens=100, tools=[memory],
+                messages=[{"role": "user", "content": "Создай файл cassette_check.txt"}],
+            )
+            texts = [block.text for message in runner for block in message.content if block.type == "text"]
+            elapsed = time.perf_counter() - start
+            memory.close()
+            created = (memory.memories_dir / "cassette_check.txt").exists()
+            stats = cassette.stats()
+            print(f"{label:<20} {elapsed:.2f}s  ответ: {' '.join(texts)!r}  файл: {'✅' if created else '❌'}  "
+                  f"записано {stats['recorded']}, воспроизведено {stats['replayed']}, промахов {stats['misses']}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _hammer(memory: MemoryTool, path: str, worker: int, edits: int):
+    """Чередует insert уникальной строки и str_replace собственного счётчика воркера"""
+    for n in range(edits):
+        memory.insert(BetaMemoryTool20250818InsertCommand(
+            command="insert", path=path, insert_line=0, insert_text=f"worker-{worker}-edit-{n}",
+        ))
+        memory.str_replace(BetaMemoryTool20250818StrReplaceCommand(
+            command="str_replace", path=path,
+            old_str=f"counter[{worker}]={n};", new_str=f"counter[{worker}]={n + 1};",
+        ))
+        memory.view(BetaMemoryTool20250818ViewCommand(command="view", path=path))
+
+
+def _hammer_in_process(base_path: str, backend: str, path: str, worker: int, edits: int):
+    _hammer(MemoryTool(base_path=base_path, process_lock=True, backend=backend), path, worker, edits)
+
+
+def _check_no_lost_updates(memory: MemoryTool, name: str, workers: int, edits: int) -> bool:
+    memory.flush()
+    content = memory.memories_storage.read_text(name)
+    lines = set(content.splitlines())
+    missing = [
+        f"worker-{w}-edit-{n}" for w in range(workers) for n in range(edits)
+        if f"worker-{w}-edit-{n}" not in lines
+    ]
+    bad_counters = [w for w in range(workers) if f"counter[{w}]={edits};" not in content]
+    leftovers = [p.name for p in memory.memories_dir.iterdir() if p.name.endswith(".tmp")]
+
+    ok = not missing and not bad_counters and not leftovers
+    print(f"  Потеряно вставок: {len(missing)}, неверных счётчиков: {len(bad_counters)}, временных файлов: {len(leftovers)} -> {'✅' if ok else '❌'}")
+    return ok
+
+
+def stress_concurrent_edits(threads: int = 10, processes: int = 4, edits: int = 50, backend: str = "filesystem",
+                            hot_edit_threshold: int | None = 3) -> bool:
+    """
+    Нагрузочная проверка: много потоков (и процессов с process_lock=True) редактируют один файл.
+    Ни одна вставка и ни одно обновление счётчика не должны потеряться.
+
+    hot_edit_threshold действует только на потоки (при process_lock горячие документы отключены):
+    None - все правки обычными транзакциями, большой порог - файл переводится в горячие посреди
+    параллельных правок. processes=0 пропускает проверку процессами.
+    """
+    tmp_dir = Path(tempfile.mkdtemp(prefix="memory_stress_"))
+    memory = MemoryTool(base_path=str(tmp_dir), backend=backend, hot_edit_threshold=hot_edit_threshold)
+    try:
+        print(f"\n{'='*78}")
+        print(f"🔒 Нагрузочная проверка ({backend}, hot_edit_threshold={hot_edit_threshold}): "
+              f"{threads} потоков / {processes} процессов x {edits} правок")
+        print(f"{'='*78}")
+
+        counters = "".join(f"counter[{w}]=0;\n" for w in range(threads))
+        memory.create(BetaMemoryTool20250818CreateCommand(command="create", path="/memories/threads.txt", file_text=counters))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for future in [executor.submit(_hammer, memory, "/memories/threads.txt", w, edits) for w in range(threads)]:
+                future.result()
+        promotions = memory.documents.promotions if memory.documents else 0
+        print(f"Потоки: {time.perf_counter() - start:.2f}s, переводов в горячие: {promotions}")
+        threads_ok = _check_no_lost_updates(memory, "threads.txt", threads, edits)
+        if not processes:
+            return threads_ok
+
+        counters = "".join(f"counter[{w}]=0;\n" for w in range(processes))
+        memory.create(BetaMemoryTool20250818CreateCommand(command="create", path="/memories/processes.txt", file_text=counters))
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [
+                executor.submit(_hammer_in_process, str(tmp_dir), backend, "/memories/processes.txt", w, edits)
+                for w in range(processes)
+            ]
+            for future in futures:
+                future.result()
+        print(f"Процессы: {time.perf_counter() - start:.2f}s")
+        processes_ok = _check_no_lost_updates(memory, "processes.txt", processes, edits)
+
+        return threads_ok and processes_ok
+    finally:
+        memory.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    bench_ranged_views()
+    bench_hot_document_edits()
+    for budget in (200_000, 500_000, 1_000_000):
+        bench_view_many(budget=budget)
+    for backend in ("filesystem", "sqlite"):
+        stress_concurrent_edits(backend=backend)
+        # Без горячих документов и с переводом в горячие на середине параллельных правок (10 потоков x 50 x 2 правки)
+        stress_concurrent_edits(backend=backend, processes=0, hot_edit_threshold=None)
+        stress_concurrent_edits(backend=backend, processes=0, hot_edit_threshold=500)
+    bench_prompt_cache()
+    bench_cassette_replay()
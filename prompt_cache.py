@@ -0,0 +1,61 @@
+"""
+Кэширование общего префикса запросов (prompt caching).
+
+Порядок префикса в API: tools -> system -> messages, поэтому метка cache_control на последнем
+блоке system кэширует и определения инструментов. Всё, что меняется от запроса к запросу
+(номер вопроса, имя сотрудника), должно идти после метки - в сообщении пользователя,
+тогда все потоки читают один и тот же закэшированный префикс.
+"""
+import threading
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Поля usage, которые суммируются по всем ответам
+USAGE_FIELDS = ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens", "output_tokens")
+
+
+def cached_system(*parts: str) -> list[dict]:
+    """system из текстовых блоков; последний помечен для кэширования вместе с tools"""
+    blocks = [{"type": "text", "text": part} for part in parts if part]
+    blocks[-1]["cache_control"] = CACHE_CONTROL
+    return blocks
+
+
+def user_content(stable: str, variable: str) -> list[dict]:
+    """
+    Содержимое сообщения пользователя: общий для всех запросов stable (кэшируется продолжением
+    префикса) и уникальный variable после него.
+    """
+    return [
+        {"type": "text", "text": stable, "cache_control": CACHE_CONTROL},
+        {"type": "text", "text": variable},
+    ]
+
+
+class CacheUsage:
+    """Потокобезопасная сумма usage по ответам модели: сколько токенов префикса записано и прочитано из кэша"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.totals = dict.fromkeys(USAGE_FIELDS, 0)
+
+    def record(self, usage):
+        """usage из ответа API (объект или dict); отсутствующие поля считаются нулём"""
+        get = usage.get if isinstance(usage, dict) else lambda name: getattr(usage, name, None)
+        with self._lock:
+            self.calls += 1
+            for name in USAGE_FIELDS:
+                self.totals[name] += get(name) or 0
+
+    def summary(self) -> dict:
+        with self._lock:
+            totals = dict(self.totals)
+            calls = self.calls
+        prompt = totals["input_tokens"] + totals["cache_creation_input_tokens"] + totals["cache_read_input_tokens"]
+        return {
+            "calls": calls,
+            **totals,
+            "prompt_tokens": prompt,
+            "cache_hit_rate": totals["cache_read_input_tokens"] / prompt if prompt else 0.0,
+        }
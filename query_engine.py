@@ -0,0 +1,381 @@
+"""
+Локальные ответы на типовые аналитические вопросы без LLM.
+
+QueryEngine работает по компактным строкам встреч из состояния analytics_builder: фильтры,
+группировка по 1-3 измерениям, конверсия, средние оценки критериев, периоды дат по правилам
+системного промпта (ISO-даты, границы включительно, месяцы, кварталы). answer() распознаёт
+вопрос и возвращает таблицу за миллисекунды; качественные вопросы (почему, закономерности,
+рекомендации) и нераспознанные возвращают None - их обрабатывает модель.
+"""
+from datetime import date, timedelta
+from pathlib import Path
+import calendar
+import time
+import re
+
+from analytics_builder import load_state, pearson
+from ConversionCube import DIMENSIONS, TASK_LABELS, UNKNOWN
+from meeting_records import SCORE_CRITERIA, quarter_of
+
+# Промпт для оформления локально посчитанного ответа (модель вызывается без инструментов)
+PHRASE_PROMPT = """Ты - аналитик отдела продаж. Данные ниже уже посчитаны точно по всем встречам базы.
+Сформулируй ответ на вопрос по этим данным: ключевые цифры, выводы, количество встреч в выборке.
+НЕ пересчитывай и НЕ меняй числа, НЕ добавляй данных, которых нет в таблице.
+При группах меньше 5 встреч предупреди о низкой статистической значимости."""
+
+# Вопросы, требующие интерпретации диалогов или выводов, - только через модель
+QUALITATIVE_RE = re.compile(
+    r"почему|закономерн|рекоменд|профил|пример|цитат|опиши|объясни|аномал|комбинац|сравни|"
+    r"паттерн|инсайт|качествен|предсказ|выше среднего|ниже среднего|почти всегда"
+)
+
+MONTH_STEMS = {
+    "январ": 1, "феврал": 2, "март": 3, "апрел": 4, "ма": 5, "июн": 6,
+    "июл": 7, "август": 8, "сентябр": 9, "октябр": 10, "ноябр": 11, "декабр": 12,
+}
+# Начало слова обязательно: иначе "ма[йяе]" находится в "самая", "март" - в "смарт"
+_MONTH = r"(?<!\w)(январ\w*|феврал\w*|март\w*|апрел\w*|ма[йяе]\b|июн\w*|июл\w*|август\w*|сентябр\w*|октябр\w*|ноябр\w*|декабр\w*)"
+DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b|\b(\d{1,2})\.(\d{1,2})\.(\d{4})\b|\b(\d{1,2})\s+" + _MONTH + r"(?:\s+(\d{4}))?")
+MONTH_RE = re.compile(_MONTH + r"(?:\s+(\d{4}))?")
+QUARTER_RE = re.compile(r"\bq([1-4])\s*(\d{4})\b|\b([1-4])\s*-?\s*(?:й|ый|ом)?\s*квартал\w*\s*(\d{4})")
+YEAR_RE = re.compile(r"\b(20\d\d)\s*(?:год|г\b)")
+
+# Ключевые слова измерений для группировки (порядок колонок - по первому упоминанию в вопросе)
+DIMENSION_PATTERNS = {
+    "acquisition_channel_name": r"мероприяти|конкретн\w* канал",
+    "acquisition_channel_type": r"канал",
+    "month": r"месяц",
+    "quarter": r"по квартал",
+    "manager_group": r"менеджер",
+    "client_task_classification": r"задач|тип\w* клиент",
+    "client_industry": r"индустри|отрасл",
+    "client_status": r"статус",
+}
+
+# Упоминания критериев в вопросах (названия из CREATE_ANALYTICS_DATABASE_PROMPT)
+CRITERION_PATTERNS = {
+    "rapport_building": r"rapport|раппорт|установлени\w* контакт",
+    "situation_discovery": r"выявлени\w* (текущей )?ситуаци",
+    "problem_existence_depth": r"глубин\w* (выявлени\w* |понимани\w* )?проблем",
+    "problem_implications": r"последстви\w* проблем",
+    "need_payoff_clarity": r"желаем\w* результат|need.payoff",
+    "sales_questioning_quality": r"качеств\w* вопрос",
+    "solution_fit": r"соответстви\w* решени",
+    "engagement_dynamics": r"динамик\w* вовлеченност",
+    "client_engagement": r"(?<!динамика )вовлеченност",
+    "solution_presentation_quality": r"презентаци",
+    "understanding_validation": r"проверк\w* понимани",
+    "objection_handling": r"возражени",
+    "clear_next_steps": r"следующ\w* шаг",
+    "stakeholder_mapping": r"стейкхолдер|лиц\w*,? принимающ",
+    "budget_timeline_qualification": r"бюджет",
+    "cognitive_overload_assessment": r"когнитивн|перегруз",
+}
+
+SMALL_SAMPLE = 5
+
+
+def normalize(text: str) -> str:
+    return text.casefold().replace("ё", "е").replace("`", " ").replace("«", " ").replace("»", " ")
+
+
+def _month_number(word: str) -> int:
+    return next(number for stem, number in MONTH_STEMS.items() if word.startswith(stem))
+
+
+def _month_range(year: int, month: int) -> tuple[str, str]:
+    return f"{year}-{month:02d}-01", f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+
+
+def _date(year: int, month: int, day: int) -> date | None:
+    """Дата или None для несуществующей ("31 февраля", "2025-13-01")"""
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def parse_period(text: str, years: list[int] | None = None) -> list[tuple[str, str]] | None:
+    """
+    Периоды из текста вопроса как список включительных диапазонов ISO-дат.
+
+    "01.11.2025"/"2025-11-01" - день, две даты - диапазон, "после/с/до/по <дата>" - открытые границы,
+    "ноябрь 2025" - месяц, "Q4 2025"/"4 квартал 2025" - квартал, "2025 год" - год.
+    Месяц или день без года берётся для каждого года из years; несуществующие даты пропускаются.
+    None - период не указан.
+    """
+    text = normalize(text)
+    years = years or []
+
+    dates = []
+    for match in DATE_RE.finditer(text):
+        iso_y, iso_m, iso_d, d, m, y, word_d, word_m, word_y = match.groups()
+        if iso_y:
+            days = [_date(int(iso_y), int(iso_m), int(iso_d))]
+        elif y:
+            days = [_date(int(y), int(m), int(d))]
+        else:
+            month = _month_number(word_m)
+            days = [_date(year, month, int(word_d)) for year in ([int(word_y)] if word_y else years)]
+        days = [(day, match.start()) for day in days if day is not None]
+        if days:
+            dates.append(days)
+
+    if len(dates) >= 2 and all(len(d) == 1 for d in dates[:2]):
+        start, end = sorted([dates[0][0][0], dates[1][0][0]])
+        return [(start.isoformat(), end.isoformat())]
+    if dates:
+        ranges = []
+        for day, position in dates[0]:
+            before = text[:position].rstrip()
+            if re.search(r"(после|позже)$", before):
+                ranges.append(((day + timedelta(days=1)).isoformat(), "9999-12-31"))
+            elif re.search(r"(\bс|начиная с)$", before):
+                ranges.append((day.isoformat(), "9999-12-31"))
+            elif re.search(r"(\bдо|раньше)$", before):
+                ranges.append(("0000-01-01", (day - timedelta(days=1)).isoformat()))
+            elif re.search(r"\bпо$", before):
+                ranges.append(("0000-01-01", day.isoformat()))
+            else:
+                ranges.append((day.isoformat(), day.isoformat()))
+        return ranges
+
+    quarter = QUARTER_RE.search(text)
+    if quarter:
+        number, year = (quarter.group(1), quarter.group(2)) if quarter.group(1) else (quarter.group(3), quarter.group(4))
+        first = (int(number) - 1) * 3 + 1
+        return [(_month_range(int(year), first)[0], _month_range(int(year), first + 2)[1])]
+
+    months = []
+    for match in MONTH_RE.finditer(text):
+        month = _month_number(match.group(1))
+        for year in ([int(match.group(2))] if match.group(2) else years):
+            months.append(_month_range(year, month))
+    if months:
+        return months
+
+    year = YEAR_RE.search(text)
+    if year:
+        return [(f"{year.group(1)}-01-01", f"{year.group(1)}-12-31")]
+    return None
+
+
+def format_table(rows: list[dict]) -> str:
+    """Таблица через " | ", как у sql_query"""
+    if not rows:
+        return "(0 rows)"
+    columns = list(rows[0])
+    lines = [" | ".join(columns)]
+    lines.extend(" | ".join("" if row[c] is None else str(row[c]) for c in columns) for row in rows)
+    return "\n".join(lines + [f"({len(rows)} rows)"])
+
+
+class QueryEngine:
+    """Фильтры, группировка и конверсия по строкам встреч в памяти"""
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda row: row["meeting_id"])
+        self.years = sorted({int(row["meeting_date"][:4]) for row in self.rows if row["meeting_date"]})
+        self.values = {
+            dim: sorted({str(self.value(row, dim)) for row in self.rows} - {UNKNOWN})
+            for dim in ("acquisition_channel_type", "acquisition_channel_name", "client_industry", "client_status")
+        }
+        self.answered = 0
+
+    @classmethod
+    def from_state(cls, state_path: str | Path = "./memory/analytics_state.json") -> "QueryEngine":
+        _, accumulator = load_state(state_path)
+        return cls(accumulator.rows.values())
+
+    @staticmethod
+    def value(row: dict, dim: str):
+        """Значение измерения или оценка критерия у встречи"""
+        if dim in SCORE_CRITERIA:
+            return row["scores"].get(dim)
+        if dim == "client_task_classification":
+            return TASK_LABELS.get(row["task"], UNKNOWN)
+        if dim == "quarter":
+            return quarter_of(row["meeting_date"] or "") or UNKNOWN
+        if dim == "meeting_success":
+            return row["meeting_success"] or UNKNOWN
+        return row["index"][DIMENSIONS[dim]] or UNKNOWN
+
+    def select(self, filters: dict[str, set] | None = None, periods: list[tuple[str, str]] | None = None) -> list[dict]:
+        """Встречи, прошедшие все фильтры {измерение: допустимые значения} и попавшие в один из периодов"""
+        filters = filters or {}
+        rows = []
+        for row in self.rows:
+            if periods is not None:
+                day = row["meeting_date"]
+                if not day or not any(start <= day <= end for start, end in periods):
+                    continue
+            if all(self.value(row, dim) in allowed for dim, allowed in filters.items()):
+                rows.append(row)
+        return rows
+
+    def group(self, rows: list[dict], dims: list[str], criteria: list[str] = ()) -> list[dict]:
+        """Встречи, успешные, конверсия и средние критериев по комбинациям значений dims"""
+        groups = {}
+        for row in rows:
+            key = tuple(self.value(row, dim) for dim in dims)
+            if None in key:
+                continue
+            groups.setdefault(key, []).append(row)
+
+        result = []
+        for key, members in sorted(groups.items(), key=lambda item: tuple(str(v) for v in item[0])):
+            successful = sum(row["is_success"] for row in members)
+            entry = dict(zip(dims, key))
+            entry.update(total=len(members), successful=successful, conversion=round(100.0 * successful / len(members), 2))
+            for name in criteria:
+                scores = [row["scores"][name] for row in members if name in row["scores"]]
+                entry[f"avg_{name}"] = round(sum(scores) / len(scores), 2) if scores else None
+            result.append(entry)
+        return result
+
+    def query(self, group_by: list[str] = (), filters: dict[str, set] | None = None,
+              periods: list[tuple[str, str]] | None = None, criteria: list[str] = ()) -> list[dict]:
+        return self.group(self.select(filters, periods), list(group_by), list(criteria))
+
+    def criteria_by_status(self, rows: list[dict]) -> list[dict]:
+        """Средние оценки критериев у успешных и неуспешных встреч и их разница"""
+        result = []
+        for name in SCORE_CRITERIA:
+            means = {}
+            for status in ("да", "нет"):
+                scores = [row["scores"][name] for row in rows if row["meeting_success"] == status and name in row["scores"]]
+                means[status] = round(sum(scores) / len(scores), 2) if scores else None
+            difference = round(means["да"] - means["нет"], 2) if None not in means.values() else None
+            result.append({"criterion": name, "successful": means["да"], "failed": means["нет"], "difference": difference})
+        return sorted(result, key=lambda entry: -(entry["difference"] or 0))
+
+    def correlations(self, rows: list[dict], top: int) -> list[dict]:
+        """Топ критериев по точечно-бисериальной корреляции с успехом"""
+        result = []
+        for name in SCORE_CRITERIA:
+            pairs = [(row["scores"][name], row["is_success"]) for row in rows if name in row["scores"]]
+            r = pearson([p[0] for p in pairs], [p[1] for p in pairs])
+            if r is not None:
+                result.append({"criterion": name, "correlation": round(r, 4), "meetings": len(pairs)})
+        return sorted(result, key=lambda entry: -entry["correlation"])[:top]
+
+    def filters(self, text: str) -> dict[str, set]:
+        """Фильтры из нормализованного вопроса: значения измерений, менеджеры, тип задачи, успешность"""
+        filters = {}
+        for dim, values in self.values.items():
+            mentioned = {v for v in values if re.search(rf"(?<!\w){re.escape(normalize(v).replace('_', ' '))}(?!\w)", text.replace("_", " "))}
+            if mentioned:
+                filters[dim] = mentioned
+        for surname in {name.split()[-1] for row in self.rows for name in (row["index"]["by_sales_manager"] or "").split(" + ") if name}:
+            if normalize(surname)[:-1] in text:
+                groups = {row["index"]["by_sales_manager"] for row in self.rows}
+                filters.setdefault("manager_group", set()).update(g for g in groups if g and surname in g)
+
+        with_task = re.search(r"\bс (конкретн\w* |четк\w* )?задач", text)
+        without_task = re.search(r"без задач|задач\w*\s*/\s*без\b", text)
+        if bool(with_task) != bool(without_task):
+            filters["client_task_classification"] = {"with_task" if with_task else "without_task"}
+
+        if re.search(r"\bуспешн", text) and not re.search(r"неуспешн|провал", text):
+            filters["meeting_success"] = {"да"}
+        elif re.search(r"неуспешн|провальн", text) and not re.search(r"\bуспешн", text):
+            filters["meeting_success"] = {"нет"}
+        return filters
+
+    @staticmethod
+    def dimensions(text: str, filters: dict[str, set]) -> list[str]:
+        """Измерения группировки в порядке упоминания; зафиксированные фильтром одним значением не группируются"""
+        dims = sorted(
+            (re.search(pattern, text).start(), dim) for dim, pattern in DIMENSION_PATTERNS.items()
+            if re.search(pattern, text) and len(filters.get(dim, ())) != 1
+        )
+        dims = [dim for _, dim in dims]
+        if "acquisition_channel_name" in dims and "acquisition_channel_type" in dims:
+            dims.remove("acquisition_channel_type")
+        return dims
+
+    def answer(self, question: str) -> dict | None:
+        """Локальный ответ {"intent", "text", "meetings", "elapsed_ms"} или None, если нужен LLM"""
+        start = time.perf_counter()
+        text = normalize(question)
+        if QUALITATIVE_RE.search(text):
+            return None
+
+        periods = parse_period(text, self.years)
+        filters = self.filters(text)
+        criteria = [name for name, pattern in CRITERION_PATTERNS.items() if re.search(pattern, text)]
+        rows = self.select(filters, periods)
+
+        if "критери" in text and re.search(r"коррелир|корреляц|связан\w* с успех", text):
+            top = re.search(r"топ-?\s*(\d+)", text)
+            intent, table = "correlations", self.correlations(rows, int(top.group(1)) if top else 3)
+        elif "критери" in text and re.search(r"оценк|балл", text) and re.search(r"\bуспешн", text) and re.search(r"неуспешн|провал", text):
+            intent, table = "criteria_by_status", self.criteria_by_status(rows)
+        else:
+            dims = self.dimensions(text, filters)
+            if re.search(r"средн\w* (оценк|балл)", text) and criteria:
+                intent, table = "criterion_mean", self.group(rows, dims, criteria)
+                if not dims:
+                    table = [{k: v for k, v in entry.items() if k != "conversion"} for entry in table]
+            elif "конверси" in text and (dims or criteria):
+                # Критерий в вопросе о конверсии - ещё одно измерение (по значению оценки)
+                dims = (dims + criteria)[:3]
+                intent, table = "conversion", self.group(rows, dims)
+                table = self._threshold(text, dims, table, rows)
+            else:
+                return None
+
+            if re.search(r"высок|лучш|наибольш|топ|максимальн", text):
+                table.sort(key=lambda entry: (-entry.get("conversion", 0), -entry["total"]))
+            elif re.search(r"худш|низк|наименьш", text):
+                table.sort(key=lambda entry: (entry.get("conversion", 0), -entry["total"]))
+
+        if table is None:
+            return None
+        self.answered += 1
+        return {
+            "intent": intent,
+            "text": self._describe(periods, filters, rows, table),
+            "meetings": len(rows),
+            "elapsed_ms": (time.perf_counter() - start) * 1000,
+        }
+
+    def _threshold(self, text: str, dims: list[str], table: list[dict], rows: list[dict]) -> list[dict] | None:
+        """"конверсия >50%": порог применяется к первому измерению, остальные показываются для прошедших"""
+        match = re.search(r"конверси\w*\s*(>=|<=|>|<|больше|меньше|выше|ниже)\s*(\d+(?:[.,]\d+)?)\s*%?", text)
+        if not match:
+            return table
+        operator, limit = match.group(1), float(match.group(2).replace(",", "."))
+        compare = {
+            ">": lambda v: v > limit, "больше": lambda v: v > limit, "выше": lambda v: v > limit,
+            "<": lambda v: v < limit, "меньше": lambda v: v < limit, "ниже": lambda v: v < limit,
+            ">=": lambda v: v >= limit, "<=": lambda v: v <= limit,
+        }[operator]
+        passed = {entry[dims[0]] for entry in self.group(rows, dims[:1]) if compare(entry["conversion"])}
+        return [entry for entry in table if entry[dims[0]] in passed] if len(dims) > 1 else \
+            [entry for entry in table if compare(entry["conversion"])]
+
+    def _describe(self, periods, filters, rows, table) -> str:
+        lines = []
+        if periods:
+            lines.append("Период: " + ", ".join(
+                f"{start if start != '0000-01-01' else '...'} — {end if end != '9999-12-31' else '...'}" for start, end in periods
+            ) + " (границы включительно)")
+        if filters:
+            lines.append("Фильтры: " + "; ".join(f"{dim} ∈ {{{', '.join(sorted(map(str, v)))}}}" for dim, v in filters.items()))
+        lines.append(f"Встреч в выборке: {len(rows)} (конверсия = meeting_success 'да' / все встречи группы)")
+        lines.append(format_table(table))
+        small = sum(1 for entry in table if entry.get("total", SMALL_SAMPLE) < SMALL_SAMPLE)
+        if small:
+            lines.append(f"⚠️ Групп с < {SMALL_SAMPLE} встречами: {small} - низкая статистическая значимость")
+        return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import sys
+
+    engine = QueryEngine.from_state()
+    for question in sys.argv[1:]:
+        result = engine.answer(question)
+        print(f"\n❓ {question}")
+        print("→ LLM" if result is None else f"{result['text']}\n({result['intent']}, {result['elapsed_ms']:.1f} ms)")
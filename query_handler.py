@@ -1,4 +1,4 @@
-from MemoryTool import MemoryTool, SYSTEM_PROMPT, MODEL, BETAS
+from MemoryTool import MemoryTool, SYSTEM_PROMPT, FUNCTION_TOOLS_PROMPT, MODEL, BETAS
 from ClaudeClient import Client
 import time
 
@@ -26,7 +26,7 @@ if __name__ == "__main__":
         "Сравни: внутренние vs внешние мероприятия - разница в конверсии, оценках критериев, типах клиентов?",
     ]
 
-    new_sys_prompt = SYSTEM_PROMPT + """\n\nВы - аналитический ассистент для руководителя отдела продаж компании RConf, которая разрабатывает и продает платформу видеоконференцсвязи с искусственным интеллектом для оценки и развития сотрудников.
+    new_sys_prompt = SYSTEM_PROMPT + FUNCTION_TOOLS_PROMPT + """\n\nВы - аналитический ассистент для руководителя отдела продаж компании RConf, которая разрабатывает и продает платформу видеоконференцсвязи с искусственным интеллектом для оценки и развития сотрудников.
 Ваша главная задача - Анализировать базу данных встреч с клиентами для выявления:
 
 - Корреляций между качеством проведения встреч и конверсией в покупку
@@ -225,7 +225,7 @@ if __name__ == "__main__":
               model=MODEL,
               max_tokens=10000, # max_tokens для ответа
               system=new_sys_prompt + f"**Свой финальный ответ сохраняйте в файле с названием `demo2pilots_analysis_Q{i + 1}.md`**",
-              tools=[memory],
+              tools=[memory, *memory.function_tools()],
               messages=[
                   {
                       "role":"user",
@@ -0,0 +1,155 @@
+"""
+asyncio-версия query_handler_multithreaded: вопросы - задачи одного event loop на AsyncAnthropic.
+
+Одновременно обрабатывается не больше MAX_CONCURRENCY вопросов (семафор), у каждого свой дедлайн.
+Синхронные инструменты (MemoryTool, sql_query, search, conversion_breakdown) и файловый ввод-вывод
+выполняются в небольшом пуле TOOL_WORKERS потоков, поэтому сотни вопросов не требуют сотен потоков.
+Выходные файлы те же, что у многопоточной версии.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+
+from anthropic.lib.tools import BetaAsyncBuiltinFunctionTool
+
+from MemoryTool import MemoryTool, MODEL, BETAS
+from ClaudeClient import AsyncClient
+from query_engine import PHRASE_PROMPT
+from prompt_cache import cached_system
+from query_handler_multithreaded import (
+    ANALYST_PROMPT, QUESTIONS, prepare_session, print_summary, question_message, read_memory_file, response_path,
+    write_memory_file, write_response,
+)
+from stream_metrics import TurnTimer
+
+MAX_CONCURRENCY = 50
+TOOL_WORKERS = 8
+# Дедлайн на один вопрос (секунды), включая все ходы tool loop
+QUESTION_DEADLINE = 900
+
+
+class ExecutorTool(BetaAsyncBuiltinFunctionTool):
+    """Синхронный инструмент для async tool_runner: call() выполняется в общем пуле потоков"""
+
+    def __init__(self, tool, executor: ThreadPoolExecutor):
+        self.tool = tool
+        self.executor = executor
+
+    def to_dict(self):
+        return self.tool.to_dict()
+
+    async def call(self, input: object):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.tool.call, input)
+
+
+async def process_question(i, query, session, client, memory, tools, executor, semaphore, deadline=QUESTION_DEADLINE):
+    """Как query_handler_multithreaded.process_question; по истечении deadline вопрос отменяется"""
+    offload = lambda fn, *args: asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+    answer_cache, versions, usage = session["answer_cache"], session["versions"], session["usage"]
+    analysis_file = f"demo2pilots_analysis_Q{i + 1}.txt"
+
+    async with semaphore:
+        start_time = time.time()
+        print(f"[Task {i+1}] Processing query: {query}")
+        try:
+            async with asyncio.timeout(deadline):
+                cached = await offload(answer_cache.get, query, *versions)
+                if cached is not None:
+                    if "analysis" in cached["files"]:
+                        await offload(write_memory_file, memory, analysis_file, cached["files"]["analysis"])
+                    time_elapsed = time.time() - start_time
+                    await offload(write_response, i, query, time_elapsed, cached["answer"],
+                                  f"answer cache, originally {cached['elapsed']:.2f} seconds")
+                    print(f"[Task {i+1}] 💾 Cached answer in {time_elapsed:.2f}s (saved {cached['elapsed']:.2f}s)")
+                    return i, time_elapsed, "cached"
+
+                local = session["engine"].answer(query)
+                if local is not None:
+                    response = await client.client.messages.create(
+                        model=MODEL,
+                        max_tokens=2000,
+                        system=PHRASE_PROMPT,
+                        messages=[{"role": "user", "content": f"Вопрос: {query}\n\nДанные:\n{local['text']}"}],
+                    )
+                    usage.record(response.usage)
+                    answer = "\n".join(block.text for block in response.content if block.type == "text")
+                    answer += "\n\n" + local["text"]
+                    time_elapsed = time.time() - start_time
+                    await offload(write_response, i, query, time_elapsed, answer, f"local query engine: {local['intent']}")
+                    await offload(lambda: answer_cache.put(query, *versions, answer=answer, files={}, elapsed=time_elapsed))
+                    print(f"[Task {i+1}] ⚡ Answered locally in {time_elapsed:.2f}s")
+                    return i, time_elapsed, "success"
+
+                # Итоги встреч читаются из транскриптов - в пуле, как и инструменты
+                plan = await offload(session["planner"].plan, query)
+                if plan is not None:
+                    print(f"[Task {i+1}] 🧭 Preloaded {len(plan['meetings'])} meetings (~{plan['tokens']} tokens)")
+                runner = client.client.beta.messages.tool_runner(
+                    betas=BETAS,
+                    model=MODEL,
+                    max_tokens=7500,
+                    system=cached_system(ANALYST_PROMPT),
+                    tools=tools,
+                    messages=[{"role": "user", "content": question_message(i, query, plan)}],
+                    stream=True,
+                )
+                all_text = []
+                timer = TurnTimer()
+                # Дописывание небольших кусков текста в локальный файл не блокирует loop заметно
+                with open(response_path(i), "w", encoding="utf-8") as out:
+                    out.write(f"Question {i+1}: {query}\n\n")
+                    async for stream in runner:
+                        message = await timer.consume_async(stream, out)
+                        usage.record(message.usage)
+                        texts = [block.text for block in message.content if block.type == "text"]
+                        if texts:
+                            out.write("\n")
+                        all_text.extend(texts)
+
+                    time_elapsed = time.time() - start_time
+                    metrics = timer.summary()
+                    out.write(f"\nTime took for question {i+1}: {time_elapsed:.2f} seconds "
+                              f"(TTFT {metrics['ttft']}s, {metrics['turns']} turns, {metrics['tokens_per_s']} tokens/s)\n")
+                session["streams"].record(i, query, metrics)
+                analysis = await offload(read_memory_file, memory, analysis_file)
+                await offload(lambda: answer_cache.put(
+                    query, *versions, answer="\n".join(all_text),
+                    files={"analysis": analysis} if analysis is not None else {}, elapsed=time_elapsed,
+                ))
+                print(f"[Task {i+1}] ✅ Completed in {time_elapsed:.2f}s (TTFT {metrics['ttft']}s)")
+                return i, time_elapsed, "success"
+
+        except TimeoutError:
+            print(f"[Task {i+1}] ⏰ Deadline {deadline}s exceeded, cancelled")
+            return i, time.time() - start_time, f"timeout after {deadline}s"
+        except Exception as e:
+            print(f"[Task {i+1}] ❌ Error: {e}")
+            return i, 0, f"error: {e}"
+
+
+async def run_questions(questions, session, client, memory, max_concurrency=MAX_CONCURRENCY, deadline=QUESTION_DEADLINE):
+    """Все вопросы как задачи TaskGroup; результаты - (номер, время, статус) в порядке вопросов"""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    with ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tools") as executor:
+        tools = [ExecutorTool(tool, executor) for tool in session["tools"]]
+        async with asyncio.TaskGroup() as group:
+            tasks = [
+                group.create_task(process_question(i, query, session, client, memory, tools, executor, semaphore, deadline))
+                for i, query in enumerate(questions)
+            ]
+    return [task.result() for task in tasks]
+
+
+if __name__ == "__main__":
+    client = AsyncClient()
+    memory = MemoryTool(token_log_path="reports/memory_tool_tokens.jsonl")
+    session = prepare_session(memory)
+
+    total_start = time.time()
+    try:
+        results = asyncio.run(run_questions(QUESTIONS, session, client, memory))
+    finally:
+        memory.close()
+        session["answer_cache"].save()
+    total_time = time.time() - total_start
+    print_summary(session, memory, results, total_time, len(QUESTIONS))
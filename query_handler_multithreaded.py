@@ -3,82 +3,37 @@
 
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
-from MemoryTool import MemoryTool, SYSTEM_PROMPT, MODEL, BETAS
-from ClaudeClient import Client
-
-def process_question(i, query, new_sys_prompt, client, memory):
-    """Обрабатывает один вопрос"""
-    start_time = time.time()
-    
-    print(f"\n{'='*60}\n")
-    print(f"Started Thread {i+1}\n---\nProcessing query: {query}\n")
-    print(f"\n{'='*60}\n")
-
-    try:
-        new_sys_prompt = new_sys_prompt.replace("[PLACEHOLDER1]", f"Если создаешь файл с прогрессом - СОЗДАВАЙ ТОЛЬКО С НАЗВАНИЕМ progress_Q{i + 1}.txt")
-        new_sys_prompt = new_sys_prompt.replace("[PLACEHOLDER2]", f"**Свой финальный ответ ВСЕГДА СОХРАНЯЙ В ФАЙЛЕ с названием `demo2pilots_analysis_Q{i + 1}.txt`** даже если ответ уже есть в базе")
-        
-        runner = client.client.beta.messages.tool_runner(
-            betas=BETAS,
-            model=MODEL,
-            max_tokens=7500,
-            system=new_sys_prompt,
-            tools=[memory],
-            messages=[
-                {
-                    "role": "user",
-                    "content": query,
-                }
-            ]
-        )
-
-        all_text = []
-        for message in runner:
-            for block in message.content:
-                if block.type == "text":
-                    print(block.text)
-                    all_text.append(block.text)
-        
-        end_time = time.time()
-        time_elapsed = end_time - start_time
-        
-        output_file = f"tests/Demo2Pilots Test/LLM_Generation_Response{i+1}.txt"
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(f"Question {i+1}: {query}\n")
-            f.write(f"Time took for question {i+1}: {time_elapsed:.2f} seconds\n\n")
-            f.write("\n".join(all_text))
-        
-        print(f"[Thread {i+1}] ✅ Completed in {time_elapsed:.2f}s")
-        return i, time_elapsed, "success"
-        
-    except Exception as e:
-        print(f"[Thread {i+1}] ❌ Error: {e}")
-        return i, 0, f"error: {e}"
-
-
-if __name__ == "__main__":
-    client = Client()
-    memory = MemoryTool()
-    
-    questions_list = [
-        "Какие каналы привлечения показали самую высокую конверсию?",
-        "Какая средняя конверсия по месяцам?",
-        "Какая конверсия у клиентов, пришедших с конкретной задачей vs без задачи?",
-        "Какие менеджеры показали лучшую конверсию?",
-        "Какая средняя оценка по критерию `Глубина выявления проблемы` у успешных встреч?",
-        "Как конверсия зависит от канала привлечения И месяца?",
-        "Как конверсия зависит от типа клиента (с задачей/без) И индустрии?",
-        "Какие критерии качества встречи больше всего коррелируют с успехом (топ-3)?",
-        "Как конверсия менеджеров менялась по месяцам?",
-        "Есть ли разница в оценках критериев между успешными и неуспешными встречами?",
-        "Какие конкретные мероприятия в апреле показали конверсию >50%, и какие менеджеры их проводили?",
-        "Для клиентов индустрии `Консалтинг`: как конверсия зависит от типа задачи И качества презентации решения?",
-        "Найди закономерность: успешные встречи с клиентами без задачи - какие критерии у них выше среднего?",
-        "Какие каналы привлечения приводят клиентов с конкретной задачей, и какая у них конверсия?",
-        "Сравни: внутренние vs внешние мероприятия - разница в конверсии, оценках критериев, типах клиентов?",
-    ]
-
-    new_sys_prompt = SYSTEM_PROMPT + """\n\nВы - аналитический ассистент для руководителя отдела продаж компании RConf, которая разрабатывает и продает платформу видеоконференцсвязи с искусственным интеллектом для оценки и развития сотрудников.
+from MemoryTool import MemoryTool, SYSTEM_PROMPT, FUNCTION_TOOLS_PROMPT, MODEL, BETAS
+from MeetingStore import MeetingStore, SQL_TOOL_PROMPT
+from TranscriptSearch import TranscriptSearch, SEARCH_TOOL_PROMPT
+from ConversionCube import ConversionCube, CUBE_TOOL_PROMPT
+from analytics_builder import update_analytics_db
+from query_engine import QueryEngine, PHRASE_PROMPT
+from query_planner import QueryPlanner, PRELOAD_INSTRUCTIONS
+from AnswerCache import AnswerCache, data_version, prompt_version
+from ClaudeClient import Client, LIMITER, CASSETTE
+from prompt_cache import CacheUsage, cached_system
+from stream_metrics import StreamStats, TurnTimer
+
+QUESTIONS = [
+    "Какие каналы привлечения показали самую высокую конверсию?",
+    "Какая средняя конверсия по месяцам?",
+    "Какая конверсия у клиентов, пришедших с конкретной задачей vs без задачи?",
+    "Какие менеджеры показали лучшую конверсию?",
+    "Какая средняя оценка по критерию `Глубина выявления проблемы` у успешных встреч?",
+    "Как конверсия зависит от канала привлечения И месяца?",
+    "Как конверсия зависит от типа клиента (с задачей/без) И индустрии?",
+    "Какие критерии качества встречи больше всего коррелируют с успехом (топ-3)?",
+    "Как конверсия менеджеров менялась по месяцам?",
+    "Есть ли разница в оценках критериев между успешными и неуспешными встречами?",
+    "Какие конкретные мероприятия в апреле показали конверсию >50%, и какие менеджеры их проводили?",
+    "Для клиентов индустрии `Консалтинг`: как конверсия зависит от типа задачи И качества презентации решения?",
+    "Найди закономерность: успешные встречи с клиентами без задачи - какие критерии у них выше среднего?",
+    "Какие каналы привлечения приводят клиентов с конкретной задачей, и какая у них конверсия?",
+    "Сравни: внутренние vs внешние мероприятия - разница в конверсии, оценках критериев, типах клиентов?",
+]
+
+ANALYST_PROMPT = SYSTEM_PROMPT + FUNCTION_TOOLS_PROMPT + SQL_TOOL_PROMPT + SEARCH_TOOL_PROMPT + CUBE_TOOL_PROMPT + """\n\nВы - аналитический ассистент для руководителя отдела продаж компании RConf, которая разрабатывает и продает платформу видеоконференцсвязи с искусственным интеллектом для оценки и развития сотрудников.
 Ваша главная задача - Анализировать базу данных встреч с клиентами для выявления:
 
 - Корреляций между качеством проведения встреч и конверсией в покупку
@@ -90,10 +45,10 @@ if __name__ == "__main__":
 
 ## ПОШАГОВАЯ ЛОГИКА ОБРАБОТКИ
   1. Проанализируй файл analytics_db.json - НЕ ИЗМЕНЯЙ ДАННЫЙ ФАЙЛ НИ В КОЕМ СЛУЧАЕ
-  2. [PLACEHOLDER1]
+  2. Файл с прогрессом (если нужен) называй только так, как указано в сообщении пользователя
   2. Выдели для себя нужную информацию и только затем проходись по нужным файлам (analytics_db.json содержит краткие сводки и индексы встреч, которые полезны для выявления нужных файлов для проверки)
   3. Игнорируй файлы с названием по типу "demo2pilots_analysis{{num}}.txt" - бери сводки только из вышеуказанных файлов и директории transripts/
-  4. [PLACEHOLDER2]
+  4. Свой финальный ответ ВСЕГДА сохраняй в файле с названием из сообщения пользователя, даже если ответ уже есть в базе
 
 ## **КРИТИЧЕСКИ ВАЖНО:** Подсчет встреч и статусы
 
@@ -256,8 +211,265 @@ if __name__ == "__main__":
 - При работе с датами всегда указывайте период и количество проанализированных встреч
 - Всегда явно указывайте количество встреч в выборке и методику подсчета
 """
+
+
+def answer_locally(query, local, client, usage=None):
+    """Модель только формулирует ответ по таблице, посчитанной QueryEngine"""
+    response = client.client.messages.create(
+        model=MODEL,
+        max_tokens=2000,
+        system=PHRASE_PROMPT,
+        messages=[{"role": "user", "content": f"Вопрос: {query}\n\nДанные:\n{local['text']}"}],
+    )
+    if usage is not None:
+        usage.record(response.usage)
+    return [block.text for block in response.content if block.type == "text"]
+
+
+def response_path(i):
+    return f"tests/Demo2Pilots Test/LLM_Generation_Response{i+1}.txt"
+
+
+def write_response(i, query, time_elapsed, text, source=""):
+    with open(response_path(i), "w", encoding="utf-8") as f:
+        f.write(f"Question {i+1}: {query}\n")
+        f.write(f"Time took for question {i+1}: {time_elapsed:.2f} seconds{f' ({source})' if source else ''}\n\n")
+        f.write(text)
+
+
+def read_memory_file(memory, key):
+    """Содержимое файла из /memories с учётом несброшенных правок или None"""
+    memory.flush()
+    if memory.memories_storage.kind(key) != "file":
+        return None
+    return memory.memories_storage.read_text(key)
+
+
+def write_memory_file(memory, key, text):
+    """Записывает файл в /memories целиком; горячий документ по key выгружается, иначе его сброс затрёт запись"""
+    if memory.documents:
+        memory.documents.release(key, flush=False)
+    if memory.memories_storage.kind(key) == "file":
+        memory.memories_storage.update(key, lambda _: text)
+    else:
+        memory.memories_storage.create(key, text)
+
+
+def question_message(i, query, plan=None):
+    """
+    Сообщение пользователя для tool loop. С планом QueryPlanner данные выборки идут перед вопросом;
+    имя файла анализа есть в обоих вариантах - его требуют SYSTEM_PROMPT и ANALYST_PROMPT
+    """
+    analysis_file = f"demo2pilots_analysis_Q{i + 1}.txt"
+    instructions = (
+        f"Если создаешь файл с прогрессом - СОЗДАВАЙ ТОЛЬКО С НАЗВАНИЕМ progress_Q{i + 1}.txt\n"
+        f"**Свой финальный ответ ВСЕГДА СОХРАНЯЙ В ФАЙЛЕ с названием `{analysis_file}`** даже если ответ уже есть в базе"
+    )
+    if plan is not None:
+        return f"{plan['context']}\n\n---\n{query}\n\n{PRELOAD_INSTRUCTIONS}\n{instructions}"
+    return f"{query}\n\n{instructions}"
+
+
+def process_question(i, query, new_sys_prompt, client, tools, engine=None, memory=None, answer_cache=None, versions=None,
+                     usage=None, streams=None, planner=None):
+    """
+    Обрабатывает один вопрос: сначала кэш ответов, затем типовые - локально через QueryEngine,
+    остальные - через tool_runner. versions - (версия промпта, версия данных) для ключа кэша,
+    usage (CacheUsage) собирает токены, записанные и прочитанные из кэша промпта,
+    streams (StreamStats) - TTFT, скорость генерации и длительность ходов tool loop,
+    planner (QueryPlanner) заранее кладёт в запрос встречи, подходящие под фильтры вопроса.
+    """
+    start_time = time.time()
+    analysis_file = f"demo2pilots_analysis_Q{i + 1}.txt"
     
+    print(f"\n{'='*60}\n")
+    print(f"Started Thread {i+1}\n---\nProcessing query: {query}\n")
+    print(f"\n{'='*60}\n")
+
+    try:
+        cached = answer_cache.get(query, *versions) if answer_cache is not None else None
+        if cached is not None:
+            # Файл анализа восстанавливается под номером вопроса в текущем запуске
+            if "analysis" in cached["files"] and memory is not None:
+                write_memory_file(memory, analysis_file, cached["files"]["analysis"])
+            time_elapsed = time.time() - start_time
+            write_response(i, query, time_elapsed, cached["answer"], f"answer cache, originally {cached['elapsed']:.2f} seconds")
+            print(f"[Thread {i+1}] 💾 Cached answer in {time_elapsed:.2f}s (saved {cached['elapsed']:.2f}s)")
+            return i, time_elapsed, "cached"
+
+        local = engine.answer(query) if engine is not None else None
+        if local is not None:
+            print(f"[Thread {i+1}] ⚡ Answered locally ({local['intent']}, {local['elapsed_ms']:.1f} ms)")
+            all_text = answer_locally(query, local, client, usage)
+            print("\n".join(all_text))
+            time_elapsed = time.time() - start_time
+            answer = "\n".join(all_text) + "\n\n" + local["text"]
+            write_response(i, query, time_elapsed, answer, f"local query engine: {local['intent']}")
+            if answer_cache is not None:
+                answer_cache.put(query, *versions, answer=answer, files={}, elapsed=time_elapsed)
+            print(f"[Thread {i+1}] ✅ Completed in {time_elapsed:.2f}s")
+            return i, time_elapsed, "success"
+
+        plan = planner.plan(query) if planner is not None else None
+        if plan is not None:
+            print(f"[Thread {i+1}] 🧭 Preloaded {len(plan['meetings'])} meetings (~{plan['tokens']} tokens, {plan['elapsed_ms']:.1f} ms)")
+
+        # Номер вопроса - только в сообщении пользователя: system и tools одинаковы во всех потоках и кэшируются
+        runner = client.client.beta.messages.tool_runner(
+            betas=BETAS,
+            model=MODEL,
+            max_tokens=7500,
+            system=cached_system(new_sys_prompt),
+            tools=tools,
+            messages=[
+                {
+                    "role": "user",
+                    "content": question_message(i, query, plan),
+                }
+            ],
+            stream=True,
+        )
+
+        # Текст дописывается в файл по мере генерации: при сбое в конце цикла ответ не теряется
+        all_text = []
+        timer = TurnTimer()
+        with open(response_path(i), "w", encoding="utf-8") as out:
+            out.write(f"Question {i+1}: {query}\n\n")
+            for stream in runner:
+                message = timer.consume(stream, out)
+                if usage is not None:
+                    usage.record(message.usage)
+                texts = [block.text for block in message.content if block.type == "text"]
+                if texts:
+                    out.write("\n")
+                    print("\n".join(texts))
+                all_text.extend(texts)
+        
+            end_time = time.time()
+            time_elapsed = end_time - start_time
+            metrics = timer.summary()
+            out.write(f"\nTime took for question {i+1}: {time_elapsed:.2f} seconds "
+                      f"(TTFT {metrics['ttft']}s, {metrics['turns']} turns, {metrics['tokens_per_s']} tokens/s)\n")
+        if streams is not None:
+            streams.record(i, query, metrics)
+        if answer_cache is not None:
+            analysis = read_memory_file(memory, analysis_file) if memory is not None else None
+            answer_cache.put(
+                query, *versions, answer="\n".join(all_text),
+                files={"analysis": analysis} if analysis is not None else {}, elapsed=time_elapsed,
+            )
+        
+        print(f"[Thread {i+1}] ✅ Completed in {time_elapsed:.2f}s")
+        return i, time_elapsed, "success"
+        
+    except Exception as e:
+        print(f"[Thread {i+1}] ❌ Error: {e}")
+        return i, 0, f"error: {e}"
+
+
+def prepare_session(memory, prompt=ANALYST_PROMPT):
+    """
+    Синхронизация хранилищ и общее для всех вопросов: инструменты, QueryEngine, кэш ответов
+    с версиями промпта и данных, счётчик токенов кэша промпта
+    """
+    meeting_store = MeetingStore()
+    sync_stats = meeting_store.sync()
+    print(f"🗄️ Meeting store: {sync_stats['total']} meetings (added {sync_stats['added']}, updated {sync_stats['updated']}, removed {sync_stats['removed']})")
+    transcript_index = TranscriptSearch(memory)
+    index_stats = transcript_index.sync()
+    print(f"🔎 Transcript index: {index_stats['files']} files (reindexed {index_stats['indexed']}, removed {index_stats['removed']})")
+    _, analytics_changes = update_analytics_db()
+    cube = ConversionCube.load("./memory/conversion_cube.json")
+    print(f"🧊 Conversion cube: {analytics_changes['total']} meetings, {len(cube.cuboids)} cuboids")
+    engine = QueryEngine.from_state()
+    return {
+        "meeting_store": meeting_store,
+        "transcript_index": transcript_index,
+        "cube": cube,
+        "tools": [memory, *memory.function_tools(), meeting_store.sql_tool(), transcript_index.search_tool(), cube.cube_tool()],
+        # Типовые вопросы (конверсия по измерениям, средние критериев, корреляции) считаются без LLM
+        "engine": engine,
+        # Остальные вопросы получают встречи, подходящие под их фильтры, прямо в первом запросе
+        "planner": QueryPlanner(engine, memory, transcript_index),
+        # Ответы переиспользуются, пока не изменились промпт, модель, analytics_db.json и транскрипты
+        "answer_cache": AnswerCache(),
+        "versions": (prompt_version(prompt, MODEL, PHRASE_PROMPT, PRELOAD_INSTRUCTIONS), data_version()),
+        "usage": CacheUsage(),
+        "streams": StreamStats(),
+    }
+
+
+def print_summary(session, memory, results, total_time, questions_count):
+    print(f"\n{'='*60}")
+    print(f"📊 SUMMARY")
+    print(f"{'='*60}")
+    print(f"Total time: {total_time:.2f} seconds")
+    print(f"Questions processed: {questions_count}")
+    print(f"Average time per question: {total_time/questions_count:.2f}s")
     
+    results.sort(key=lambda x: x[0])
+    print(f"\n📋 Per-question breakdown:")
+    for i, elapsed, status in results:
+        if status == "success":
+            print(f"  Q{i+1}: {elapsed:.2f}s ✅")
+        elif status == "cached":
+            print(f"  Q{i+1}: {elapsed:.2f}s 💾")
+        else:
+            print(f"  Q{i+1}: {status} ❌")
+
+    cache_stats = memory.cache_stats()
+    print(f"\n💾 MemoryTool cache:")
+    print(f"  Hits: {cache_stats['hits']} / Misses: {cache_stats['misses']} (hit rate {cache_stats['hit_rate']:.1%})")
+    print(f"  Rendered views reused: {cache_stats['render_hits']}")
+    print(f"  Disk read: {cache_stats['bytes_read'] / 1024:.1f} KB, saved: {cache_stats['bytes_saved'] / 1024:.1f} KB")
+    print(f"  Entries: {cache_stats['entries']} ({cache_stats['cached_bytes'] / 1024:.1f} KB), evictions: {cache_stats['evictions']}")
+    if "hot_documents" in cache_stats:
+        hot = cache_stats["hot_documents"]
+        print(f"  Hot documents: {hot['promotions']}, in-memory edits: {hot['edits_in_memory']}, flushes: {hot['flushes']}")
+    print(f"\n🧮 Tool results (estimated tokens, log: reports/memory_tool_tokens.jsonl):")
+    for tool_name, entry in memory.call_stats.summary().items():
+        print(f"  {tool_name}: {entry['calls']} calls, ~{entry['est_tokens']} tokens, {entry['total_ms']:.0f} ms")
+
+    usage_stats = session["usage"].summary()
+    print(f"\n🧾 Prompt cache: {usage_stats['calls']} responses, {usage_stats['prompt_tokens']} prompt tokens")
+    print(f"  Read from cache: {usage_stats['cache_read_input_tokens']} ({usage_stats['cache_hit_rate']:.1%}), "
+          f"written: {usage_stats['cache_creation_input_tokens']}, uncached: {usage_stats['input_tokens']}, "
+          f"output: {usage_stats['output_tokens']}")
+
+    stream_stats = session["streams"].summary()
+    print(f"\n⏱️ Streaming (log: reports/stream_metrics.jsonl): {stream_stats['questions']} questions, "
+          f"TTFT median {stream_stats['ttft_median']}s / max {stream_stats['ttft_max']}s")
+    print(f"  Turns: {stream_stats['turns']}, mean {stream_stats['turn_seconds_mean']}s per turn, "
+          f"{stream_stats['tokens_per_s_mean']} tokens/s")
+
+    answer_stats = session["answer_cache"].stats()
+    print(f"\n💾 Answer cache: {answer_stats['hits']} hits / {answer_stats['misses']} misses "
+          f"(hit rate {answer_stats['hit_rate']:.1%}), saved ~{answer_stats['saved_seconds']:.0f}s")
+    print(f"  Entries: {answer_stats['entries']} ({answer_stats['cached_bytes'] / 1024:.1f} KB), "
+          f"expired: {answer_stats['expired']}, evictions: {answer_stats['evictions']}")
+    print(f"\n⚡ Answered locally: {session['engine'].answered} / {questions_count}")
+    print(f"🧭 Planned with preloaded meetings: {session['planner'].planned} / {questions_count}")
+    print(f"\n🗄️ Meeting store:")
+    print(f"  SQL queries: {session['meeting_store'].queries} (errors: {session['meeting_store'].query_errors})")
+    print(f"  Full-text searches: {session['transcript_index'].searches}")
+    print(f"  Cube lookups: {session['cube'].lookups}")
+
+    limiter_stats = LIMITER.stats()
+    print(f"\n🚦 Rate limiter: {limiter_stats['requests']} requests, {limiter_stats['throttled']} throttled (429/529), "
+          f"{limiter_stats['retries']} retries, concurrency {limiter_stats['concurrency']}, waited {limiter_stats['waited_seconds']}s")
+    if CASSETTE is not None:
+        cassette_stats = CASSETTE.stats()
+        print(f"📼 Cassette {CASSETTE.path} ({cassette_stats['mode']}): {cassette_stats['recorded']} recorded, "
+              f"{cassette_stats['replayed']} replayed ({cassette_stats['loose_hits']} by tool-result-insensitive key), "
+              f"{cassette_stats['misses']} misses")
+
+
+if __name__ == "__main__":
+    client = Client()
+    # Оценки токенов по каждому вызову - для подбора page_tokens под 1M-контекст
+    memory = MemoryTool(token_log_path="reports/memory_tool_tokens.jsonl")
+    session = prepare_session(memory)
+
     # === Многопоточная обработка ===
     max_workers = 10  # 5 threads
     total_start = time.time()
@@ -267,12 +479,19 @@ if __name__ == "__main__":
             executor.submit(
                 process_question, 
                 i, 
-                questions_list[i], 
-                new_sys_prompt, 
+                QUESTIONS[i], 
+                ANALYST_PROMPT, 
                 client, 
-                memory
+                session["tools"],
+                session["engine"],
+                memory,
+                session["answer_cache"],
+                session["versions"],
+                session["usage"],
+                session["streams"],
+                session["planner"]
             ): i 
-            for i in range(len(questions_list))
+            for i in range(len(QUESTIONS))
         }
         
         results = []
@@ -281,18 +500,6 @@ if __name__ == "__main__":
             results.append(result)
     
     total_time = time.time() - total_start
-    
-    print(f"\n{'='*60}")
-    print(f"📊 SUMMARY")
-    print(f"{'='*60}")
-    print(f"Total time: {total_time:.2f} seconds")
-    print(f"Questions processed: {len(questions_list)}")
-    print(f"Average time per question: {total_time/len(questions_list):.2f}s")
-    
-    results.sort(key=lambda x: x[0])
-    print(f"\n📋 Per-question breakdown:")
-    for i, elapsed, status in results:
-        if status == "success":
-            print(f"  Q{i+1}: {elapsed:.2f}s ✅")
-        else:
-            print(f"  Q{i+1}: {status} ❌")
\ No newline at end of file
+    memory.close()
+    session["answer_cache"].save()
+    print_summary(session, memory, results, total_time, len(QUESTIONS))
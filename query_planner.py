@@ -0,0 +1,202 @@
+"""
+Планирование вопросов, которые уходят модели: выборка нужных встреч заранее.
+
+Фильтры вопроса (менеджер, период, канал, индустрия, статус, тип задачи, успешность) разбираются
+тем же QueryEngine и превращаются в список meeting_id по локальным индексам. В первый запрос
+попадают только эти встречи: компактная таблица метаданных и оценок, средние критериев выборки
+против всей базы, сводка по измерениям вопроса, итоги встреч (overall_summary) и фрагменты
+транскриптов по теме вопроса. Модель отвечает за один ход вместо обхода файлов по одному.
+"""
+from pathlib import Path
+import threading
+import time
+import re
+
+from meeting_records import SCORE_CRITERIA
+from query_engine import CRITERION_PATTERNS, QueryEngine, format_table, normalize, parse_period
+from token_budget import estimate_tokens
+from transcript_stream import extract_sections
+from TranscriptSearch import TranscriptSearch, terms
+
+# Больше встреч - выборка не сужает базу достаточно, вопрос идёт обычным tool loop
+MAX_MEETINGS = 40
+# Бюджет предзагруженного контекста (оценка токенов); сверх него сначала отбрасываются фрагменты, затем итоги встреч
+PRELOAD_TOKENS = 40_000
+# Итоги overall_summary добавляются только для небольших выборок
+SUMMARY_MEETINGS = 20
+EXCERPTS = 6
+# Фрагменты берутся только из реплик диалога: разделы metadata/criteria/overall_summary уже есть в таблицах
+DIALOGUE_MARKER = '"text":'
+
+# Слова формулировки аналитического вопроса - не тема для поиска по транскриптам
+QUESTION_WORDS = set(terms(
+    "встреча встречи клиент клиенты клиентов критерий критерии успешные неуспешные провальные конверсия менеджер "
+    "менеджеры канал каналы задача задачи без средний среднее выше ниже найди найти закономерность сравни сравнить "
+    "разница оценки оценка типы тип какие какой какая у них с по для vs и или в на за это что как"
+))
+
+# Инструкция к предзагруженным данным; входит в версию промпта кэша ответов
+PRELOAD_INSTRUCTIONS = (
+    "Данные выше уже выбраны по условиям вопроса из analytics_db и транскриптов - анализируй их сразу, "
+    "не открывая файлы для чтения. Инструменты чтения используй, только если для ответа не хватает конкретных "
+    "данных (например, цитаты из диалога вне приведённых фрагментов)."
+)
+
+COLUMNS = {
+    "by_sales_manager": "manager",
+    "by_acquisition_channel_type": "channel_type",
+    "by_acquisition_channel_name": "channel_name",
+    "by_client_status": "client_status",
+    "by_industry": "industry",
+}
+
+
+class QueryPlanner:
+    """Выборка встреч по фильтрам вопроса и компактный контекст для первого запроса"""
+
+    def __init__(self, engine: QueryEngine, memory, index: TranscriptSearch | None = None,
+                 max_meetings: int = MAX_MEETINGS, max_tokens: int = PRELOAD_TOKENS):
+        self.engine = engine
+        self.index = index
+        self.transcripts_dir = Path(memory.transcripts_dir)
+        self.max_meetings = max_meetings
+        self.max_tokens = max_tokens
+        self._summaries: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.planned = 0
+
+    def plan(self, question: str) -> dict | None:
+        """
+        {"meetings": [meeting_id], "filters", "periods", "context", "tokens", "elapsed_ms"} или None,
+        если фильтры не сужают базу, выборка пуста, слишком велика или не помещается в бюджет
+        """
+        start = time.perf_counter()
+        text = normalize(question)
+        periods = parse_period(text, self.engine.years)
+        filters = self.engine.filters(text)
+        if not filters and not periods:
+            return None
+        rows = self.engine.select(filters, periods)
+        if not rows or len(rows) > self.max_meetings or len(rows) >= len(self.engine.rows):
+            return None
+
+        header = self._header(text, periods, filters, rows)
+        summaries = self._summary_section(rows) if len(rows) <= SUMMARY_MEETINGS else ""
+        excerpts = self._excerpt_section(question, rows)
+        # Сначала отбрасывается наименее нужное: фрагменты, затем итоги встреч
+        for parts in ((header, summaries, excerpts), (header, summaries), (header,)):
+            context = "\n\n".join(part for part in parts if part)
+            tokens = estimate_tokens(context)
+            if tokens <= self.max_tokens:
+                break
+        else:
+            return None
+
+        with self._lock:
+            self.planned += 1
+        return {
+            "meetings": [row["meeting_id"] for row in rows],
+            "filters": filters,
+            "periods": periods,
+            "context": context,
+            "tokens": tokens,
+            "elapsed_ms": (time.perf_counter() - start) * 1000,
+        }
+
+    def _header(self, text: str, periods, filters: dict, rows: list[dict]) -> str:
+        engine = self.engine
+        lines = ["## Предзагруженные данные: встречи, подходящие под условия вопроса"]
+        if periods:
+            lines.append("Период: " + ", ".join(f"{start} — {end}" for start, end in periods) + " (границы включительно)")
+        if filters:
+            lines.append("Фильтры: " + "; ".join(f"{dim} ∈ {{{', '.join(sorted(map(str, v)))}}}" for dim, v in filters.items()))
+        lines.append(f"Встреч в выборке: {len(rows)} из {len(engine.rows)}")
+
+        lines.append("\n### Встречи (оценки критериев 0-10)")
+        lines.append(format_table([
+            {
+                "meeting_id": row["meeting_id"],
+                "file": row["file"],
+                "date": row["meeting_date"],
+                "success": row["meeting_success"],
+                "client": row["client_name"],
+                **{column: row["index"][index] for index, column in COLUMNS.items()},
+                "task": engine.value(row, "client_task_classification"),
+                "avg_score": row["average_score"],
+                **{name: row["scores"].get(name) for name in SCORE_CRITERIA},
+            }
+            for row in rows
+        ]))
+
+        # Средние критериев выборки и всей базы - для вопросов "выше/ниже среднего"
+        selected = engine.group(rows, [], SCORE_CRITERIA)[0]
+        overall = engine.group(engine.rows, [], SCORE_CRITERIA)[0]
+        lines.append(f"\n### Средние критериев: выборка (конверсия {selected['conversion']}%) и все встречи "
+                     f"(конверсия {overall['conversion']}%)")
+        table = []
+        for name in SCORE_CRITERIA:
+            mean, base = selected[f"avg_{name}"], overall[f"avg_{name}"]
+            table.append({"criterion": name, "selection": mean, "all": base,
+                          "difference": round(mean - base, 2) if None not in (mean, base) else None})
+        table.sort(key=lambda entry: -(entry["difference"] or 0))
+        lines.append(format_table(table))
+
+        dims = engine.dimensions(text, filters)
+        if dims:
+            criteria = [name for name, pattern in CRITERION_PATTERNS.items() if re.search(pattern, text)]
+            if re.search(r"критери|оценк", text):
+                criteria = SCORE_CRITERIA
+            lines.append(f"\n### Конверсия{' и средние критериев' if criteria else ''} по {', '.join(dims[:3])}")
+            lines.append(format_table(engine.group(rows, dims[:3], criteria)))
+        return "\n".join(lines)
+
+    def _summary(self, file: str) -> dict:
+        with self._lock:
+            summary = self._summaries.get(file)
+        if summary is None:
+            try:
+                sections, _ = extract_sections(self.transcripts_dir / file, keys=("overall_summary",))
+            except (OSError, ValueError):
+                sections = {}
+            summary = sections.get("overall_summary") or {}
+            with self._lock:
+                self._summaries[file] = summary
+        return summary
+
+    def _summary_section(self, rows: list[dict]) -> str:
+        lines = ["### Итоги встреч (overall_summary): + сильные стороны, - критические пробелы"]
+        for row in rows:
+            summary = self._summary(row["file"])
+            strengths, gaps = summary.get("key_strengths") or [], summary.get("critical_gaps") or []
+            if not strengths and not gaps:
+                continue
+            lines.append(f"{row['meeting_id']} ({row['meeting_success']}, {summary.get('conversion_probability') or '-'}): "
+                         f"+ {'; '.join(map(str, strengths)) or '-'} | - {'; '.join(map(str, gaps)) or '-'}")
+        return "\n".join(lines) if len(lines) > 1 else ""
+
+    def _excerpt_section(self, question: str, rows: list[dict]) -> str:
+        """Фрагменты транскриптов выборки по словам вопроса, не относящимся к его формулировке"""
+        if self.index is None:
+            return ""
+        topic = [term for term in terms(question) if term not in QUESTION_WORDS and not term.isdigit()]
+        fragments = self.index.excerpts(topic, {row["file"] for row in rows}, EXCERPTS, DIALOGUE_MARKER)
+        if not fragments:
+            return ""
+        return "### Фрагменты транскриптов по теме вопроса" + "".join(fragments)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from MemoryTool import MemoryTool
+
+    memory = MemoryTool()
+    index = TranscriptSearch(memory)
+    index.sync()
+    planner = QueryPlanner(QueryEngine.from_state(), memory, index)
+    for question in sys.argv[1:]:
+        plan = planner.plan(question)
+        print(f"\n❓ {question}")
+        print("→ tool loop" if plan is None else
+              f"{plan['context']}\n({len(plan['meetings'])} meetings, ~{plan['tokens']} tokens, {plan['elapsed_ms']:.1f} ms)")
+    memory.close()
@@ -0,0 +1,101 @@
+"""
+Потоковый вывод tool loop с метриками задержки.
+
+TurnTimer читает события одного хода (BetaMessageStream из tool_runner(stream=True)), сразу
+дописывает текст в файл и замеряет время до первого токена (TTFT), длительность хода и
+скорость генерации. StreamStats собирает метрики вопросов со всех потоков и пишет их в JSONL.
+"""
+import threading
+import time
+
+from token_budget import TokenLog
+
+
+class TurnTimer:
+    """Метрики одного вопроса: started - момент отправки первого запроса"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token: float | None = None
+        self.turns: list[dict] = []
+
+    def _event(self, event, out, turn: dict):
+        now = time.perf_counter()
+        # Первый токен хода - первая дельта любого блока (текст, аргументы инструмента)
+        if turn["first_event"] is None and event.type == "content_block_delta":
+            turn["first_event"] = now
+        if event.type == "text":
+            if self.first_token is None:
+                self.first_token = now
+            out.write(event.text)
+            out.flush()
+
+    def _finish(self, turn: dict, message):
+        end = time.perf_counter()
+        output_tokens = message.usage.output_tokens if message.usage else 0
+        generating = end - (turn["first_event"] or end)
+        self.turns.append({
+            "seconds": round(end - turn["start"], 3),
+            "ttft": round((turn["first_event"] or end) - turn["start"], 3),
+            "output_tokens": output_tokens,
+            "tokens_per_s": round(output_tokens / generating, 1) if generating > 0 else None,
+        })
+
+    def consume(self, stream, out):
+        """Читает ход до конца, текст - в out по мере поступления; возвращает итоговое сообщение хода"""
+        turn = {"start": time.perf_counter(), "first_event": None}
+        for event in stream:
+            self._event(event, out, turn)
+        message = stream.get_final_message()
+        self._finish(turn, message)
+        return message
+
+    async def consume_async(self, stream, out):
+        turn = {"start": time.perf_counter(), "first_event": None}
+        async for event in stream:
+            self._event(event, out, turn)
+        message = await stream.get_final_message()
+        self._finish(turn, message)
+        return message
+
+    def summary(self) -> dict:
+        output_tokens = sum(turn["output_tokens"] for turn in self.turns)
+        generating = sum(turn["seconds"] - turn["ttft"] for turn in self.turns)
+        return {
+            "ttft": round(self.first_token - self.started, 3) if self.first_token is not None else None,
+            "total_seconds": round(time.perf_counter() - self.started, 3),
+            "turns": len(self.turns),
+            "output_tokens": output_tokens,
+            "tokens_per_s": round(output_tokens / generating, 1) if generating > 0 else None,
+            "turn_seconds": [turn["seconds"] for turn in self.turns],
+        }
+
+
+class StreamStats:
+    """Метрики вопросов со всех потоков; каждая запись сразу уходит в JSONL-лог"""
+
+    def __init__(self, log_path: str | None = "reports/stream_metrics.jsonl"):
+        self.log = TokenLog(log_path) if log_path else None
+        self._lock = threading.Lock()
+        self.questions: dict[int, dict] = {}
+
+    def record(self, i: int, query: str, summary: dict):
+        with self._lock:
+            self.questions[i] = summary
+        if self.log is not None:
+            self.log.write(question=i + 1, query=query, **summary)
+
+    def summary(self) -> dict:
+        with self._lock:
+            entries = list(self.questions.values())
+        ttfts = sorted(e["ttft"] for e in entries if e["ttft"] is not None)
+        turns = [seconds for e in entries for seconds in e["turn_seconds"]]
+        rates = [e["tokens_per_s"] for e in entries if e["tokens_per_s"]]
+        return {
+            "questions": len(entries),
+            "ttft_median": ttfts[len(ttfts) // 2] if ttfts else None,
+            "ttft_max": ttfts[-1] if ttfts else None,
+            "turns": len(turns),
+            "turn_seconds_mean": round(sum(turns) / len(turns), 2) if turns else None,
+            "tokens_per_s_mean": round(sum(rates) / len(rates), 1) if rates else None,
+        }
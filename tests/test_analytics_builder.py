@@ -0,0 +1,141 @@
+from pathlib import Path
+import json
+
+import pytest
+
+import analytics_builder
+from ConversionCube import ConversionCube
+from analytics_builder import build_analytics_db, update_analytics_db
+from meeting_records import SCORE_CRITERIA
+
+
+def _transcript(meeting_id: int, success: bool, score: int = 5) -> dict:
+    return {
+        "metadata": {
+            "meeting_id": meeting_id,
+            "meeting_success": "да" if success else "нет",
+            "meeting_date": f"2025-{4 + meeting_id % 3:02d}-{10 + meeting_id % 15:02d}",
+            "client_name": f"Клиент {meeting_id}",
+            "client_industry": "Ритейл" if meeting_id % 2 else "Консалтинг",
+            "sales_managers": [{"name": "Алексей Воронин" if meeting_id % 2 else "Мария Ким", "activity_percentage": 60}],
+            "total_sales_managers_activity": 60,
+            "acquisition_channel_type": "партнер" if meeting_id % 3 else "конференция",
+            "acquisition_channel_name": "",
+            "client_status": "покупка" if success else "отказ после первой демо-встречи",
+            "purchase_amount": "",
+            "pilot_probability_assessment": "50%",
+            "manager_comments": "",
+        },
+        "criteria": {**{name: (score + meeting_id) % 11 for name in SCORE_CRITERIA}, "client_task_classification": 1 + meeting_id % 2},
+        "overall_summary": {"total_score": 60, "average_score": 5.0, "conversion_probability": "medium"},
+        "transcript": [{"speaker": "Менеджер", "text": "Добрый день"}],
+    }
+
+
+def _write(directory, meeting_id: int, success: bool, score: int = 5):
+    path = directory / f"meeting_{meeting_id}_Клиент.json"
+    path.write_text(json.dumps(_transcript(meeting_id, success, score), ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def _comparable(db: dict) -> dict:
+    db = json.loads(json.dumps(db))
+    db["database_info"].pop("last_updated")
+    return db
+
+
+@pytest.fixture
+def paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics_builder, "SIGNIFICANCE_RESAMPLES", 50)
+    transcripts = tmp_path / "transcripts"
+    transcripts.mkdir()
+    for meeting_id in range(1, 9):
+        _write(transcripts, meeting_id, meeting_id % 3 == 0)
+    return {
+        "transcripts_dir": str(transcripts),
+        "state_path": tmp_path / "state.json",
+        "store_dir": tmp_path / "store",
+        "cube_path": tmp_path / "cube.json",
+    }
+
+
+def test_incremental_update_matches_full_rebuild(paths):
+    transcripts = paths["transcripts_dir"]
+    db, stats = update_analytics_db(**paths)
+    assert (stats["added"], stats["total"]) == (8, 8)
+
+    directory = Path(transcripts)
+    _write(directory, 9, True)
+    _write(directory, 2, True, score=9)
+    (directory / "meeting_5_Клиент.json").unlink()
+    db, stats = update_analytics_db(**paths)
+    assert {key: stats[key] for key in ("added", "updated", "removed", "unchanged")} == \
+        {"added": 1, "updated": 1, "removed": 1, "unchanged": 6}
+    assert _comparable(db) == _comparable(build_analytics_db(transcripts))
+
+
+def test_broken_transcript_drops_its_old_row(paths):
+    path = Path(paths["transcripts_dir"]) / "meeting_3_Клиент.json"
+    update_analytics_db(**paths)
+    text = path.read_text(encoding="utf-8")
+
+    path.write_text(text[:len(text) // 2], encoding="utf-8")
+    db, stats = update_analytics_db(**paths)
+    assert (stats["failed"], stats["removed"], stats["total"]) == (1, 1, 7)
+    assert 3 not in db["database_info"]["successful_meetings"]["meeting_ids"]
+
+    path.write_text(text, encoding="utf-8")
+    db, stats = update_analytics_db(**paths)
+    assert (stats["added"], stats["total"]) == (1, 8)
+    assert 3 in db["database_info"]["successful_meetings"]["meeting_ids"]
+
+
+def test_removed_duplicate_is_replaced_by_the_other_file(paths):
+    directory = Path(paths["transcripts_dir"])
+    duplicate = directory / "meeting_2_copy.json"
+    duplicate.write_text(json.dumps(_transcript(2, True, score=9), ensure_ascii=False), encoding="utf-8")
+    db, _ = update_analytics_db(**paths)
+    assert _comparable(db) == _comparable(build_analytics_db(paths["transcripts_dir"]))
+
+    # Строка встречи 2 взята из последнего по имени файла; после его удаления читается оставшийся
+    last = max(duplicate, directory / "meeting_2_Клиент.json")
+    last.unlink()
+    db, stats = update_analytics_db(**paths)
+    assert (stats["removed"], stats["total"]) == (1, 8)
+    assert _comparable(db) == _comparable(build_analytics_db(paths["transcripts_dir"]))
+
+
+def test_cube_keys_survive_separators(paths):
+    transcript = _transcript(9, True)
+    transcript["metadata"]["acquisition_channel_name"] = "Вебинар | RConf"
+    (Path(paths["transcripts_dir"]) / "meeting_9_Клиент.json").write_text(json.dumps(transcript, ensure_ascii=False), encoding="utf-8")
+    update_analytics_db(**paths)
+
+    cells = ConversionCube.load(paths["cube_path"]).cells(["acquisition_channel_name"])
+    assert cells[("Вебинар | RConf",)][:2].tolist() == [1, 1]
+
+    # Куб старого формата пересобирается, даже если транскрипты не менялись
+    paths["cube_path"].write_text(json.dumps({"version": 1}), encoding="utf-8")
+    update_analytics_db(**paths)
+    assert ("Вебинар | RConf",) in ConversionCube.load(paths["cube_path"]).cells(["acquisition_channel_name"])
+
+
+def test_significance_is_cached_until_scores_change(paths, monkeypatch):
+    calls = []
+    significance = analytics_builder.criteria_significance
+    monkeypatch.setattr(analytics_builder, "criteria_significance", lambda *args, **kwargs: calls.append(1) or significance(*args, **kwargs))
+
+    first, _ = update_analytics_db(**paths)
+    second, _ = update_analytics_db(**paths)
+    assert len(calls) == 1
+    assert second["criteria_correlations"] == first["criteria_correlations"]
+
+    _write(Path(paths["transcripts_dir"]), 4, False, score=1)
+    update_analytics_db(**paths)
+    assert len(calls) == 2
+
+
+def test_criteria_averages_use_status_group_names(paths):
+    db, _ = update_analytics_db(**paths)
+    groups = {"successful_meetings", "unsuccessful_meetings", "neutral_meetings"}
+    assert groups <= set(db["database_info"]) and set(db["criteria_averages"]) == groups
@@ -0,0 +1,48 @@
+import json
+
+from AnswerCache import AnswerCache
+
+
+def _entries(path) -> dict:
+    return json.loads(path.read_text(encoding="utf-8"))["entries"]
+
+
+def test_get_does_not_rewrite_file(tmp_path, monkeypatch):
+    path = tmp_path / "answer_cache.json"
+    cache = AnswerCache(path)
+    cache.put("Какая конверсия?", "p", "d", answer="42%", files={}, elapsed=3.0)
+
+    writes = []
+    monkeypatch.setattr(cache, "_save", lambda: writes.append(1))
+    for _ in range(5):
+        assert cache.get("какая конверсия", "p", "d")["answer"] == "42%"
+    assert cache.get("Другой вопрос", "p", "d") is None
+    assert writes == []
+    assert cache.stats()["hits"] == 5
+
+
+def test_save_persists_access_stats(tmp_path):
+    path = tmp_path / "answer_cache.json"
+    cache = AnswerCache(path)
+    cache.put("Какая конверсия?", "p", "d", answer="42%", files={}, elapsed=3.0)
+    before = path.read_text(encoding="utf-8")
+    cache.save()
+    assert path.read_text(encoding="utf-8") == before
+
+    cache.get("Какая конверсия?", "p", "d")
+    cache.get("Какая конверсия?", "p", "d")
+    assert path.read_text(encoding="utf-8") == before
+    cache.save()
+    [entry] = _entries(path).values()
+    assert entry["hits"] == 2 and entry["last_used"] > entry["created"]
+    assert AnswerCache(path).get("Какая конверсия?", "p", "d")["hits"] == 3
+
+
+def test_put_persists_pending_access_stats(tmp_path):
+    path = tmp_path / "answer_cache.json"
+    cache = AnswerCache(path)
+    cache.put("Первый", "p", "d", answer="1", files={}, elapsed=1.0)
+    cache.get("Первый", "p", "d")
+    cache.put("Второй", "p", "d", answer="2", files={}, elapsed=1.0)
+    hits = {entry["question"]: entry["hits"] for entry in _entries(path).values()}
+    assert hits == {"Первый": 1, "Второй": 0}
@@ -0,0 +1,78 @@
+import pytest
+
+from ClaudeClient import Client
+from MemoryTool import MemoryTool, MODEL
+from RateLimiter import RateLimiter
+from batch_runner import run_batches
+from fake_batch_server import FakeBatchServer
+
+NOTES = "/memories/notes.txt"
+
+
+def _tool_results(params: dict) -> int:
+    return sum(1 for message in params["messages"] if message["role"] == "user" and isinstance(message["content"], list))
+
+
+def memory_responder(params: dict):
+    """Три раунда: создать файл, дописать строку, ответить по результату просмотра"""
+    if "tools" not in params:
+        return [{"type": "text", "text": "no tools"}], "end_turn"
+    step = _tool_results(params)
+    if step == 0:
+        command = {"command": "create", "path": NOTES, "file_text": "first\n"}
+    elif step == 1:
+        command = {"command": "str_replace", "path": NOTES, "old_str": "first", "new_str": "first\nsecond"}
+    else:
+        last = params["messages"][-1]["content"][0]
+        return [{"type": "text", "text": f"done: {last['content']!s}"}], "end_turn"
+    return [{"type": "text", "text": f"step {step}"},
+            {"type": "tool_use", "id": f"toolu_{step}", "name": "memory", "input": command}], "tool_use"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    server = FakeBatchServer(memory_responder, polls=2).start()
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", server.base_url)
+    monkeypatch.setenv("CLAUDE_API", "fake")
+    client = Client(limiter=RateLimiter(requests_per_minute=6000, input_tokens_per_minute=10**7), cassette=None)
+    client.server = server
+    yield client
+    server.close()
+
+
+def test_multi_round_tool_loop_completes(client, tmp_path):
+    memory = MemoryTool(base_path=str(tmp_path))
+    conversations = {
+        "Q1": {"model": MODEL, "max_tokens": 100, "messages": [{"role": "user", "content": "заметки"}], "tools": True},
+        "Q2": {"model": MODEL, "max_tokens": 100, "messages": [{"role": "user", "content": "без инструментов"}]},
+    }
+    done = []
+    try:
+        results = run_batches(client, conversations, [memory], poll_interval=0,
+                              on_done=lambda custom_id, result: done.append(custom_id))
+        assert memory.memories_storage.read_text("notes.txt") == "first\nsecond\n"
+    finally:
+        memory.close()
+
+    assert results["Q1"]["status"] == "success" and results["Q1"]["rounds"] == 3
+    assert results["Q1"]["text"][:2] == ["step 0", "step 1"]
+    assert results["Q1"]["text"][2].startswith("done:")
+    assert (results["Q2"]["status"], results["Q2"]["rounds"], results["Q2"]["text"]) == ("success", 1, ["no tools"])
+    assert done == ["Q2", "Q1"]
+    # Раунды: оба диалога, затем только Q1 с результатами инструментов
+    batches = client.server.batches
+    assert [len(batch["requests"]) for batch in batches.values()] == [2, 1, 1]
+    # Батч закончен только со второго опроса: runner ждёт, а не читает результаты in_progress
+    assert all(batch["polls"] >= 2 for batch in batches.values())
+    assert [m["role"] for m in client.server.requests[-1]["params"]["messages"]] == ["user", "assistant", "user", "assistant", "user"]
+
+
+def test_max_rounds_stops_the_conversation(client, tmp_path):
+    memory = MemoryTool(base_path=str(tmp_path))
+    conversations = {"Q1": {"model": MODEL, "max_tokens": 100, "messages": [{"role": "user", "content": "заметки"}], "tools": True}}
+    try:
+        results = run_batches(client, conversations, [memory], poll_interval=0, max_rounds=2)
+    finally:
+        memory.close()
+    assert results["Q1"]["status"] == "error: stopped after 2 rounds"
+    assert len(client.server.batches) == 2
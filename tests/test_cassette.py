@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+import anthropic
+import httpx
+import pytest
+from anthropic import Anthropic
+
+from Cassette import AsyncCassetteTransport, Cassette, CassetteTransport
+from MemoryTool import BETAS, MODEL, MemoryTool
+
+
+class _Chunks(httpx.SyncByteStream, httpx.AsyncByteStream):
+    def __init__(self, chunks: list[bytes]):
+        self.chunks = chunks
+
+    def __iter__(self):
+        yield from self.chunks
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def _message(content: list[dict], stop_reason: str) -> dict:
+    return {"id": "msg_stub", "type": "message", "role": "assistant", "model": MODEL, "content": content,
+            "stop_reason": stop_reason, "stop_sequence": None, "usage": {"input_tokens": 10, "output_tokens": 5}}
+
+
+def _tool_loop(request: httpx.Request) -> httpx.Response:
+    """Первый ход создаёт файл через memory tool, второй - финальный текст"""
+    body = json.loads(request.content)
+    if len(body["messages"]) == 1:
+        return httpx.Response(200, json=_message([{"type": "tool_use", "id": "toolu_1", "name": "memory", "input": {
+            "command": "create", "path": "/memories/check.txt", "file_text": "записано моделью"}}], "tool_use"))
+    return httpx.Response(200, json=_message([{"type": "text", "text": "готово"}], "end_turn"))
+
+
+def _run_tool_loop(cassette: Cassette, memory: MemoryTool, inner=None) -> list[str]:
+    client = Anthropic(api_key="stub", max_retries=0,
+                       http_client=httpx.Client(transport=CassetteTransport(cassette, inner)))
+    runner = client.beta.messages.tool_runner(
+        betas=BETAS, model=MODEL, max_tokens=100, tools=[memory],
+        messages=[{"role": "user", "content": "Создай файл check.txt"}],
+    )
+    return [block.text for message in runner for block in message.content if block.type == "text"]
+
+
+def test_tool_loop_replays_offline_and_runs_tools(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    memory = MemoryTool(base_path=str(tmp_path / "memory"))
+    try:
+        recording = Cassette(path, "record")
+        assert _run_tool_loop(recording, memory, httpx.MockTransport(_tool_loop)) == ["готово"]
+        assert recording.stats()["recorded"] == 2
+
+        (memory.memories_dir / "check.txt").unlink()
+        replay = Cassette(path, "replay", latency_scale=0)
+        assert _run_tool_loop(replay, memory) == ["готово"]
+        # Инструменты выполняются и при воспроизведении
+        assert (memory.memories_dir / "check.txt").read_text(encoding="utf-8") == "записано моделью"
+        assert replay.stats() == {"mode": "replay", "recorded": 0, "replayed": 2, "loose_hits": 0, "misses": 0}
+    finally:
+        memory.close()
+
+
+def test_changed_tool_result_uses_loose_key(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    memory = MemoryTool(base_path=str(tmp_path / "memory"))
+    try:
+        _run_tool_loop(Cassette(path, "record"), memory, httpx.MockTransport(_tool_loop))
+        # Файл уже есть - create вернёт другой tool_result, чем при записи
+        replay = Cassette(path, "replay", latency_scale=0)
+        assert _run_tool_loop(replay, memory) == ["готово"]
+        assert replay.stats()["loose_hits"] == 1 and replay.stats()["misses"] == 0
+    finally:
+        memory.close()
+
+
+def test_miss_raises_not_found(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    path.write_text("", encoding="utf-8")
+    client = Anthropic(api_key="stub", max_retries=0,
+                       http_client=httpx.Client(transport=CassetteTransport(Cassette(path, "replay"))))
+    with pytest.raises(anthropic.NotFoundError, match="Cassette has no recorded response"):
+        client.messages.create(model=MODEL, max_tokens=10, messages=[{"role": "user", "content": "?"}])
+
+
+def test_retryable_responses_are_not_recorded(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    responses = iter([httpx.Response(529, json={"type": "error", "error": {"type": "overloaded_error", "message": ""}}),
+                      httpx.Response(200, json=_message([{"type": "text", "text": "ok"}], "end_turn"))])
+    cassette = Cassette(path, "record")
+    with httpx.Client(transport=CassetteTransport(cassette, httpx.MockTransport(lambda request: next(responses)))) as client:
+        assert client.post("https://api.test/v1/messages", content=b"{}").status_code == 529
+        assert client.post("https://api.test/v1/messages", content=b"{}").status_code == 200
+
+    [entry] = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert entry["status"] == 200
+    # Одинаковые запросы: после записанных ответов повторяется последний
+    replay = Cassette(path, "replay", latency_scale=0)
+    with httpx.Client(transport=CassetteTransport(replay)) as client:
+        assert [client.post("https://api.test/v1/messages", content=b"{}").json()["content"][0]["text"]
+                for _ in range(2)] == ["ok", "ok"]
+
+
+def test_async_stream_is_replayed_byte_for_byte(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    body = 'event: content_block_delta\ndata: {"text": "привет"}\n\n'.encode()
+    # Куски режут многобайтовые символы посередине
+    chunks = [body[i:i + 5] for i in range(0, len(body), 5)]
+
+    def stream(request):
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=_Chunks(chunks))
+
+    async def read(cassette, inner=None) -> tuple[bytes, str]:
+        async with httpx.AsyncClient(transport=AsyncCassetteTransport(cassette, inner)) as client:
+            async with client.stream("POST", "https://api.test/v1/messages", content=b'{"stream": true}') as response:
+                return b"".join([chunk async for chunk in response.aiter_raw()]), response.headers["content-type"]
+
+    recorded = asyncio.run(read(Cassette(path, "record"), httpx.MockTransport(stream)))
+    replayed = asyncio.run(read(Cassette(path, "replay", latency_scale=0)))
+    assert recorded == replayed == (body, "text/event-stream")
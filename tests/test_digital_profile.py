@@ -0,0 +1,9 @@
+from CreateDigitalProfile_iterative import profile_message
+
+
+def test_profile_message_keeps_cached_prefix_name_free():
+    first, second = profile_message("Алексей Воронин"), profile_message("Мария Ким")
+    assert first[0] == second[0] and "cache_control" in first[0]
+    assert "Алексей" not in first[0]["text"] and "{name}" not in first[0]["text"]
+    assert "_digital_profile.md" not in first[0]["text"]
+    assert first[1]["text"].endswith("Файл профиля: /memories/Алексей Воронин_digital_profile.md")
@@ -0,0 +1,54 @@
+import sqlite3
+
+from MeetingStore import MeetingStore
+from test_analytics_builder import _write
+
+
+def _store(tmp_path) -> MeetingStore:
+    transcripts = tmp_path / "transcripts"
+    transcripts.mkdir()
+    for meeting_id in range(1, 4):
+        _write(transcripts, meeting_id, meeting_id == 3)
+    return MeetingStore(str(tmp_path / "meetings.sqlite3"), str(transcripts))
+
+
+def _files(store: MeetingStore) -> dict:
+    with sqlite3.connect(store.db_path) as conn:
+        return dict(conn.execute("SELECT meeting_id, file FROM meetings"))
+
+
+def test_renamed_transcript_keeps_its_meeting(tmp_path):
+    store = _store(tmp_path)
+    assert store.sync()["total"] == 3
+
+    (store.transcripts_dir / "meeting_2_Клиент.json").rename(store.transcripts_dir / "meeting_2_renamed.json")
+    assert store.sync() == {"added": 1, "updated": 0, "removed": 1, "failed": 0, "total": 3}
+    assert _files(store)[2] == "meeting_2_renamed.json"
+    assert store.query("SELECT COUNT(*) FROM meeting_managers WHERE meeting_id = 2")[1] == [(1,)]
+
+
+def test_unparsable_transcript_drops_its_meeting_until_fixed(tmp_path):
+    store = _store(tmp_path)
+    store.sync()
+
+    path = store.transcripts_dir / "meeting_1_Клиент.json"
+    path.write_text("{", encoding="utf-8")
+    assert store.sync()["total"] == 2
+    assert 1 not in _files(store)
+
+    _write(store.transcripts_dir, 1, False)
+    assert store.sync() == {"added": 1, "updated": 0, "removed": 0, "failed": 0, "total": 3}
+
+
+def test_removing_a_duplicate_rereads_the_other_file(tmp_path):
+    store = _store(tmp_path)
+    duplicate = store.transcripts_dir / "meeting_2_copy.json"
+    duplicate.write_bytes((store.transcripts_dir / "meeting_2_Клиент.json").read_bytes())
+    store.sync()
+    # Файлы разбираются по порядку имён: строка взята из последнего
+    last = store.transcripts_dir / _files(store)[2]
+    first = duplicate if last != duplicate else store.transcripts_dir / "meeting_2_Клиент.json"
+
+    last.unlink()
+    assert store.sync()["total"] == 3
+    assert _files(store)[2] == first.name
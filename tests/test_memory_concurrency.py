@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+from anthropic.types.beta import BetaMemoryTool20250818CreateCommand, BetaMemoryTool20250818InsertCommand
+
+from MemoryTool import MemoryTool
+from memory_benchmark import stress_concurrent_edits
+
+
+def _create(memory: MemoryTool, path: str, text: str = ""):
+    memory.create(BetaMemoryTool20250818CreateCommand(command="create", path=path, file_text=text))
+
+
+def _insert(memory: MemoryTool, path: str, text: str):
+    memory.insert(BetaMemoryTool20250818InsertCommand(command="insert", path=path, insert_line=0, insert_text=text))
+
+
+def _slow_cold_writes(memory: MemoryTool, delay: float):
+    """Задержка перед обычной транзакцией - окно, в котором параллельный перевод в горячие читал старый текст"""
+    storage = memory.memories_storage
+    update = storage.update
+
+    def slow_update(key, edit):
+        time.sleep(delay)
+        return update(key, edit)
+
+    storage.update = slow_update
+
+
+@pytest.mark.parametrize("delay", [0.0, 0.005])
+def test_no_lost_inserts_across_promotion_threshold(tmp_path, delay):
+    memory = MemoryTool(base_path=str(tmp_path), hot_edit_threshold=2, flush_interval=60)
+    _slow_cold_writes(memory, delay)
+    threads = 4
+    try:
+        for trial in range(30):
+            path = f"/memories/trial_{trial}.txt"
+            _create(memory, path)
+            barrier = threading.Barrier(threads)
+
+            def worker(w):
+                barrier.wait()
+                _insert(memory, path, f"worker-{w}")
+
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(worker, range(threads)))
+            memory.flush()
+            lines = set(memory.memories_storage.read_text(f"trial_{trial}.txt").splitlines())
+            assert {f"worker-{w}" for w in range(threads)} <= lines, f"trial {trial}: {sorted(lines)}"
+    finally:
+        memory.close()
+
+
+@pytest.mark.parametrize("backend", ["filesystem", "sqlite"])
+@pytest.mark.parametrize("hot_edit_threshold", [None, 3, 100])
+def test_stress_concurrent_edits(backend, hot_edit_threshold):
+    # 100 - перевод в горячие посреди параллельных правок (4 потока x 20 x 2 правки)
+    assert stress_concurrent_edits(threads=4, processes=0, edits=20, backend=backend, hot_edit_threshold=hot_edit_threshold)
@@ -0,0 +1,153 @@
+import random
+import time
+
+import pytest
+from anthropic.types.beta import BetaMemoryTool20250818DeleteCommand, BetaMemoryTool20250818StrReplaceCommand
+
+import MemoryDocuments
+from MemoryDocuments import LineRope
+from MemoryTool import MemoryTool
+from query_handler_multithreaded import read_memory_file, write_memory_file
+from test_memory_concurrency import _create, _insert
+
+
+class SmallRope(LineRope):
+    CHUNK = 3
+
+
+def _positions(text: str, needle: str) -> list[int]:
+    positions, start = [], text.find(needle)
+    while start != -1:
+        positions.append(start)
+        start = text.find(needle, start + len(needle))
+    return positions
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_find_matches_str_across_chunk_boundaries(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        rope = SmallRope("".join("".join(rng.choice("ab") for _ in range(rng.randint(0, 5))) + "\n" for _ in range(rng.randint(0, 15))))
+        for _ in range(rng.randint(1, 4)):
+            rope.insert(rng.randint(0, rope.line_count()), "".join(rng.choice("ab\n") for _ in range(rng.randint(1, 5))))
+        text = "".join(rope.lines())
+        for _ in range(5):
+            needle = "".join(rng.choice("ab\n") for _ in range(rng.randint(1, 10)))
+            assert rope.find(needle) == _positions(text, needle)
+            assert rope.find(needle, limit=2) == _positions(text, needle)[:2]
+
+
+def test_single_line_inserts_do_not_fragment_chunks():
+    rope = LineRope("line\n" * 2000)
+    for n in range(2000):
+        rope.insert(1000, f"inserted {n}\n")
+    assert rope.line_count() == 4000
+    assert len(rope._chunks) <= 2 * 4000 // LineRope.CHUNK + 1
+
+
+def test_hot_str_replace_does_not_materialize_text(tmp_path, monkeypatch):
+    memory = MemoryTool(base_path=str(tmp_path), hot_edit_threshold=1, flush_interval=60)
+    try:
+        _create(memory, "/memories/profile.md", "".join(f"line {n}\n" for n in range(3000)))
+        _insert(memory, "/memories/profile.md", "marker")
+        monkeypatch.setattr(LineRope, "text", lambda self: pytest.fail("str_replace materialized the document"))
+        for n in range(3):
+            memory.str_replace(BetaMemoryTool20250818StrReplaceCommand(
+                command="str_replace", path="/memories/profile.md", old_str=f"line {1000 + n}\n", new_str=f"edited {n}\n"))
+        monkeypatch.undo()
+        # Неуникальный old_str - прежнее сообщение с числом вхождений
+        with pytest.raises(ValueError, match="appears 111 times"):
+            memory.str_replace(BetaMemoryTool20250818StrReplaceCommand(
+                command="str_replace", path="/memories/profile.md", old_str="line 29", new_str="x"))
+        memory.flush()
+        content = memory.memories_storage.read_text("profile.md")
+    finally:
+        memory.close()
+    assert content.startswith("marker\nline 0\n")
+    assert "edited 0\nedited 1\nedited 2\nline 1003\n" in content
+
+
+def _delete(memory: MemoryTool, path: str):
+    memory.delete(BetaMemoryTool20250818DeleteCommand(command="delete", path=path))
+
+
+@pytest.mark.parametrize("directory", ["/memories/notes", "/memories"])
+def test_failed_directory_delete_keeps_hot_edits(tmp_path, directory):
+    memory = MemoryTool(base_path=str(tmp_path), hot_edit_threshold=1, flush_interval=60)
+    try:
+        _create(memory, "/memories/notes/profile.md", "base\n")
+        _insert(memory, "/memories/notes/profile.md", "hot edit")
+        assert memory.documents.get("notes/profile.md").dirty
+        with pytest.raises(OSError):
+            _delete(memory, directory)
+        _insert(memory, "/memories/notes/profile.md", "after failed delete")
+    finally:
+        memory.close()
+    assert (tmp_path / "memories" / "notes" / "profile.md").read_text(encoding="utf-8") == \
+        "after failed delete\nhot edit\nbase\n"
+
+
+def test_deleted_hot_file_is_not_written_back(tmp_path):
+    memory = MemoryTool(base_path=str(tmp_path), hot_edit_threshold=1, flush_interval=60)
+    try:
+        _create(memory, "/memories/profile.md", "base\n")
+        _insert(memory, "/memories/profile.md", "hot edit")
+        _delete(memory, "/memories/profile.md")
+        assert memory.documents.get("profile.md") is None
+    finally:
+        memory.close()
+    assert not (tmp_path / "memories" / "profile.md").exists()
+
+
+def test_restored_file_replaces_hot_document(tmp_path):
+    memory = MemoryTool(base_path=str(tmp_path), hot_edit_threshold=1, flush_interval=60)
+    try:
+        _create(memory, "/memories/analysis.txt", "base\n")
+        _insert(memory, "/memories/analysis.txt", "hot edit")
+        write_memory_file(memory, "analysis.txt", "from cache\n")
+        assert read_memory_file(memory, "analysis.txt") == "from cache\n"
+    finally:
+        memory.close()
+    assert (tmp_path / "memories" / "analysis.txt").read_text(encoding="utf-8") == "from cache\n"
+
+
+def test_flush_loop_survives_a_failed_flush(tmp_path, monkeypatch, capsys):
+    memory = MemoryTool(base_path=str(tmp_path), hot_edit_threshold=1, flush_interval=0.02)
+    try:
+        _create(memory, "/memories/profile.md", "base\n")
+        storage = memory.memories_storage
+        update, failures = storage.update, []
+
+        def failing_update(key, edit):
+            if not failures:
+                failures.append(key)
+                raise OSError("disk unavailable")
+            return update(key, edit)
+
+        monkeypatch.setattr(storage, "update", failing_update)
+        _insert(memory, "/memories/profile.md", "hot edit")
+        deadline = time.monotonic() + 5
+        while storage.read_text("profile.md") != "hot edit\nbase\n" and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert failures and storage.read_text("profile.md") == "hot edit\nbase\n"
+        assert memory.documents._flusher.is_alive()
+    finally:
+        memory.close()
+    assert "flush of profile.md failed" in capsys.readouterr().out
+
+
+def test_edit_counts_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(MemoryDocuments, "MAX_EDIT_COUNTS", 5)
+    memory = MemoryTool(base_path=str(tmp_path), hot_edit_threshold=3, flush_interval=60)
+    try:
+        for n in range(20):
+            _create(memory, f"/memories/file_{n}.md")
+            _insert(memory, f"/memories/file_{n}.md", "line")
+        assert len(memory.documents._edit_counts) == 5
+        _insert(memory, "/memories/file_19.md", "line")
+        _insert(memory, "/memories/file_19.md", "line")
+        # Горячему документу счётчик больше не нужен
+        assert memory.documents.get("file_19.md") is not None
+        assert "file_19.md" not in memory.documents._edit_counts
+    finally:
+        memory.close()
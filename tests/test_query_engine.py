@@ -0,0 +1,101 @@
+import pytest
+
+from query_engine import QueryEngine, parse_period
+
+
+def _row(meeting_id, date, success, channel="партнер", manager="Алексей Воронин", task=2, industry="Ритейл"):
+    return {
+        "meeting_id": meeting_id,
+        "file": f"meeting_{meeting_id}_Клиент.json",
+        "meeting_date": date,
+        "meeting_success": "да" if success else "нет",
+        "is_success": int(success),
+        "client_name": "Клиент",
+        "group_activity": None,
+        "index": {
+            "by_sales_manager": manager,
+            "by_acquisition_channel_type": channel,
+            "by_acquisition_channel_name": None,
+            "by_client_status": "покупка" if success else "отказ после первой демо-встречи",
+            "by_industry": industry,
+            "by_year_month": date[:7],
+        },
+        "task": task,
+        "scores": {"rapport_building": 7 if success else 4},
+        "total_score": None,
+        "average_score": None,
+    }
+
+
+@pytest.fixture
+def engine():
+    return QueryEngine([
+        _row(1, "2025-05-10", True),
+        _row(2, "2025-05-20", False, channel="конференция"),
+        _row(3, "2025-10-01", True, channel="конференция"),
+        _row(4, "2025-11-15", False, task=1),
+    ])
+
+
+@pytest.mark.parametrize("question", [
+    "Какая самая высокая конверсия по каналам?",
+    "Как работает смарт-ассистент для менеджеров?",
+    "Какая конверсия у самых активных менеджеров?",
+    "Влияет ли смартфон клиента на встречу?",
+])
+def test_no_period_when_month_is_only_a_substring(question):
+    assert parse_period(question, [2025]) is None
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("Конверсия в мае 2025", [("2025-05-01", "2025-05-31")]),
+    ("Встречи за ноябрь", [("2025-11-01", "2025-11-30")]),
+    ("Что было 15 марта 2025?", [("2025-03-15", "2025-03-15")]),
+    ("Встречи после 15.10.2025", [("2025-10-16", "9999-12-31")]),
+    ("Встречи с 2025-10-01 по 2025-10-31", [("2025-10-01", "2025-10-31")]),
+    ("Итоги Q4 2025", [("2025-10-01", "2025-12-31")]),
+    ("Итоги за 2025 год", [("2025-01-01", "2025-12-31")]),
+])
+def test_parse_period(question, expected):
+    assert parse_period(question, [2025]) == expected
+
+
+@pytest.mark.parametrize("question, expected", [
+    # Несуществующий день пропускается, остаётся месяц
+    ("Конверсия на 31 февраля 2025", [("2025-02-01", "2025-02-28")]),
+    ("Встречи 2025-13-01", None),
+    ("Встречи после 31.04.2025", None),
+    ("Встречи с 31.04.2025 по 2025-05-10", [("0000-01-01", "2025-05-10")]),
+])
+def test_parse_period_skips_impossible_dates(question, expected):
+    assert parse_period(question, [2025]) == expected
+
+
+def test_impossible_date_does_not_fail_the_answer(engine):
+    engine.answer("Какая конверсия по каналам после 31.04.2025?")
+
+
+def test_month_substring_does_not_filter_local_answer(engine):
+    result = engine.answer("Какая самая высокая конверсия по каналам?")
+    assert result is not None
+    assert result["meetings"] == 4
+    assert "Период" not in result["text"]
+
+
+def test_month_filter_and_grouping(engine):
+    result = engine.answer("Какая конверсия по каналам в мае 2025?")
+    assert result["intent"] == "conversion"
+    assert result["meetings"] == 2
+    assert "партнер | 1 | 1 | 100.0" in result["text"]
+    assert "конференция | 1 | 0 | 0.0" in result["text"]
+
+
+def test_task_filter(engine):
+    filters = engine.filters("конверсия клиентов без задачи")
+    assert filters["client_task_classification"] == {"without_task"}
+    # "(с задачей/без)" - группировка по типу задачи, а не фильтр
+    assert "client_task_classification" not in engine.filters("тип клиента (с задачей/без)")
+
+
+def test_qualitative_question_goes_to_model(engine):
+    assert engine.answer("Почему встречи в мае провалились?") is None
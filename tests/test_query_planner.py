@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+from query_engine import QueryEngine
+from query_handler_multithreaded import question_message
+from query_planner import MAX_MEETINGS, PRELOAD_INSTRUCTIONS, QueryPlanner
+from test_query_engine import _row
+
+
+def test_planned_message_keeps_analysis_file():
+    message = question_message(2, "Какие критерии выше у успешных встреч?", {"context": "## Предзагруженные данные"})
+    assert message.startswith("## Предзагруженные данные")
+    assert PRELOAD_INSTRUCTIONS in message
+    assert "`demo2pilots_analysis_Q3.txt`" in message
+    assert "progress_Q3.txt" in message
+
+
+def test_plain_message_keeps_analysis_file():
+    message = question_message(0, "Почему встречи провалились?")
+    assert PRELOAD_INSTRUCTIONS not in message
+    assert "`demo2pilots_analysis_Q1.txt`" in message
+
+
+def _planner(tmp_path, rows, **kwargs):
+    engine = QueryEngine(rows)
+    return QueryPlanner(engine, SimpleNamespace(transcripts_dir=tmp_path), **kwargs)
+
+
+def _rows(count):
+    return [_row(i, f"2025-{5 + i % 2:02d}-{1 + i % 28:02d}", i % 3 == 0, channel="партнер" if i % 4 else "конференция")
+            for i in range(1, count + 1)]
+
+
+def test_plan_needs_a_narrowing_filter(tmp_path):
+    planner = _planner(tmp_path, _rows(8))
+    assert planner.plan("Какие критерии выше у успешных встреч?") is not None
+    assert planner.plan("Какая конверсия по каналам?") is None
+    # Фильтр по году совпадает со всей базой - предзагрузка ничего не сужает
+    assert planner.plan("Какая конверсия за 2025 год?") is None
+
+
+def test_plan_cap_below_base_size(tmp_path):
+    assert MAX_MEETINGS < 90
+    planner = _planner(tmp_path, _rows(90))
+    assert planner.plan("Встречи за май") is None
+    plan = planner.plan("Какие оценки у успешных встреч в мае?")
+    assert plan is not None and len(plan["meetings"]) <= MAX_MEETINGS
+    assert "Встреч в выборке" in plan["context"] and planner.planned == 1
@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from RateLimiter import AsyncRateLimitedTransport, RateLimitedTransport, RateLimiter
+
+EVENTS = [
+    ("message_start", {"type": "message_start", "message": {"usage": {
+        "input_tokens": 1000, "cache_creation_input_tokens": 200, "output_tokens": 1}}}),
+    ("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "привет"}}),
+    ("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": 300}}),
+    ("message_stop", {"type": "message_stop"}),
+]
+
+
+def _sse() -> list[bytes]:
+    body = "".join(f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n" for name, data in EVENTS).encode()
+    # Куски режут события и многобайтовые символы посередине
+    return [body[i:i + 7] for i in range(0, len(body), 7)]
+
+
+class _Stream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    def __iter__(self):
+        yield from _sse()
+
+    async def __aiter__(self):
+        for chunk in _sse():
+            yield chunk
+
+
+def _handler(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=_Stream())
+
+
+@pytest.fixture
+def limiter():
+    return RateLimiter(requests_per_minute=600, input_tokens_per_minute=100_000, output_tokens_per_minute=10_000)
+
+
+def _tokens(limiter: RateLimiter, bucket: str) -> float:
+    return limiter.buckets[bucket].tokens
+
+
+def test_stream_holds_slot_until_read(limiter):
+    with httpx.Client(transport=RateLimitedTransport(limiter, httpx.MockTransport(_handler))) as client:
+        with client.stream("POST", "https://api.test/v1/messages", content=b"x" * 400) as response:
+            assert limiter.in_flight == 1
+            text = "".join(response.iter_text())
+            assert limiter.in_flight == 0
+    assert "привет" in text
+    # Списаны фактические входные токены (вход + запись кэша) и итоговые выходные из message_delta
+    assert _tokens(limiter, "input_tokens") == pytest.approx(100_000 - 1200, abs=5)
+    assert _tokens(limiter, "output_tokens") == pytest.approx(10_000 - 300, abs=5)
+    assert limiter.stats()["requests"] == 1
+
+
+def test_closed_stream_releases_slot_once(limiter):
+    with httpx.Client(transport=RateLimitedTransport(limiter, httpx.MockTransport(_handler))) as client:
+        with client.stream("POST", "https://api.test/v1/messages", content=b"{}"):
+            assert limiter.in_flight == 1
+    assert limiter.in_flight == 0
+
+
+def test_async_stream_holds_slot_until_read(limiter):
+    async def run():
+        transport = AsyncRateLimitedTransport(limiter, httpx.MockTransport(_handler))
+        async with httpx.AsyncClient(transport=transport) as client:
+            async with client.stream("POST", "https://api.test/v1/messages", content=b"{}") as response:
+                assert limiter.in_flight == 1
+                await response.aread()
+                assert limiter.in_flight == 0
+
+    asyncio.run(run())
+    assert limiter.in_flight == 0
+    assert _tokens(limiter, "output_tokens") == pytest.approx(10_000 - 300, abs=5)
@@ -0,0 +1,32 @@
+from pathlib import Path
+import threading
+import math
+import json
+import time
+
+# Грубая оценка без токенайзера: латиница/цифры/пунктуация ~4 символа на токен,
+# кириллица и прочие не-ASCII символы ~2.5 символа на токен
+ASCII_CHARS_PER_TOKEN = 4.0
+OTHER_CHARS_PER_TOKEN = 2.5
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов текста (для бюджетов и логов, не для биллинга)"""
+    chars = len(text)
+    # Кириллица занимает 2 байта в UTF-8, поэтому разница длин ~ число не-ASCII символов
+    other = min(chars, len(text.encode("utf-8")) - chars)
+    return math.ceil((chars - other) / ASCII_CHARS_PER_TOKEN + other / OTHER_CHARS_PER_TOKEN)
+
+
+class TokenLog:
+    """Пишет по строке JSON на каждый вызов инструмента (JSONL) для подбора бюджетов"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def write(self, **record):
+        line = json.dumps({"ts": round(time.time(), 3), **record}, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
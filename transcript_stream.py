@@ -0,0 +1,195 @@
+"""
+Потоковое чтение нужных разделов JSON-транскрипта без разбора диалога.
+
+Верхнеуровневый объект сканируется по кускам: ненужные значения пропускаются по скобкам
+без построения объектов, нужные - декодируются по точным границам (orjson, если установлен).
+Чтение останавливается, как только найдены все запрошенные разделы; в транскриптах они идут
+до "transcript", поэтому с диска читается только начало файла.
+"""
+from pathlib import Path
+import json
+import re
+import time
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+    BACKEND = "orjson"
+except ImportError:
+    _loads = json.loads
+    BACKEND = "json"
+
+# Разделы, которых достаточно для агрегатов (meeting_records.meeting_record)
+SECTIONS = ("metadata", "criteria", "overall_summary")
+
+CHUNK_SIZE = 16 * 1024
+
+_WHITESPACE = re.compile(rb"[ \t\r\n]*")
+# Остаток строки после открывающей кавычки (развёрнутый цикл, без отката на длинных строках)
+_STRING_REST = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+# Всё до следующей скобки, включая целые строки; на незакрытой строке останавливается перед кавычкой
+_SKIP = re.compile(rb'(?:[^"{}\[\]]++|"[^"\\]*+(?:\\.[^"\\]*+)*+")*+')
+_PRIMITIVE = re.compile(rb"[^,}\]\s]+")
+
+
+class _SectionScanner:
+    """Возобновляемый разбор верхнего уровня объекта: feed() по кускам, found - декодированные разделы"""
+
+    def __init__(self, wanted):
+        self.wanted = set(wanted)
+        self.found = {}
+        self.buf = b""
+        self.pos = 0
+        self.state = "start"
+        self.key = None
+        self.depth = 0
+        self.value_start = None
+
+    def feed(self, chunk: bytes) -> bool:
+        """Добавляет кусок; True, когда все разделы найдены или объект закончился"""
+        # Прочитанное отбрасывается, кроме начала декодируемого значения
+        keep = self.pos if self.value_start is None else self.value_start
+        self.buf = self.buf[keep:] + chunk
+        self.pos -= keep
+        if self.value_start is not None:
+            self.value_start -= keep
+
+        while True:
+            done = self._step()
+            if done is None:
+                return False
+            if done:
+                return True
+
+    def _error(self, message: str):
+        raise json.JSONDecodeError(message, self.buf[self.pos:self.pos + 40].decode("utf-8", "replace"), 0)
+
+    def _step(self) -> bool | None:
+        if self.state != "value":
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+        if self.pos >= len(self.buf):
+            return None
+        char = self.buf[self.pos:self.pos + 1]
+
+        if self.state == "start":
+            if char != b"{":
+                self._error("Expected a JSON object")
+            self.pos += 1
+            self.state = "key"
+        elif self.state == "key":
+            if char == b"}":
+                return True
+            if char != b'"':
+                self._error("Expected an object key")
+            match = _STRING_REST.match(self.buf, self.pos + 1)
+            if match is None:
+                return None
+            self.key = json.loads(self.buf[self.pos:match.end()])
+            self.pos = match.end()
+            self.state = "colon"
+        elif self.state == "colon":
+            if char != b":":
+                self._error("Expected ':' after an object key")
+            self.pos += 1
+            self.state = "value_start"
+        elif self.state == "value_start":
+            # Пробелы перед значением уже пропущены, даже если они были на границе кусков
+            self.state, self.depth = "value", 0
+            self.value_start = self.pos if self.key in self.wanted else None
+        elif self.state == "value":
+            end = self._skip_value()
+            if end is None:
+                return None
+            if self.value_start is not None:
+                self.found[self.key] = _loads(self.buf[self.value_start:end])
+                self.value_start = None
+            self.pos = end
+            self.state = "next"
+            if self.wanted <= self.found.keys():
+                return True
+        elif self.state == "next":
+            if char == b"}":
+                return True
+            if char != b",":
+                self._error("Expected ',' or '}' after a value")
+            self.pos += 1
+            self.state = "key"
+        return False
+
+    def _skip_value(self) -> int | None:
+        """Конец текущего значения или None, если нужен следующий кусок (позиция и глубина сохраняются)"""
+        buf = self.buf
+        if self.depth == 0:
+            char = buf[self.pos:self.pos + 1]
+            if char == b'"':
+                match = _STRING_REST.match(buf, self.pos + 1)
+                return match.end() if match else None
+            if char not in (b"{", b"["):
+                match = _PRIMITIVE.match(buf, self.pos)
+                # Примитив верхнего уровня всегда заканчивается разделителем
+                return match.end() if match and match.end() < len(buf) else None
+
+        while True:
+            self.pos = _SKIP.match(buf, self.pos).end()
+            char = buf[self.pos:self.pos + 1]
+            if char in (b"", b'"'):
+                return None
+            self.depth += 1 if char in (b"{", b"[") else -1
+            self.pos += 1
+            if self.depth == 0:
+                return self.pos
+
+
+def extract_sections(path: str | Path, keys=SECTIONS, hasher=None, chunk_size: int = CHUNK_SIZE) -> tuple[dict, int]:
+    """
+    Разделы keys верхнего уровня JSON-файла и число прочитанных байт.
+
+    hasher (например, hashlib.sha256()) получает весь файл: после нахождения разделов
+    остаток дочитывается только для хэша, без разбора. Отсутствующие разделы в результат не попадают.
+    """
+    scanner = _SectionScanner(keys)
+    bytes_read = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            bytes_read += len(chunk)
+            if hasher is not None:
+                hasher.update(chunk)
+            if not chunk:
+                # Корректный объект завершается "}" раньше, чем кончается файл
+                raise json.JSONDecodeError("Unexpected end of JSON", str(path), bytes_read)
+            if scanner.feed(chunk):
+                break
+
+        if hasher is not None:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                bytes_read += len(chunk)
+                hasher.update(chunk)
+    return scanner.found, bytes_read
+
+
+def measure_directory(transcripts_dir: str = "./memory/transcripts", keys=SECTIONS) -> dict:
+    """Пропускная способность извлечения разделов по всем *.json каталога (MB/s от размера файлов)"""
+    files = sorted(Path(transcripts_dir).glob("*.json"))
+    total_bytes = sum(path.stat().st_size for path in files)
+    start = time.perf_counter()
+    bytes_read = 0
+    for path in files:
+        bytes_read += extract_sections(path, keys)[1]
+    seconds = time.perf_counter() - start
+    return {
+        "files": len(files),
+        "total_mb": total_bytes / 1e6,
+        "read_mb": bytes_read / 1e6,
+        "seconds": seconds,
+        "mb_per_s": total_bytes / 1e6 / seconds if seconds else 0.0,
+        "backend": BACKEND,
+    }
+
+
+if __name__ == "__main__":
+    report = measure_directory()
+    print(f"📥 {report['files']} транскриптов, {report['total_mb']:.1f} MB "
+          f"(прочитано {report['read_mb']:.1f} MB, {BACKEND}): "
+          f"{report['seconds']:.3f}s, {report['mb_per_s']:.0f} MB/s")